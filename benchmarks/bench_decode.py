@@ -0,0 +1,66 @@
+"""Images per second of each ImageDecoder backend on CPU, decoding
+synthetic chemical-structure-like line art (black lines on white)::
+
+    python benchmarks/bench_decode.py --count 200 --image-size 1000 --size 300
+"""
+import time
+import argparse
+import numpy as np
+import cv2
+from mxnet.gluon.data.vision import transforms
+from deep_abyasa import ImageDecoder
+
+
+def line_art(rng, size):
+    """PNG bytes of a white image with a few dozen black bonds and rings"""
+    image = np.full((size, size, 3), 255, dtype=np.uint8)
+    for _ in range(40):
+        p, q = rng.integers(0, size, 2), rng.integers(0, size, 2)
+        cv2.line(image, tuple(int(v) for v in p), tuple(int(v) for v in q), (0, 0, 0), 3)
+    for _ in range(5):
+        cv2.circle(image, tuple(int(v) for v in rng.integers(0, size, 2)), size // 20, (0, 0, 0), 3)
+    return cv2.imencode('.png', image)[1].tobytes()
+
+
+def rate(decode, images, transform):
+    transform(decode(images[0])).wait_to_read()
+    started = time.perf_counter()
+    for image in images:
+        transform(decode(image)).wait_to_read()
+    return len(images) / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--count', type=int, default=200)
+    parser.add_argument('--image-size', type=int, default=1000)
+    parser.add_argument('--size', type=int, default=300, help='decode time resize')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    images = [line_art(rng, args.image_size) for _ in range(args.count)]
+    size = (args.size, args.size)
+    settings = [(backend, None, 3, None) for backend in ImageDecoder.BACKENDS] + \
+               [(backend, size, channels, threshold) for backend in ImageDecoder.BACKENDS
+                for channels, threshold in ((3, None), (1, None), (1, 127))]
+
+    to_tensor = transforms.ToTensor()
+    resize_to_tensor = transforms.Compose([transforms.Resize(args.size), transforms.ToTensor()])
+
+    print(f'{args.count} PNG images of {args.image_size}x{args.image_size}\n')
+    print('| backend | size | channels | threshold | decode images/s | decode + ToTensor images/s |')
+    print('|---------|------|----------|-----------|-----------------|----------------------------|')
+    baseline = ImageDecoder()
+    print(f'| mxnet, then Resize({args.size}) | full | 3 | None | | '
+          f'{rate(baseline.decode, images, resize_to_tensor):.0f} |')
+    for backend, resize, channels, threshold in settings:
+        decoder = ImageDecoder(backend, resize, channels, threshold)
+        decode_rate = rate(decoder.decode, images, lambda image: image)
+        transform = to_tensor if resize is not None else resize_to_tensor
+        total_rate = rate(decoder.decode, images, transform)
+        resize = 'full' if resize is None else f'{resize[0]}x{resize[1]}'
+        print(f'| {backend} | {resize} | {channels} | {threshold} | {decode_rate:.0f} | {total_rate:.0f} |')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""Compares label extraction of Encode_Labels with the previous
+np.hstack based implementation on a synthetic index::
+
+    python benchmarks/bench_label_extraction.py --rows 10000000
+"""
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from deep_abyasa import Encode_Labels
+
+
+def hstack_arraylike(labels):
+    return list(set(np.hstack(labels)))
+
+
+def hstack_delimited(labels, delimiter):
+    return hstack_arraylike([list(map(lambda a: a.strip(), l.split(delimiter))) for l in labels])
+
+
+def timed(name, func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    print(f'{name:<40}{time.perf_counter() - started:>10.2f} s')
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10_000_000)
+    parser.add_argument('--labels', type=int, default=118)
+    parser.add_argument('--max-per-row', type=int, default=6)
+    parser.add_argument('--skip-hstack', action='store_true',
+                        help="don't run the np.hstack versions, e.g. when they don't fit in memory")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vocab = np.array([f'label_{i}' for i in range(args.labels)], dtype=object)
+    sizes = rng.integers(1, args.max_per_row + 1, args.rows)
+    codes = rng.integers(0, args.labels, sizes.sum())
+    offsets = np.concatenate([[0], np.cumsum(sizes)])
+    arraylike = pd.Series([vocab[codes[offsets[i]:offsets[i + 1]]].tolist() for i in range(args.rows)])
+    print(f'{args.rows} rows, {args.labels} labels, {sizes.sum()} label occurrences')
+
+    new = timed('array like, set update', Encode_Labels.extract_multi_labels_from_arraylike_cols, arraylike)
+    if not args.skip_hstack:
+        old = timed('array like, np.hstack', hstack_arraylike, arraylike)
+        assert(sorted(old) == sorted(new))
+    _, ltoi = Encode_Labels.generate_itol_ltoi(new)
+    timed('label_statistics', Encode_Labels.label_statistics, arraylike, ltoi)
+
+    delimited = arraylike.str.join('; ')
+    del arraylike
+    new = timed('delimited, set update', Encode_Labels.extract_multi_labels_from_delimited_cols, delimited, ';')
+    if not args.skip_hstack:
+        old = timed('delimited, split + np.hstack', hstack_delimited, delimited, ';')
+        assert(sorted(old) == sorted(new))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,58 @@
+"""Public classes are imported lazily on first attribute access, so that
+``import deep_abyasa`` stays cheap and e.g. preprocessing jobs using only
+Download or Encode_Labels don't load mxnet or gluoncv.
+"""
+import importlib
+
 name = 'deep_abyasa'
 
-from deep_abyasa.preprocess.download import Download
-from deep_abyasa.helpers.utils import Utils
-from deep_abyasa.helpers.custom_exceptions import CustomException
-from deep_abyasa.preprocess.encode_labels import Encode_Labels
-from deep_abyasa.datasets.cv import JsonIndexMultiLabelDataset
-from deep_abyasa.metrics.accuracy import AccuracyMultiLabel
-from deep_abyasa.helpers.training import TrainingHelpers
+_MODULES = {
+    'Download': 'deep_abyasa.preprocess.download',
+    'Utils': 'deep_abyasa.helpers.utils',
+    'CustomException': 'deep_abyasa.helpers.custom_exceptions',
+    'Encode_Labels': 'deep_abyasa.preprocess.encode_labels',
+    'ColumnarIndex': 'deep_abyasa.datasets.index',
+    'ImageDecoder': 'deep_abyasa.datasets.decode',
+    'DecodedImageCache': 'deep_abyasa.datasets.cache',
+    'SharedLRUImageCache': 'deep_abyasa.datasets.cache',
+    'RecordShards': 'deep_abyasa.preprocess.records',
+    'ShardWriter': 'deep_abyasa.preprocess.records',
+    'JsonIndexMultiLabelDataset': 'deep_abyasa.datasets.cv',
+    'RecordShardMultiLabelDataset': 'deep_abyasa.datasets.cv',
+    'BulkBatchSampler': 'deep_abyasa.datasets.bulk',
+    'BulkDataset': 'deep_abyasa.datasets.bulk',
+    'StreamingMultiLabelDataset': 'deep_abyasa.datasets.stream',
+    'StreamingLoader': 'deep_abyasa.datasets.stream',
+    'AccuracyMultiLabel': 'deep_abyasa.metrics.accuracy',
+    'MultiLabelMetrics': 'deep_abyasa.metrics.multilabel',
+    'PrefetchFeeder': 'deep_abyasa.helpers.feeder',
+    'MixedPrecision': 'deep_abyasa.helpers.precision',
+    'DynamicLossScaler': 'deep_abyasa.helpers.precision',
+    'BatchCompose': 'deep_abyasa.helpers.augment',
+    'BatchToTensor': 'deep_abyasa.helpers.augment',
+    'BatchNormalize': 'deep_abyasa.helpers.augment',
+    'BatchRandomBrightness': 'deep_abyasa.helpers.augment',
+    'BatchRandomContrast': 'deep_abyasa.helpers.augment',
+    'BatchRandomSaturation': 'deep_abyasa.helpers.augment',
+    'BatchRandomHue': 'deep_abyasa.helpers.augment',
+    'BatchRandomColorJitter': 'deep_abyasa.helpers.augment',
+    'BatchPredictor': 'deep_abyasa.helpers.inference',
+    'TrainingHelpers': 'deep_abyasa.helpers.training',
+    'ModelRegistry': 'deep_abyasa.helpers.registry',
+    'MicroBatchServer': 'deep_abyasa.helpers.serving',
+    'ModelExport': 'deep_abyasa.helpers.export',
+}
+
+__all__ = list(_MODULES)
+
+
+def __getattr__(attr):
+    if attr not in _MODULES:
+        raise AttributeError(f"module '{__name__}' has no attribute '{attr}'")
+    value = getattr(importlib.import_module(_MODULES[attr]), attr)
+    globals()[attr] = value
+    return value
+
 
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
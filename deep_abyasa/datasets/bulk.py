@@ -0,0 +1,81 @@
+import mxnet as mx
+from mxnet.gluon.data import Dataset, Sampler, BatchSampler, RandomSampler, SequentialSampler, DataLoader
+
+
+class BulkBatchSampler(Sampler):
+    """Batch sampler that hands a whole batch of indices to the dataset as a
+       single item. mxnet DataLoader then calls dataset[batch] once per batch
+       instead of once per sample.
+
+       Args:
+            sampler: The source Sampler
+
+            batch_size: Size of mini-batch
+
+            last_batch: 'keep', 'discard' or 'rollover'. See
+                mxnet.gluon.data.BatchSampler
+
+    """
+    def __init__(self, sampler, batch_size, last_batch='keep'):
+        self._batch_sampler = BatchSampler(sampler, batch_size, last_batch)
+
+    def __iter__(self):
+        for batch in self._batch_sampler:
+            yield [batch]
+
+    def __len__(self):
+        return len(self._batch_sampler)
+
+
+class BulkDataset(Dataset):
+    """View over a dataset that implements __getitems__, such as
+       JsonIndexMultiLabelDataset, whose items are whole batches. Use it
+       through BulkDataset.loader, which wires BulkBatchSampler and
+       BulkDataset.batchify into an mxnet DataLoader.
+
+       Args:
+            dataset: Dataset with a __getitems__(indices, ctx) method
+
+            ctx: Context batches are allocated in. Default is mx.cpu()
+
+    """
+    def __init__(self, dataset, ctx=None):
+        self._dataset = dataset
+        self._ctx = ctx
+
+    def __getitem__(self, indices):
+        return self._dataset.__getitems__(indices, ctx=self._ctx)
+
+    def __len__(self):
+        return len(self._dataset)
+
+    @staticmethod
+    def batchify(items):
+        """batchify_fn for BulkBatchSampler batches. The single item is
+           already a full batch, so it is returned as is.
+        """
+        return items[0]
+
+    def loader(self, batch_size, shuffle=False, last_batch='keep', num_workers=0):
+        """Creates an mxnet DataLoader that fetches whole batches through
+           the dataset's __getitems__.
+
+        Args:
+            batch_size: Size of mini-batch
+
+            shuffle: Whether to shuffle the samples
+
+            last_batch: 'keep', 'discard' or 'rollover'
+
+            num_workers: Number of worker processes. When more than 0,
+                batches are allocated in shared memory so that they can
+                be handed back to the main process without a copy
+
+        Returns:
+            mxnet DataLoader
+
+        """
+        sampler = RandomSampler(len(self)) if shuffle else SequentialSampler(len(self))
+        view = BulkDataset(self._dataset, mx.Context('cpu_shared', 0)) if num_workers > 0 else self
+        return DataLoader(view, batch_sampler=BulkBatchSampler(sampler, batch_size, last_batch),
+                          batchify_fn=BulkDataset.batchify, num_workers=num_workers)
@@ -0,0 +1,240 @@
+import os
+import json
+import hashlib
+import weakref
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+from deep_abyasa.helpers.custom_exceptions import CustomException
+
+
+class DecodedImageCache:
+    """Disk cache of decoded images backed by a fixed shape uint8 np.memmap.
+       Each image is decoded once, written to its slot and read back zero
+       copy in later epochs and by other worker processes. A parallel flags
+       memmap marks which slots are filled.
+
+       The files are named after a key, see DecodedImageCache.make_key.
+       A cache built with different settings has a different key, so it is
+       never read in place of this one.
+
+       Args:
+            cache_dir: Directory to keep the cache files in. Should be on
+                local disk
+
+            key: Cache key
+
+            num_items: Number of images in the dataset
+
+            shape: (height, width, channels) of every cached image
+
+    """
+    def __init__(self, cache_dir, key, num_items, shape):
+        self.cache_dir = cache_dir
+        self.key = key
+        self.num_items = num_items
+        self.shape = tuple(shape)
+        self.images_path = os.path.join(cache_dir, f'{key}.images.u8')
+        self.flags_path = os.path.join(cache_dir, f'{key}.flags.u8')
+        self._images = None
+        self._flags = None
+        self.create()
+
+    @staticmethod
+    def make_key(**settings):
+        """Builds a cache key from everything that determines the cached
+           pixels, e.g. the index file hash, image path and resize shape.
+        """
+        return hashlib.sha256(json.dumps(settings, sort_keys=True).encode('utf-8')).hexdigest()[:24]
+
+    def create(self):
+        """Creates the cache files if they don't exist yet. The flags file
+           is written last, so its presence marks a complete allocation.
+        """
+        if os.path.isfile(self.flags_path):
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        np.memmap(self.images_path, dtype=np.uint8, mode='w+', shape=(self.num_items,) + self.shape).flush()
+        np.memmap(self.flags_path, dtype=np.uint8, mode='w+', shape=(self.num_items,)).flush()
+
+    def open(self):
+        """Maps the cache files. Called lazily so each process maps them itself"""
+        if self._flags is None:
+            self._images = np.memmap(self.images_path, dtype=np.uint8, mode='r+',
+                                     shape=(self.num_items,) + self.shape)
+            self._flags = np.memmap(self.flags_path, dtype=np.uint8, mode='r+', shape=(self.num_items,))
+
+    def get(self, idx):
+        """Returns the cached image of item idx as a view on the memmap,
+           or None if it has not been cached yet.
+        """
+        self.open()
+        if self._flags[idx]:
+            return self._images[idx]
+        return None
+
+    def put(self, idx, image):
+        """Caches image (uint8 array of self.shape) for item idx"""
+        self.open()
+        self._images[idx] = image
+        self._flags[idx] = 1
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_images'] = None
+        state['_flags'] = None
+        return state
+
+    def __len__(self):
+        self.open()
+        return int(self._flags.sum())
+
+
+class SharedLRUImageCache:
+    """In memory cache of decoded images with a byte size limit and least
+       recently used eviction. Everything, including the bookkeeping, lives
+       in one multiprocessing.shared_memory block guarded by a lock, so
+       DataLoader worker processes forked after it is created all hit the
+       same entries.
+
+       Memory is split into capacity_bytes // max_item_bytes equal slots.
+       Images larger than max_item_bytes are not cached.
+
+       The process that creates the cache owns the shared block. It is
+       freed when that process calls unlink, when the cache is garbage
+       collected there, or when that process exits. Workers, forked or
+       unpickled, only detach from it.
+
+       Args:
+            capacity_bytes: Bytes available for cached images
+
+            num_items: Number of images in the dataset
+
+            max_item_bytes: Size of the largest image to cache, e.g.
+                300 * 300 * 3 for 300x300 RGB images
+
+    """
+    COUNTERS = ('hits', 'misses', 'evictions', 'clock')
+
+    def __init__(self, capacity_bytes, num_items, max_item_bytes):
+        self.slot_bytes = int(max_item_bytes)
+        self.num_slots = int(capacity_bytes // max_item_bytes)
+        self.num_items = num_items
+        if self.num_slots < 1:
+            print(f'capacity_bytes {capacity_bytes} cannot hold an item of {max_item_bytes} bytes')
+            raise CustomException
+        self._layout = self.layout(self.num_slots, self.slot_bytes, num_items)
+        size = sum(np.dtype(dtype).itemsize * int(np.prod(shape)) for dtype, shape in self._layout.values())
+        self._shm = shared_memory.SharedMemory(create=True, size=size)
+        self._finalizer = weakref.finalize(self, SharedLRUImageCache.release, self._shm, os.getpid())
+        self._lock = multiprocessing.Lock()
+        self._arrays = None
+        self.arrays()['slot_item'][:] = -1
+        self.arrays()['item_slot'][:] = -1
+
+    @staticmethod
+    def layout(num_slots, slot_bytes, num_items):
+        """dtype and shape of each array in the shared block, in order"""
+        return {'data': (np.uint8, (num_slots, slot_bytes)),
+                'slot_item': (np.int64, (num_slots,)),
+                'slot_tick': (np.int64, (num_slots,)),
+                'slot_shape': (np.int64, (num_slots, 3)),
+                'item_slot': (np.int64, (num_items,)),
+                'counters': (np.int64, (len(SharedLRUImageCache.COUNTERS),))}
+
+    def arrays(self):
+        """Numpy views on the shared block"""
+        if self._arrays is None:
+            self._arrays, offset = {}, 0
+            for name, (dtype, shape) in self._layout.items():
+                count = int(np.prod(shape))
+                self._arrays[name] = np.ndarray(shape, dtype=dtype, buffer=self._shm.buf, offset=offset)
+                offset += np.dtype(dtype).itemsize * count
+        return self._arrays
+
+    def increment(self, name):
+        """Increments a shared counter and returns its new value"""
+        counters = self.arrays()['counters']
+        counters[self.COUNTERS.index(name)] += 1
+        return counters[self.COUNTERS.index(name)]
+
+    def get(self, idx):
+        """Returns a copy of the cached image of item idx, or None"""
+        a = self.arrays()
+        with self._lock:
+            slot = a['item_slot'][idx]
+            if slot < 0:
+                self.increment('misses')
+                return None
+            self.increment('hits')
+            a['slot_tick'][slot] = self.increment('clock')
+            shape = tuple(a['slot_shape'][slot])
+            return a['data'][slot, :int(np.prod(shape))].reshape(shape).copy()
+
+    def put(self, idx, image):
+        """Caches image (uint8 array of up to 3 dims) for item idx, evicting
+           the least recently used entry if the cache is full.
+
+        Returns:
+            True if the image was cached
+
+        """
+        if image.nbytes > self.slot_bytes or image.ndim > 3:
+            return False
+        a = self.arrays()
+        with self._lock:
+            if a['item_slot'][idx] >= 0:
+                return True
+            free = np.flatnonzero(a['slot_item'] < 0)
+            if len(free):
+                slot = free[0]
+            else:
+                slot = int(np.argmin(a['slot_tick']))
+                a['item_slot'][a['slot_item'][slot]] = -1
+                self.increment('evictions')
+            a['data'][slot, :image.nbytes] = image.reshape(-1)
+            a['slot_shape'][slot] = (image.shape + (1, 1, 1))[:3]
+            a['slot_item'][slot] = idx
+            a['item_slot'][idx] = slot
+            a['slot_tick'][slot] = self.increment('clock')
+        return True
+
+    def stats(self):
+        """Returns hit, miss and eviction counters along with the number of
+           entries and bytes in use, to help size the cache.
+        """
+        a = self.arrays()
+        with self._lock:
+            counters = dict(zip(self.COUNTERS, a['counters'].tolist()))
+            used = a['slot_item'] >= 0
+            bytes_used = int(np.prod(a['slot_shape'][used], axis=1).sum())
+        return {'hits': counters['hits'], 'misses': counters['misses'],
+                'evictions': counters['evictions'], 'entries': int(used.sum()),
+                'bytes_used': bytes_used, 'capacity_bytes': self.num_slots * self.slot_bytes}
+
+    def close(self):
+        """Detaches this process from the shared block"""
+        self._arrays = None
+        self._shm.close()
+
+    def unlink(self):
+        """Frees the shared block when no worker uses it anymore. Does
+           nothing outside the process that created the cache.
+        """
+        self._arrays = None
+        if self._finalizer is not None:
+            self._finalizer()
+
+    @staticmethod
+    def release(shm, pid):
+        """Unlinks and closes shm if called in the process pid that
+           created it"""
+        if os.getpid() == pid:
+            shm.unlink()
+            shm.close()
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_arrays'] = None
+        state['_finalizer'] = None
+        return state
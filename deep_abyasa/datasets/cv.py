@@ -1,9 +1,15 @@
 import os
+import numpy as np
 import pandas as pd
 import mxnet as mx
 from mxnet.gluon.data import Dataset
-from deep_abyasa import CustomException
-from deep_abyasa import Encode_Labels
+from deep_abyasa.helpers.custom_exceptions import CustomException
+from deep_abyasa.preprocess.encode_labels import Encode_Labels
+from deep_abyasa.datasets.index import ColumnarIndex
+from deep_abyasa.preprocess.records import RecordShards
+from deep_abyasa.helpers.utils import Utils
+from deep_abyasa.datasets.cache import DecodedImageCache
+from deep_abyasa.datasets.decode import ImageDecoder
 
 
 class JsonIndexMultiLabelDataset(Dataset):
@@ -34,11 +40,51 @@ class JsonIndexMultiLabelDataset(Dataset):
                 If this is provided, then it will be used for one
                 hot encoding.
 
+            one_hot_storage: How one hot encoded labels are held. 'ndarray'
+                (default) builds an mxnet NDArray per item. 'dense'
+                encodes the whole y_col once into a uint8 matrix and
+                returns its row per item as a float32 NDArray. 'packed'
+                does the same with a bit packed matrix, 8 times smaller,
+                unpacking a row per item. Labels are float32 with every
+                storage, as the losses expect.
+
+            cache_dir: If provided, decoded images are cached in a uint8
+                memmap in this directory (on local disk) and read back
+                from it in later epochs and by other workers. The cache
+                is rebuilt when the index file, image_path or
+                cache_shape change. Cached images are returned without
+                a copy, as NDArrays backed by the memmap, so they must
+                not be modified in place
+
+            cache_shape: (height, width) images are resized to when
+                they are decoded (and before being cached). If None, all
+                images must have the shape of the first image to be
+                cached. When decoder is given, set its size instead; a
+                cache_shape that differs from it raises CustomException
+
+            decoder: ImageDecoder selecting the decode backend, decode
+                time resize and channels. Default decodes RGB with
+                mx.image, resized to cache_shape
+
+            memory_cache: A SharedLRUImageCache to keep decoded images in
+                shared memory, checked before cache_dir and decoding.
+                Create it before the DataLoader so that all workers
+                share it
+
+            vocabulary_file: Vocabulary file written by
+                Encode_Labels.write_vocabulary or
+                Encode_Labels.encode_from_index_files. Used like labels,
+                e.g. to encode a test set with the labels of the training
+                set. Takes precedence over determine_labels_from_y_col
+
+       The index file is read once and kept as a ColumnarIndex at
+       self.index, so no pandas objects are held by the dataset.
 
     """
     def __init__(self, root, file, image_path, x_col, y_col, transform=None,
                  one_hot_encode_labels=False, determine_labels_from_y_col=False,
-                 labels={}):
+                 labels={}, one_hot_storage='ndarray', cache_dir=None,
+                 cache_shape=None, memory_cache=None, vocabulary_file=None, decoder=None):
 
         self.root = root
         self.file = file
@@ -48,8 +94,28 @@ class JsonIndexMultiLabelDataset(Dataset):
         self._transform = transform
         self.one_hot_encode_labels = one_hot_encode_labels
         self.determine_labels_from_y_col = determine_labels_from_y_col
-        self.data_index = pd.read_json(os.path.join(root, file))
+        self.vocabulary_file = vocabulary_file
+        self.index = ColumnarIndex.from_dataframe(pd.read_json(os.path.join(root, file)), x_col, y_col)
         self.labels = self.validate_and_set_labels(labels)
+        self.one_hot_storage = one_hot_storage
+        self.label_matrix = self.build_label_matrix()
+        self.decoder = self.validate_decoder(decoder, cache_shape)
+        self.cache_shape = self.decoder.size
+        self.cache = self.create_cache(cache_dir)
+        self._member_rows = None
+        self.memory_cache = memory_cache
+
+    @staticmethod
+    def validate_decoder(decoder, cache_shape):
+        """Returns decoder, or an ImageDecoder resizing to cache_shape if
+           no decoder is given"""
+        if decoder is None:
+            return ImageDecoder(size=cache_shape)
+        if cache_shape is not None and tuple(cache_shape) != decoder.size:
+            print(f'cache_shape {tuple(cache_shape)} differs from decoder size {decoder.size}. '
+                  f'Set the size on the decoder only')
+            raise CustomException
+        return decoder
 
     def validate_and_set_labels(self, labels):
         """If one_hot_encode_label is set to true, this method, extracts
@@ -68,21 +134,69 @@ class JsonIndexMultiLabelDataset(Dataset):
         if self.one_hot_encode_labels and labels:
             print("Since Labels are provided, this will be used for one hot encoding")
             return labels
+        elif self.one_hot_encode_labels and self.vocabulary_file is not None:
+            print(f"Labels will be read from {self.vocabulary_file} and will be used for hot encoding")
+            vocabulary = Encode_Labels.read_vocabulary(self.vocabulary_file)
+            if vocabulary is None:
+                print(f"Vocabulary file {self.vocabulary_file} does not exist")
+                raise CustomException
+            return vocabulary[1]
         elif self.one_hot_encode_labels and self.determine_labels_from_y_col:
             print("Labels will be determined from y_col in dataset and will be used for hot encoding")
-            labels = Encode_Labels.extract_multi_labels_from_arraylike_cols(self.data_index[self.y_col])
-            itol, ltoi = Encode_Labels.generate_itol_ltoi(labels)
+            itol, ltoi = Encode_Labels.generate_itol_ltoi(self.index.label_vocab.tolist())
             return ltoi
         elif self.one_hot_encode_labels:
-            print("Either Labels must be provided or determine_labels_from_y_col must be true")
+            print("Either Labels or vocabulary_file must be provided or determine_labels_from_y_col must be true")
+            raise CustomException
+
+    def build_label_matrix(self):
+        """Encodes y_col into a one hot matrix up front when
+           one_hot_storage is 'dense' or 'packed'.
+
+           Returns:
+               uint8 matrix (bit packed for 'packed') or None
+
+        """
+        if self.one_hot_storage not in ('ndarray', 'dense', 'packed'):
+            print(f"one_hot_storage must be one of 'ndarray', 'dense' or 'packed', got {self.one_hot_storage}")
+            raise CustomException
+        if not self.one_hot_encode_labels or self.one_hot_storage == 'ndarray':
+            return None
+        codes = self.index.class_codes(self.labels)
+        if (codes < 0).any():
+            missing = set(self.index.label_vocab[self.index.label_values[codes < 0]].tolist())
+            print(f'Labels {missing} are not in labels')
             raise CustomException
+        return Encode_Labels.one_hot_from_csr(self.index.label_offsets, codes, len(self.labels),
+                                              packed=self.one_hot_storage == 'packed')
+
+    def encode_batch(self, indices):
+        """One hot encodes the labels of a batch of items at once. Can be
+           called directly from a DataLoader batchify_fn.
+
+           Args:
+               indices: list or array of item indices
+
+           Returns:
+               uint8 matrix of shape (len(indices), len(self.labels))
+
+        """
+        if not self.one_hot_encode_labels:
+            print("encode_batch needs one_hot_encode_labels to be true")
+            raise CustomException
+        indices = np.asarray(indices, dtype=np.int64)
+        if self.one_hot_storage == 'dense':
+            return self.label_matrix[indices]
+        if self.one_hot_storage == 'packed':
+            return np.unpackbits(self.label_matrix[indices], axis=1, count=len(self.labels))
+        return Encode_Labels.one_hot_encode([self.index.labels(i) for i in indices], self.labels)
 
     def __getitem__(self, idx):
         """Implementation of mxnet Datasets getitem method. For a given index, this
         method, read the image, applies transformations if provided, extracts
         labels, one_hot_encodes (if asked). This method also returns the
         image_name. Here the assumption is image name is of the format int.png.
-        It will fail if image names are not in this format.
+        If image names are not in this format, image_name is nan.
 
         Args:
             idx: Index of element to retrieve
@@ -94,23 +208,266 @@ class JsonIndexMultiLabelDataset(Dataset):
 
 
         """
-        item = self.data_index.iloc[idx]
-        image = mx.image.imread(os.path.join(self.root, self.image_path, item[self.x_col]))
-        image_name = float(item[self.x_col][:-4])
-        if self.one_hot_encode_labels:
-            lab = [self.labels[i] for i in item[self.y_col]]
+        image = self.load_image(idx)
+        image_name = self.index.image_id(idx)
+        if self.label_matrix is not None:
+            codes = self.label_matrix[idx]
+            if self.one_hot_storage == 'packed':
+                codes = np.unpackbits(codes, count=len(self.labels))
+            codes = mx.nd.array(codes, dtype='float32')
+        elif self.one_hot_encode_labels:
+            lab = [self.labels[i] for i in self.index.labels(idx)]
             codes = mx.nd.zeros(len(self.labels))
             for l in lab:
                 codes[l] = 1
         else:
-            codes = item[self.y_col]
+            codes = self.index.labels(idx)
+        return image, codes, image_name
+
+    def create_cache(self, cache_dir):
+        """Creates the decoded image cache when cache_dir is provided.
+
+           Returns:
+               DecodedImageCache or None
+
+        """
+        if cache_dir is None:
+            return None
+        key = DecodedImageCache.make_key(index_sha256=Utils.file_sha256(os.path.join(self.root, self.file)),
+                                         image_path=os.path.abspath(os.path.join(self.root, self.image_path)),
+                                         cache_shape=self.cache_shape,
+                                         decoder=self.decoder.settings())
+        if self.decoder.shape is not None:
+            shape = self.decoder.shape
+        else:
+            shape = self.read_image(0).shape if len(self) else (0, 0, 3)
+        return DecodedImageCache(cache_dir, key, len(self), shape)
+
+    def cache_member(self, path, image_bytes):
+        """Handler for Download that decodes images of this dataset straight
+           into the disk cache as the archive is extracted, so no loose
+           image files are written. Needs cache_dir and cache_shape.
+
+        Args:
+            path: Path the archive member would be extracted to
+
+            image_bytes: Encoded image
+
+        Returns:
+            True if the member is an image of this dataset and was cached
+
+        """
+        if self.cache is None:
+            return False
+        if self._member_rows is None:
+            self._member_rows = {os.path.realpath(os.path.join(self.root, self.image_path, self.index.file(i))): i
+                                 for i in range(len(self))}
+        idx = self._member_rows.get(os.path.realpath(path))
+        if idx is None:
+            return False
+        self.cache.put(idx, self.decoder.decode(image_bytes).asnumpy())
+        return True
+
+    def read_image(self, idx):
+        """Decodes the image of item idx with self.decoder.
+
+        Returns:
+            image as NDArray of shape (height, width, channels)
+
+        """
+        return self.decoder.read(os.path.join(self.root, self.image_path, self.index.file(idx)))
+
+    def decode_image(self, idx):
+        """Returns the decoded image of item idx, from memory_cache or the
+           disk cache if there are any.
+
+        Returns:
+            image as NDArray of shape (height, width, channels)
+
+        """
+        if self.memory_cache is None:
+            return self.decode_cached_image(idx)
+        cached = self.memory_cache.get(idx)
+        if cached is not None:
+            return self.as_ndarray(cached)
+        image = self.decode_cached_image(idx)
+        self.memory_cache.put(idx, image.asnumpy())
+        return image
+
+    def decode_cached_image(self, idx):
+        """Returns the decoded image of item idx, from the disk cache if
+           there is one.
+
+        Returns:
+            image as NDArray of shape (height, width, channels)
 
+        """
+        if self.cache is None:
+            return self.read_image(idx)
+        cached = self.cache.get(idx)
+        if cached is not None:
+            return self.as_ndarray(cached)
+        image = self.read_image(idx)
+        if image.shape != self.cache.shape:
+            print(f'Image {self.index.file(idx)} has shape {image.shape}, cache expects {self.cache.shape}. '
+                  f'Set cache_shape to resize images before caching')
+            raise CustomException
+        self.cache.put(idx, image.asnumpy())
+        return image
+
+    @staticmethod
+    def as_ndarray(image):
+        """Wraps a uint8 numpy image as an NDArray, without a copy when
+           it is C-contiguous (memmap rows and memory cache copies are).
+           The NDArray shares memory with image"""
+        if image.flags['C_CONTIGUOUS']:
+            return mx.nd.from_numpy(image, zero_copy=True)
+        return mx.nd.array(image, dtype=np.uint8)
+
+    def load_image(self, idx):
+        """Decodes the image of item idx and applies transformations if
+           provided.
+
+        Args:
+            idx: Index of element to retrieve
+
+        Returns:
+            image as NDArray of shape (channels, height, -1)
+
+        """
+        image = self.decode_image(idx)
         if self._transform is not None:
-            return self._transform(image).reshape(3, image.shape[0], -1), codes, image_name
-        return image.reshape(3, image.shape[0], -1), codes, image_name
+            return self._transform(image).reshape(self.decoder.channels, image.shape[0], -1)
+        return image.reshape(self.decoder.channels, image.shape[0], -1)
+
+    def __getitems__(self, indices, ctx=None):
+        """Fetches a whole batch at once. Images are written straight into
+           one preallocated NDArray, labels are encoded in a single
+           vectorized pass and names come from one array lookup, so no
+           per sample stacking is needed afterwards. All images of the
+           batch must have the same shape after transformation.
+
+        Args:
+            indices: list of indices of elements to retrieve
+
+            ctx: Context to allocate the batch in. Default is mx.cpu()
+
+        Returns:
+            images, labels, image_names batches. labels is a list of
+            label lists when one_hot_encode_labels is False
+
+        """
+        ctx = mx.cpu() if ctx is None else ctx
+        indices = list(indices)
+        first = self.load_image(indices[0])
+        images = mx.nd.empty((len(indices),) + first.shape, ctx=ctx, dtype=first.dtype)
+        images[0] = first
+        for i, idx in enumerate(indices[1:], 1):
+            image = self.load_image(idx)
+            if image.shape != first.shape:
+                print(f'Image {self.index.file(idx)} has shape {image.shape}, expected {first.shape}')
+                raise CustomException
+            images[i] = image
+
+        if self.one_hot_encode_labels:
+            codes = mx.nd.array(self.encode_batch(indices), ctx=ctx, dtype='float32')
+        else:
+            codes = [self.index.labels(i) for i in indices]
+        image_names = mx.nd.array(self.index.image_ids[indices], ctx=ctx)
+        return images, codes, image_names
 
     def __len__(self):
         """Implementation of mxnet len method. Simply returns number of
            elements in the dataset
         """
-        return self.data_index.shape[0]
+        return len(self.index)
+
+
+class RecordShardMultiLabelDataset(Dataset):
+    """Drop-in alternative to JsonIndexMultiLabelDataset that reads images
+       and one hot encoded labels from record shards written by
+       RecordShards.pack. Records are read by offset from the shard idx
+       files, and reading them in index order is sequential I/O.
+
+       Args:
+            out_prefix: Path prefix given to RecordShards.pack
+
+            transform: mxnet Transformations to be applied on images
+
+            decoder: ImageDecoder used to decode the images. Default
+                decodes RGB with mx.image
+
+    """
+    def __init__(self, out_prefix, transform=None, decoder=None):
+        self.out_prefix = out_prefix
+        self._transform = transform
+        self.decoder = ImageDecoder() if decoder is None else decoder
+        meta = RecordShards.read_meta(out_prefix)
+        self.num_records = meta['num_records']
+        self.records_per_shard = meta['records_per_shard']
+        self.labels = meta['labels']
+        self.one_hot_encode_labels = True
+        self._records = {}
+
+    def read_record(self, idx):
+        """Reads and unpacks the record of item idx. Shards are opened on
+           first use, so each DataLoader worker opens its own handles.
+
+        Returns:
+            mxnet IRHeader and encoded image bytes
+
+        """
+        shard = idx // self.records_per_shard
+        if shard not in self._records:
+            idx_path, rec_path = RecordShards.shard_paths(self.out_prefix, shard)
+            self._records[shard] = mx.recordio.MXIndexedRecordIO(idx_path, rec_path, 'r')
+        return mx.recordio.unpack(self._records[shard].read_idx(idx))
+
+    def load_image(self, image_bytes):
+        """Decodes image bytes and applies transformations if provided.
+
+        Returns:
+            image as NDArray of shape (channels, height, -1)
+
+        """
+        image = self.decoder.decode(image_bytes)
+        if self._transform is not None:
+            return self._transform(image).reshape(self.decoder.channels, image.shape[0], -1)
+        return image.reshape(self.decoder.channels, image.shape[0], -1)
+
+    def __getitem__(self, idx):
+        """Reads record idx and returns image, one hot labels and
+           image_name as JsonIndexMultiLabelDataset does.
+        """
+        header, image_bytes = self.read_record(idx)
+        return self.load_image(image_bytes), mx.nd.array(header.label), RecordShards.decode_id(header.id)
+
+    def __getitems__(self, indices, ctx=None):
+        """Fetches a whole batch at once, reading records in offset order.
+           See JsonIndexMultiLabelDataset.__getitems__.
+        """
+        ctx = mx.cpu() if ctx is None else ctx
+        indices = list(indices)
+        images = None
+        labels = np.empty((len(indices), len(self.labels)), dtype=np.float32)
+        image_ids = np.empty(len(indices), dtype=np.float64)
+        for i in sorted(range(len(indices)), key=lambda j: indices[j]):
+            header, image_bytes = self.read_record(indices[i])
+            image = self.load_image(image_bytes)
+            if images is None:
+                images = mx.nd.empty((len(indices),) + image.shape, ctx=ctx, dtype=image.dtype)
+            elif image.shape != images.shape[1:]:
+                print(f'Record {indices[i]} has shape {image.shape}, expected {images.shape[1:]}')
+                raise CustomException
+            images[i] = image
+            labels[i] = header.label
+            image_ids[i] = RecordShards.decode_id(header.id)
+        return images, mx.nd.array(labels, ctx=ctx), mx.nd.array(image_ids, ctx=ctx, dtype=np.float64)
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_records'] = {}
+        return state
+
+    def __len__(self):
+        return self.num_records
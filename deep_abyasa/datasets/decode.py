@@ -0,0 +1,117 @@
+import io
+import numpy as np
+import mxnet as mx
+from deep_abyasa.helpers.custom_exceptions import CustomException
+
+
+class ImageDecoder:
+    """Decodes encoded images (png, jpeg, ...) into uint8 NDArrays of shape
+       (height, width, channels), resizing in the same step, so that no
+       full resolution RGB NDArray is built when a smaller or grayscale
+       image is wanted.
+
+       Backends:
+           ``mxnet`` mx.image.imdecode and mx.image.imresize.
+           ``opencv`` cv2.imdecode, decoding straight to grayscale when
+           channels is 1, and cv2.resize with area interpolation.
+           ``pillow`` PIL, using draft mode for jpeg downscaling.
+
+       Structure images are mostly white line art, so channels=1 (and
+       threshold for 1-bit images) loses little. Which backend is fastest
+       depends on the build, compare them with benchmarks/bench_decode.py.
+
+       Args:
+            backend: 'mxnet', 'opencv' or 'pillow'
+
+            size: (height, width) images are resized to. None keeps the
+                decoded size
+
+            channels: 3 for RGB or 1 for grayscale
+
+            threshold: If given (grayscale only), pixels above threshold
+                become 255 and others 0
+
+    """
+    BACKENDS = ('mxnet', 'opencv', 'pillow')
+
+    def __init__(self, backend='mxnet', size=None, channels=3, threshold=None):
+        if backend not in self.BACKENDS:
+            print(f'backend must be one of {self.BACKENDS}, got {backend}')
+            raise CustomException
+        if channels not in (1, 3):
+            print(f'channels must be 1 or 3, got {channels}')
+            raise CustomException
+        if threshold is not None and channels != 1:
+            print('threshold needs channels=1')
+            raise CustomException
+        self.backend = backend
+        self.size = None if size is None else tuple(size)
+        self.channels = channels
+        self.threshold = threshold
+
+    def settings(self):
+        """Settings that determine the decoded pixels, e.g. for cache keys"""
+        return {'backend': self.backend, 'size': self.size, 'channels': self.channels,
+                'threshold': self.threshold}
+
+    @property
+    def shape(self):
+        """(height, width, channels) of decoded images, or None if size is
+           not set"""
+        return None if self.size is None else self.size + (self.channels,)
+
+    def read(self, path):
+        """Reads and decodes an image file"""
+        if self.backend == 'mxnet':
+            return self.finish_mxnet(mx.image.imread(path, flag=1 if self.channels == 3 else 0))
+        with open(path, 'rb') as f:
+            return self.decode(f.read())
+
+    def decode(self, image_bytes):
+        """Decodes image bytes.
+
+        Returns:
+            uint8 NDArray of shape (height, width, channels)
+
+        """
+        return getattr(self, f'decode_{self.backend}')(image_bytes)
+
+    def decode_mxnet(self, image_bytes):
+        return self.finish_mxnet(mx.image.imdecode(image_bytes, flag=1 if self.channels == 3 else 0))
+
+    def finish_mxnet(self, image):
+        """Resizes and thresholds an image decoded by mxnet"""
+        if self.size is not None:
+            image = mx.image.imresize(image, self.size[1], self.size[0])
+        if self.threshold is not None:
+            image = (image > self.threshold).astype('uint8') * 255
+        return image
+
+    def decode_opencv(self, image_bytes):
+        import cv2
+        flag = cv2.IMREAD_COLOR if self.channels == 3 else cv2.IMREAD_GRAYSCALE
+        image = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), flag)
+        if image is None:
+            print('OpenCV could not decode image')
+            raise CustomException
+        if self.size is not None and image.shape[:2] != self.size:
+            image = cv2.resize(image, (self.size[1], self.size[0]), interpolation=cv2.INTER_AREA)
+        if self.channels == 3:
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        elif self.threshold is not None:
+            _, image = cv2.threshold(image, self.threshold, 255, cv2.THRESH_BINARY)
+        return mx.nd.array(image.reshape(image.shape[:2] + (self.channels,)), dtype=np.uint8)
+
+    def decode_pillow(self, image_bytes):
+        from PIL import Image
+        image = Image.open(io.BytesIO(image_bytes))
+        mode = 'RGB' if self.channels == 3 else 'L'
+        if self.size is not None:
+            image.draft(mode, (self.size[1], self.size[0]))
+        image = image.convert(mode)
+        if self.size is not None and image.size != (self.size[1], self.size[0]):
+            image = image.resize((self.size[1], self.size[0]), Image.BILINEAR)
+        image = np.asarray(image)
+        if self.threshold is not None:
+            image = np.where(image > self.threshold, 255, 0).astype(np.uint8)
+        return mx.nd.array(image.reshape(image.shape[:2] + (self.channels,)), dtype=np.uint8)
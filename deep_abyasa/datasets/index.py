@@ -0,0 +1,106 @@
+import numpy as np
+import pandas as pd
+
+
+class ColumnarIndex:
+    """Compact, array backed view of a dataset index. The index is
+       converted once into a handful of NumPy arrays so that looking up
+       a sample is plain array indexing and no pandas objects are
+       created per item. The arrays also pickle much smaller than the
+       DataFrame they were built from, which matters as the dataset is
+       copied into every DataLoader worker.
+
+       Args:
+            files: utf-8 encoded file names, one per row (numpy bytes array)
+
+            image_ids: float ids parsed from the file names. NaN when
+                the file name is not of the format int.png
+
+            label_offsets: CSR style offsets into label_values. Labels of
+                row i are label_values[label_offsets[i]:label_offsets[i + 1]]
+
+            label_values: int codes into label_vocab
+
+            label_vocab: array of unique labels
+
+    """
+    def __init__(self, files, image_ids, label_offsets, label_values, label_vocab):
+        self.files = files
+        self.image_ids = image_ids
+        self.label_offsets = label_offsets
+        self.label_values = label_values
+        self.label_vocab = label_vocab
+
+    @classmethod
+    def from_dataframe(cls, data_index, x_col, y_col):
+        """Builds the columnar index from an index DataFrame.
+
+        Args:
+            data_index: DataFrame with one row per image
+
+            x_col: Column name that contains image file names
+
+            y_col: Column name for labels. Each value is either a
+                list of labels or a single label
+
+        Returns:
+            ColumnarIndex
+
+        """
+        files = data_index[x_col].astype(str).reset_index(drop=True)
+        stems = files.str.replace(r'\.[^./]*$', '', regex=True)
+        image_ids = pd.to_numeric(stems, errors='coerce').to_numpy(dtype=np.float64)
+
+        exploded = data_index[y_col].reset_index(drop=True).explode()
+        exploded = exploded[exploded.notna()]
+        codes, vocab = pd.factorize(exploded)
+        counts = np.bincount(exploded.index.to_numpy(dtype=np.int64), minlength=len(files))
+        label_offsets = np.zeros(len(files) + 1, dtype=np.int64)
+        np.cumsum(counts, out=label_offsets[1:])
+
+        return cls(files=np.array(files.str.encode('utf-8').tolist(), dtype=np.bytes_),
+                   image_ids=image_ids,
+                   label_offsets=label_offsets,
+                   label_values=codes.astype(np.int32),
+                   label_vocab=np.asarray(vocab))
+
+    def file(self, idx):
+        """File name of the row at idx"""
+        return self.files[idx].decode('utf-8')
+
+    def image_id(self, idx):
+        """Image id of the row at idx"""
+        return float(self.image_ids[idx])
+
+    def label_codes(self, idx):
+        """Codes (into label_vocab) of labels of the row at idx. This is
+           a view on label_values, no copy is made
+        """
+        return self.label_values[self.label_offsets[idx]:self.label_offsets[idx + 1]]
+
+    def labels(self, idx):
+        """List of labels of the row at idx"""
+        return self.label_vocab[self.label_codes(idx)].tolist()
+
+    def class_codes(self, ltoi):
+        """Maps label_values to the ints given by ltoi in one lookup.
+
+        Args:
+            ltoi: dict of label to int
+
+        Returns:
+            int array aligned with label_values. Labels missing
+            from ltoi are -1
+
+        """
+        lookup = np.array([ltoi.get(l, -1) for l in self.label_vocab.tolist()], dtype=np.int64)
+        return lookup[self.label_values]
+
+    @property
+    def nbytes(self):
+        """Total bytes held by the index arrays"""
+        return sum(a.nbytes for a in (self.files, self.image_ids, self.label_offsets,
+                                      self.label_values, self.label_vocab))
+
+    def __len__(self):
+        return len(self.files)
@@ -0,0 +1,322 @@
+import os
+import json
+import queue
+import multiprocessing
+import numpy as np
+import mxnet as mx
+from deep_abyasa.helpers.utils import Utils
+from deep_abyasa.helpers.custom_exceptions import CustomException
+from deep_abyasa.preprocess.encode_labels import Encode_Labels
+from deep_abyasa.datasets.decode import ImageDecoder
+
+
+class StreamingMultiLabelDataset:
+    """Iterable multi-label dataset that reads its index incrementally
+       instead of loading it into a DataFrame. Index files are JSON Lines
+       (``.jsonl``, one record per line, read line by line) or JSON arrays
+       (read one file at a time, so a large index can be split into
+       chunk files). Samples are yielded as they are read, so the first
+       batch doesn't wait for the whole index.
+
+       Records are sharded by their position in the index: record k goes
+       to rank k % world_size, so every record is read by exactly one
+       rank. Lines of other ranks are skipped without being parsed.
+       loader() shards further across worker processes.
+
+       Example:
+           ::
+
+               ds = StreamingMultiLabelDataset(root, 'images', 'file', 'elements',
+                                               files=['train.jsonl'], labels=ltoi,
+                                               transform=transform_train, shuffle_buffer=10000,
+                                               rank=rank, world_size=world_size)
+               train_dl = ds.loader(batch_size=64, num_workers=4)
+               TrainingHelpers.train(train_dl, test_dl, net, trainer, loss)
+
+       Args:
+            root: Root path for index files and images
+
+            image_path: Additional path from root to get to images
+
+            x_col: Column name that contains image details
+
+            y_col: Column name for labels
+
+            files: List of index files in root. If None, files in root
+                matching pattern are used
+
+            pattern: regex selecting index files when files is None
+
+            labels: dict of label to int used for one hot encoding
+
+            vocabulary_file: Alternative to labels, see
+                Encode_Labels.write_vocabulary
+
+            transform: mxnet Transformations to be applied on images
+
+            rank: Shard of this process, 0 <= rank < world_size
+
+            world_size: Number of shards, e.g. number of nodes
+
+            shuffle_buffer: Size of the shuffle buffer. With 0, records
+                come in index order. Otherwise the order of index files
+                and, within a window of shuffle_buffer records, the order
+                of records is randomized
+
+            seed: Seed of the shuffle. The order changes every epoch
+
+            decoder: ImageDecoder used to decode the images. Default
+                decodes RGB with mx.image
+
+    """
+    def __init__(self, root, image_path, x_col, y_col, files=None, pattern=r'.*\.jsonl?$',
+                 labels=None, vocabulary_file=None, transform=None, rank=0, world_size=1,
+                 shuffle_buffer=0, seed=0, decoder=None):
+        self.root = root
+        self.image_path = image_path
+        self.x_col = x_col
+        self.y_col = y_col
+        self.files = sorted(Utils.create_list_of_file_paths(root, files, pattern))
+        self.labels = self.validate_and_set_labels(labels, vocabulary_file)
+        self._transform = transform
+        self.decoder = ImageDecoder() if decoder is None else decoder
+        if not 0 <= rank < world_size:
+            print(f'rank must be in [0, {world_size}), got {rank}')
+            raise CustomException
+        self.rank = rank
+        self.world_size = world_size
+        self.shuffle_buffer = shuffle_buffer
+        self.seed = seed
+        self.epoch = 0
+
+    @staticmethod
+    def validate_and_set_labels(labels, vocabulary_file):
+        """Returns labels, or the labels of vocabulary_file"""
+        if labels:
+            return labels
+        if vocabulary_file is not None:
+            vocabulary = Encode_Labels.read_vocabulary(vocabulary_file)
+            if vocabulary is not None:
+                return vocabulary[1]
+            print(f"Vocabulary file {vocabulary_file} does not exist")
+            raise CustomException
+        print("Either labels or vocabulary_file must be provided")
+        raise CustomException
+
+    def shard(self, rank, world_size):
+        """Returns a copy of this dataset reading shard rank of world_size
+           of this dataset's shard"""
+        shard = StreamingMultiLabelDataset.__new__(StreamingMultiLabelDataset)
+        shard.__dict__.update(self.__dict__)
+        shard.rank = self.rank + self.world_size * rank
+        shard.world_size = self.world_size * world_size
+        return shard
+
+    def set_epoch(self, epoch):
+        """Sets the epoch the shuffle order is derived from"""
+        self.epoch = epoch
+
+    def records(self):
+        """Reads the (file, labels) records of this shard from the index
+
+        Yields:
+            (image file, labels)
+
+        """
+        files = list(self.files)
+        if self.shuffle_buffer > 0:
+            # Same order on every rank, so that record positions agree
+            np.random.default_rng([self.seed, self.epoch]).shuffle(files)
+        k = 0
+        for path in files:
+            if path.endswith('.jsonl'):
+                with open(path) as f:
+                    for line in f:
+                        if not line.strip():
+                            continue
+                        if k % self.world_size == self.rank:
+                            record = json.loads(line)
+                            yield record[self.x_col], record[self.y_col]
+                        k += 1
+            else:
+                with open(path) as f:
+                    chunk = json.load(f)
+                for record in chunk:
+                    if k % self.world_size == self.rank:
+                        yield record[self.x_col], record[self.y_col]
+                    k += 1
+
+    def shuffled(self, records):
+        """Shuffle buffer: keeps shuffle_buffer records and yields a random
+           one of them for every record read"""
+        if self.shuffle_buffer <= 0:
+            yield from records
+            return
+        rng = np.random.default_rng([self.seed, self.epoch, self.rank, self.world_size])
+        buffer = []
+        for record in records:
+            if len(buffer) < self.shuffle_buffer:
+                buffer.append(record)
+                continue
+            j = rng.integers(len(buffer))
+            yield buffer[j]
+            buffer[j] = record
+        rng.shuffle(buffer)
+        yield from buffer
+
+    @staticmethod
+    def image_id(file):
+        """Image id parsed from a file name of the format int.png, nan
+           otherwise, as in JsonIndexMultiLabelDataset"""
+        try:
+            return float(os.path.splitext(file)[0])
+        except ValueError:
+            return float('nan')
+
+    def load_image(self, file):
+        """Decodes an image and applies transformations if provided.
+
+        Returns:
+            image as NDArray of shape (channels, height, -1)
+
+        """
+        image = self.decoder.read(os.path.join(self.root, self.image_path, file))
+        if self._transform is not None:
+            return self._transform(image).reshape(self.decoder.channels, image.shape[0], -1)
+        return image.reshape(self.decoder.channels, image.shape[0], -1)
+
+    def __iter__(self):
+        """Yields (image, one hot labels, image_name) samples of this shard"""
+        for file, labels in self.shuffled(self.records()):
+            yield (self.load_image(file),
+                   mx.nd.array(Encode_Labels.one_hot_encode([labels], self.labels)[0]),
+                   self.image_id(file))
+
+    def batches(self, batch_size, last_batch='keep'):
+        """Yields batches of this shard as numpy arrays.
+
+        Args:
+            batch_size: Number of samples per batch
+
+            last_batch: 'keep' or 'discard' the last, short batch
+
+        Yields:
+            images, one hot labels, image_names
+
+        """
+        batch = []
+        for file, labels in self.shuffled(self.records()):
+            batch.append((file, labels))
+            if len(batch) == batch_size:
+                yield self.make_batch(batch)
+                batch = []
+        if batch and last_batch == 'keep':
+            yield self.make_batch(batch)
+
+    def make_batch(self, batch):
+        """Decodes and stacks a list of (file, labels) records"""
+        images = np.stack([self.load_image(file).asnumpy() for file, _ in batch])
+        labels = Encode_Labels.one_hot_encode([l for _, l in batch], self.labels).astype(np.float32)
+        names = np.array([self.image_id(file) for file, _ in batch], dtype=np.float32)
+        return images, labels, names
+
+    def loader(self, batch_size, num_workers=0, last_batch='keep', prefetch=2, timeout=1.0):
+        """Returns an iterable of batches like a gluon DataLoader. See
+           StreamingLoader"""
+        return StreamingLoader(self, batch_size, num_workers, last_batch, prefetch, timeout)
+
+
+class StreamingLoader:
+    """Batches a StreamingMultiLabelDataset, reading and decoding in
+       num_workers processes that each take their own shard of the
+       dataset's shard. Every iteration is a new epoch, with a new shuffle
+       order. Batches come in the order workers finish them and there is
+       no len(), as the number of records isn't known up front.
+
+       Args:
+            dataset: StreamingMultiLabelDataset
+
+            batch_size: Number of samples per batch
+
+            num_workers: Number of worker processes. With 0, batches are
+                built in the calling process
+
+            last_batch: 'keep' or 'discard' the last, short batch of each
+                worker
+
+            prefetch: Batches each worker may have ready ahead of the
+                consumer
+
+            timeout: Seconds to wait for a batch before checking whether
+                a worker died without reporting (e.g. killed by the OOM
+                killer or crashed in a decoder), which raises
+                CustomException instead of waiting forever
+
+       Yields:
+            images, labels and image_names as NDArrays
+
+    """
+    _END = 'end'
+
+    def __init__(self, dataset, batch_size, num_workers=0, last_batch='keep', prefetch=2, timeout=1.0):
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.num_workers = num_workers
+        self.last_batch = last_batch
+        self.prefetch = prefetch
+        self.timeout = timeout
+        self.epoch = 0
+
+    @staticmethod
+    def to_nd(batch):
+        return tuple(mx.nd.array(b, dtype=b.dtype) for b in batch)
+
+    @staticmethod
+    def work(dataset, batch_size, last_batch, out):
+        """Worker process: puts the batches of its shard on out"""
+        try:
+            for batch in dataset.batches(batch_size, last_batch):
+                out.put(batch)
+            out.put(StreamingLoader._END)
+        except Exception as e:
+            out.put(repr(e))
+
+    def __iter__(self):
+        self.dataset.set_epoch(self.epoch)
+        self.epoch += 1
+        if self.num_workers <= 0:
+            for batch in self.dataset.batches(self.batch_size, self.last_batch):
+                yield self.to_nd(batch)
+            return
+
+        context = multiprocessing.get_context('fork')
+        out = context.Queue(maxsize=self.prefetch * self.num_workers)
+        workers = [context.Process(target=self.work, daemon=True,
+                                   args=(self.dataset.shard(w, self.num_workers), self.batch_size,
+                                         self.last_batch, out))
+                   for w in range(self.num_workers)]
+        for worker in workers:
+            worker.start()
+        try:
+            running = len(workers)
+            while running:
+                try:
+                    item = out.get(timeout=self.timeout)
+                except queue.Empty:
+                    dead = [w.exitcode for w in workers if w.exitcode not in (None, 0)]
+                    if dead:
+                        print(f'Streaming worker died without reporting, exit code {dead[0]}')
+                        raise CustomException
+                    continue
+                if isinstance(item, str):
+                    running -= 1
+                    if item != self._END:
+                        print(f'Streaming worker failed: {item}')
+                        raise CustomException
+                    continue
+                yield self.to_nd(item)
+        finally:
+            for worker in workers:
+                if worker.is_alive():
+                    worker.terminate()
+                worker.join()
@@ -0,0 +1,187 @@
+import random
+import numpy as np
+import mxnet as mx
+from deep_abyasa.helpers.custom_exceptions import CustomException
+
+
+class BatchCompose:
+    """Batch level counterpart of gluon transforms.Compose. Applies a list
+       of batch transforms to a whole NCHW batch on the context it is on,
+       e.g. the training GPU after split_and_load. Random transforms draw
+       their parameters per sample, so a batch gets the same variety as
+       per-sample transforms in DataLoader workers, which are then left
+       with decoding only.
+
+       Example:
+           ::
+
+               augment = BatchCompose([BatchToTensor(),
+                                       BatchRandomSaturation(.1),
+                                       BatchRandomContrast(.1),
+                                       BatchRandomColorJitter(.1),
+                                       BatchRandomHue(.1),
+                                       BatchNormalize(0, 1)])
+               ds = JsonIndexMultiLabelDataset(..., transform=None)
+               TrainingHelpers.train(train_dl, test_dl, net, trainer, loss,
+                                     batch_transform=augment,
+                                     test_batch_transform=augment.deterministic())
+
+       Args:
+            transforms: List of batch transforms
+
+    """
+    def __init__(self, transforms):
+        self.transforms = list(transforms)
+
+    def deterministic(self):
+        """Returns a BatchCompose without the random transforms, e.g. for
+           the test set"""
+        return BatchCompose([t for t in self.transforms if not isinstance(t, BatchRandomTransform)])
+
+    def __call__(self, batch):
+        for t in self.transforms:
+            batch = t(batch)
+        return batch
+
+
+class BatchToTensor:
+    """Converts a uint8 image batch to float32 NCHW in [0, 1], like
+       transforms.ToTensor does per image.
+
+       Args:
+            layout: Layout of the incoming batch. 'reshaped' (default) is
+                what the datasets return without a transform: decoded HWC
+                images reshaped, not transposed, to (C, H, W). 'NHWC' and
+                'NCHW' are taken as they are
+
+    """
+    LAYOUTS = ('reshaped', 'NHWC', 'NCHW')
+
+    def __init__(self, layout='reshaped'):
+        if layout not in self.LAYOUTS:
+            print(f'layout must be one of {self.LAYOUTS}, got {layout}')
+            raise CustomException
+        self.layout = layout
+
+    def __call__(self, batch):
+        if self.layout == 'reshaped':
+            n, c, h, w = batch.shape
+            batch = batch.reshape((n, h, w, c))
+        if self.layout != 'NCHW':
+            batch = batch.transpose((0, 3, 1, 2))
+        return batch.astype('float32') / 255
+
+
+class BatchNormalize:
+    """Normalizes an NCHW batch with per channel mean and std, like
+       transforms.Normalize.
+
+       Args:
+            mean: float or list of floats, one per channel
+
+            std: float or list of floats, one per channel
+
+    """
+    def __init__(self, mean=0.0, std=1.0):
+        self.mean = np.asarray(mean, dtype=np.float32).reshape(1, -1, 1, 1)
+        self.std = np.asarray(std, dtype=np.float32).reshape(1, -1, 1, 1)
+
+    def __call__(self, batch):
+        mean = mx.nd.array(self.mean, ctx=batch.context)
+        std = mx.nd.array(self.std, ctx=batch.context)
+        return mx.nd.broadcast_div(mx.nd.broadcast_sub(batch, mean), std)
+
+
+class BatchRandomTransform:
+    """Base of the random batch transforms. Draws per sample factors
+       uniformly from [1 - amount, 1 + amount]."""
+    LUMA = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+    def __init__(self, amount):
+        self.amount = amount
+
+    def factors(self, batch):
+        """(N, 1, 1, 1) NDArray of per sample factors on the batch context"""
+        return mx.nd.random.uniform(1 - self.amount, 1 + self.amount, shape=(batch.shape[0], 1, 1, 1),
+                                    ctx=batch.context)
+
+    def gray(self, batch):
+        """(N, 1, H, W) luma of an RGB NCHW batch"""
+        n, c, h, w = batch.shape
+        # batch_dot over flattened pixels is much faster than summing over
+        # the channel axis
+        luma = mx.nd.array(np.tile(self.LUMA, (n, 1, 1)), ctx=batch.context, dtype=batch.dtype)
+        return mx.nd.batch_dot(luma, batch.reshape((n, c, h * w))).reshape((n, 1, h, w))
+
+    @staticmethod
+    def blend(batch, other, alpha):
+        """alpha * batch + (1 - alpha) * other, broadcasting per sample"""
+        return mx.nd.broadcast_add(mx.nd.broadcast_mul(mx.nd.broadcast_sub(batch, other), alpha), other)
+
+
+class BatchRandomBrightness(BatchRandomTransform):
+    """Per sample transforms.RandomBrightness for an NCHW batch"""
+    def __call__(self, batch):
+        return mx.nd.broadcast_mul(batch, self.factors(batch))
+
+
+class BatchRandomContrast(BatchRandomTransform):
+    """Per sample transforms.RandomContrast for an NCHW batch: blends each
+       image with its mean luma"""
+    def __call__(self, batch):
+        luma = mx.nd.array(self.LUMA.reshape(1, 3, 1, 1), ctx=batch.context)
+        mean = batch.reshape((0, 0, -1)).mean(axis=2).reshape((0, 0, 1, 1))
+        mean = mx.nd.broadcast_mul(mean, luma).sum(axis=1, keepdims=True)
+        return self.blend(batch, mean, self.factors(batch))
+
+
+class BatchRandomSaturation(BatchRandomTransform):
+    """Per sample transforms.RandomSaturation for an NCHW batch: blends
+       each image with its grayscale version"""
+    def __call__(self, batch):
+        return self.blend(batch, self.gray(batch), self.factors(batch))
+
+
+class BatchRandomHue(BatchRandomTransform):
+    """Per sample transforms.RandomHue for an NCHW batch, rotating hue in
+       YIQ space by up to amount * pi"""
+    TYIQ = np.array([[0.299, 0.587, 0.114],
+                     [0.596, -0.274, -0.321],
+                     [0.211, -0.523, 0.311]])
+    ITYIQ = np.array([[1.0, 0.956, 0.621],
+                      [1.0, -0.272, -0.647],
+                      [1.0, -1.107, 1.705]])
+
+    def __call__(self, batch):
+        n, c, h, w = batch.shape
+        alpha = np.random.uniform(-self.amount, self.amount, n) * np.pi
+        cos, sin = np.cos(alpha), np.sin(alpha)
+        rotation = np.zeros((n, 3, 3))
+        rotation[:, 0, 0] = 1
+        rotation[:, 1, 1], rotation[:, 1, 2] = cos, -sin
+        rotation[:, 2, 1], rotation[:, 2, 2] = sin, cos
+        # Per sample RGB -> RGB matrix, applied to the channel axis
+        matrices = mx.nd.array(self.ITYIQ @ rotation @ self.TYIQ, ctx=batch.context, dtype=batch.dtype)
+        return mx.nd.batch_dot(matrices, batch.reshape((n, c, h * w))).reshape((n, c, h, w))
+
+
+class BatchRandomColorJitter(BatchRandomTransform):
+    """Per sample transforms.RandomColorJitter for an NCHW batch. Applies
+       brightness, contrast, saturation and hue jitter, those that are
+       not 0, in an order shuffled for every batch.
+
+       Args:
+            brightness, contrast, saturation, hue: Amounts of jitter
+
+    """
+    def __init__(self, brightness=0, contrast=0, saturation=0, hue=0):
+        super(BatchRandomColorJitter, self).__init__(brightness)
+        self.transforms = [t(amount) for t, amount in ((BatchRandomBrightness, brightness),
+                                                       (BatchRandomContrast, contrast),
+                                                       (BatchRandomSaturation, saturation),
+                                                       (BatchRandomHue, hue)) if amount > 0]
+
+    def __call__(self, batch):
+        for t in random.sample(self.transforms, len(self.transforms)):
+            batch = t(batch)
+        return batch
@@ -0,0 +1,190 @@
+import mxnet as mx
+from mxnet import gluon
+from mxnet.contrib.quantization import quantize_net
+from deep_abyasa.metrics.accuracy import AccuracyMultiLabel
+
+
+class CalibrationBatches:
+    """Re-iterable view over the first num_batches batches of a DataLoader
+       of JsonIndexMultiLabelDataset, yielding (images, labels) pairs as
+       mxnet quantization expects.
+
+       Args:
+            data_loader: DataLoader yielding (images, labels, names)
+
+            num_batches: Number of batches used for calibration
+
+    """
+    def __init__(self, data_loader, num_batches=10):
+        self.data_loader = data_loader
+        self.num_batches = num_batches
+
+    def __iter__(self):
+        for i, batch in enumerate(self.data_loader):
+            if i >= self.num_batches:
+                return
+            yield batch[0].astype('float32'), batch[1]
+
+
+class ModelExport:
+    """Exports trained models to a static symbol graph (-symbol.json and
+    .params) that can be served without building the model in Python,
+    optionally quantized to INT8 for CPU inference.
+
+    Example:
+         ::
+
+            ModelExport.export(net, 'chem')
+            report = ModelExport.export_quantized(net, 'chem-int8', train_dl, test_dl)
+            net = ModelExport.load('chem-int8')
+
+    """
+    @staticmethod
+    def export(net, prefix, epoch=0, data_shape=(1, 3, 300, 300)):
+        """Writes the hybridized net to prefix-symbol.json and
+           prefix-{epoch:04d}.params.
+
+        Args:
+            net: Hybridized gluon model
+
+            prefix: Path prefix of the exported files
+
+            epoch: Epoch number used in the params file name
+
+            data_shape: Shape of a dummy batch run through the net so
+                that its graph is cached before export
+
+        Returns:
+            symbol file and params file paths
+
+        """
+        ctx = list(net.collect_params().values())[0].list_ctx()[0]
+        net(mx.nd.zeros(data_shape, ctx=ctx)).wait_to_read()
+        net.export(prefix, epoch)
+        return f'{prefix}-symbol.json', f'{prefix}-{epoch:04d}.params'
+
+    @staticmethod
+    def load(prefix, epoch=0, ctx=None):
+        """Loads an exported model as a SymbolBlock. Only mxnet is needed,
+           not the model zoo the net was built from.
+
+        Args:
+            prefix: Path prefix given to export
+
+            epoch: Epoch number given to export
+
+            ctx: Context to load the model on. Default is mx.cpu()
+
+        Returns:
+            gluon SymbolBlock
+
+        """
+        ctx = mx.cpu() if ctx is None else ctx
+        return gluon.SymbolBlock.imports(f'{prefix}-symbol.json', ['data'],
+                                         f'{prefix}-{epoch:04d}.params', ctx=ctx)
+
+    @staticmethod
+    def quantize(net, calib_loader, num_calib_batches=10, calib_mode='naive',
+                 quantized_dtype='auto', exclude_layers=None):
+        """Post-training INT8 quantization of a net on CPU. The net's
+           parameters are moved to mx.cpu() for calibration and moved
+           back to their contexts afterwards.
+
+        Args:
+            net: Hybridized gluon model
+
+            calib_loader: DataLoader yielding (images, labels, names),
+                e.g. over a JsonIndexMultiLabelDataset. Its first
+                num_calib_batches batches are used for calibration
+
+            num_calib_batches: Number of batches used for calibration
+
+            calib_mode: 'naive' (min/max) or 'entropy'. See
+                mxnet.contrib.quantization.quantize_net
+
+            quantized_dtype: 'auto', 'int8' or 'uint8'
+
+            exclude_layers: Names of layers to keep in fp32
+
+        Returns:
+            quantized gluon SymbolBlock
+
+        """
+        contexts = {name: p.list_ctx() for name, p in net.collect_params().items()}
+        net.collect_params().reset_ctx(mx.cpu())
+        try:
+            calib_data = CalibrationBatches(calib_loader, num_calib_batches)
+            return quantize_net(net, quantized_dtype=quantized_dtype, exclude_layers=exclude_layers,
+                                calib_data=calib_data, calib_mode=calib_mode, ctx=mx.cpu())
+        finally:
+            for name, p in net.collect_params().items():
+                p.reset_ctx(contexts[name])
+
+    @staticmethod
+    def evaluate(net, data_loader, ctx=None):
+        """Exact match accuracy of net over data_loader with
+           AccuracyMultiLabel, thresholding outputs as TrainingHelpers.test
+           does.
+
+        Args:
+            net: gluon model
+
+            data_loader: DataLoader yielding (images, labels, names)
+
+            ctx: Context of net's parameters. Default is mx.cpu()
+
+        Returns:
+            accuracy
+
+        """
+        ctx = mx.cpu() if ctx is None else ctx
+        metric = AccuracyMultiLabel()
+        for batch in data_loader:
+            outputs = net(batch[0].astype('float32').as_in_context(ctx))
+            metric.update([batch[1].as_in_context(ctx)], [outputs.tanh().ceil().abs()])
+        return metric.get()[1]
+
+    @staticmethod
+    def export_quantized(net, prefix, calib_loader, eval_loader=None, epoch=0,
+                         num_calib_batches=10, calib_mode='naive', exclude_layers=None):
+        """Quantizes net to INT8, exports it and reports accuracy before and
+           after quantization.
+
+        Args:
+            net: Hybridized gluon model
+
+            prefix: Path prefix of the exported files
+
+            calib_loader: DataLoader used for calibration
+
+            eval_loader: DataLoader used to compare accuracy. Skipped
+                if None
+
+            epoch: Epoch number used in the params file name
+
+            num_calib_batches: Number of batches used for calibration
+
+            calib_mode: See quantize
+
+            exclude_layers: See quantize
+
+        Returns:
+            dict with symbol_file, params_file and, if eval_loader is
+            given, fp32_accuracy and int8_accuracy
+
+        """
+        report = {}
+        if eval_loader is not None:
+            ctx = list(net.collect_params().values())[0].list_ctx()[0]
+            report['fp32_accuracy'] = ModelExport.evaluate(net, eval_loader, ctx)
+        quantized = ModelExport.quantize(net, calib_loader, num_calib_batches, calib_mode,
+                                         exclude_layers=exclude_layers)
+        images, _ = next(iter(CalibrationBatches(calib_loader, 1)))
+        quantized(images).wait_to_read()
+        quantized.export(prefix, epoch)
+        report['symbol_file'] = f'{prefix}-symbol.json'
+        report['params_file'] = f'{prefix}-{epoch:04d}.params'
+        if eval_loader is not None:
+            report['int8_accuracy'] = ModelExport.evaluate(quantized, eval_loader)
+            print(f"Accuracy fp32: {report['fp32_accuracy']:.3f} | int8: {report['int8_accuracy']:.3f}")
+        return report
@@ -0,0 +1,100 @@
+import queue
+import threading
+import mxnet as mx
+import numpy as np
+from mxnet import gluon
+
+
+class PrefetchFeeder:
+    """Iterates a DataLoader and splits each batch onto the target contexts
+       with gluon.utils.split_and_load. With depth > 0 this happens on a
+       background thread that keeps up to depth batches staged on their
+       contexts ahead of the consumer, so the copy overlaps the current
+       training step instead of sitting on its critical path.
+
+       Args:
+            data_loader: Iterable of batches, e.g. mxnet DataLoader
+
+            ctx: List of contexts to split batches onto
+
+            depth: Number of batches to stage ahead. 0 splits each batch
+                on the calling thread when it is requested
+
+            even_split: Passed to split_and_load
+
+       Yields:
+            For each batch, a list with one entry per batch element. NDArray
+            and numpy elements become a list of per context shards, other
+            elements (such as lists of labels) are passed through as is.
+
+    """
+    _END = object()
+
+    def __init__(self, data_loader, ctx, depth=2, even_split=False):
+        self.data_loader = data_loader
+        self.ctx = ctx
+        self.depth = depth
+        self.even_split = even_split
+
+    def split(self, batch):
+        """Splits every element of batch onto self.ctx"""
+        return [gluon.utils.split_and_load(b, ctx_list=self.ctx, batch_axis=0, even_split=self.even_split)
+                if isinstance(b, (mx.nd.NDArray, np.ndarray)) else b
+                for b in batch]
+
+    def stage(self, batch):
+        """Splits batch and waits for the copies, so a staged batch is
+           resident on its contexts when it is handed out.
+        """
+        staged = self.split(batch)
+        for shards in staged:
+            if isinstance(shards, list):
+                for shard in shards:
+                    if isinstance(shard, mx.nd.NDArray):
+                        shard.wait_to_read()
+        return staged
+
+    def __iter__(self):
+        if self.depth <= 0:
+            for batch in self.data_loader:
+                yield self.split(batch)
+            return
+
+        staged = queue.Queue(maxsize=self.depth)
+        stop = threading.Event()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    staged.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    pass
+
+        def produce():
+            try:
+                for batch in self.data_loader:
+                    if stop.is_set():
+                        return
+                    put(self.stage(batch))
+            except Exception as e:
+                put(e)
+            finally:
+                put(self._END)
+
+        thread = threading.Thread(target=produce, daemon=True)
+        thread.start()
+        try:
+            while True:
+                item = staged.get()
+                if item is self._END:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+            thread.join()
+
+    def __len__(self):
+        return len(self.data_loader)
@@ -0,0 +1,178 @@
+import time
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import mxnet as mx
+from deep_abyasa.helpers.custom_exceptions import CustomException
+
+
+class BatchPredictor:
+    """Labels many images with a trained multi-label model. Images are
+       decoded in parallel on a thread pool, grouped into fixed-size
+       batches and run through the (hybridized) model once per batch.
+       Short batches are padded to batch_size, so a hybridized model keeps
+       a single cached graph.
+
+       Example:
+           ::
+
+               predictor = BatchPredictor(net, itol, transform=transform_test)
+               for name, labels in predictor.predict(glob.glob('images/*.png')):
+                   print(name, labels)
+
+       Args:
+            model: Trained gluon model
+
+            itol: dict of int to label
+
+            transform: mxnet Transformations to be applied on images
+
+            batch_size: Number of images per forward pass
+
+            max_wait: Seconds to wait for more images before running a
+                batch that is not full. Bounds latency when paths arrive
+                slowly, e.g. from a queue
+
+            num_workers: Number of threads decoding images
+
+            ctx: Context to run the model on. Default is mx.cpu()
+
+            batch_transform: Deterministic batch transform applied to
+                each batch on ctx, e.g. the BatchCompose.deterministic()
+                of the batch_transform a model was trained with. Without
+                transform, images are then laid out as the datasets
+                return them, reshaped to (C, H, W), so that the same
+                transform applies
+
+            close_timeout: Seconds to wait for the thread reading paths
+                when the predict generator is closed early. If paths
+                blocks (e.g. reads from a queue) the thread is left
+                behind, as a daemon, once this passes
+
+    """
+    _END = object()
+
+    def __init__(self, model, itol, transform=None, batch_size=32, max_wait=0.1,
+                 num_workers=4, ctx=None, batch_transform=None, close_timeout=1.0):
+        self.model = model
+        self.itol = itol
+        self.transform = transform
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.num_workers = num_workers
+        self.ctx = mx.cpu() if ctx is None else ctx
+        self.batch_transform = batch_transform
+        self.close_timeout = close_timeout
+
+    def load(self, path):
+        """Decodes and transforms one image"""
+        image = mx.image.imread(path)
+        if self.transform is not None:
+            image = self.transform(image)
+        elif self.batch_transform is not None:
+            image = image.reshape(image.shape[2], image.shape[0], -1)
+        return image
+
+    def predict(self, paths):
+        """Predicts labels for every path.
+
+        Args:
+            paths: Iterable of image paths. It is consumed lazily
+
+        Yields:
+            (path, list of labels) in the order of paths
+
+        """
+        pending = queue.Queue(maxsize=2 * self.batch_size)
+        stop = threading.Event()
+
+        with ThreadPoolExecutor(self.num_workers) as executor:
+            def produce():
+                try:
+                    for path in paths:
+                        if stop.is_set():
+                            return
+                        pending.put((path, executor.submit(self.load, path)))
+                except Exception as e:
+                    pending.put((None, e))
+                finally:
+                    if stop.is_set():
+                        # Nobody may be reading anymore
+                        try:
+                            pending.put_nowait((self._END, None))
+                        except queue.Full:
+                            pass
+                    else:
+                        pending.put((self._END, None))
+
+            thread = threading.Thread(target=produce, daemon=True)
+            thread.start()
+            try:
+                batch, deadline = [], None
+                while True:
+                    timeout = None if not batch else max(0, deadline - time.monotonic())
+                    try:
+                        path, item = pending.get(timeout=timeout)
+                    except queue.Empty:
+                        yield from self.run_batch(batch)
+                        batch = []
+                        continue
+                    if path is self._END:
+                        break
+                    if isinstance(item, Exception):
+                        raise item
+                    batch.append((path, item))
+                    if len(batch) == 1:
+                        deadline = time.monotonic() + self.max_wait
+                    if len(batch) == self.batch_size:
+                        yield from self.run_batch(batch)
+                        batch = []
+                yield from self.run_batch(batch)
+            finally:
+                stop.set()
+                deadline = time.monotonic() + self.close_timeout
+                while thread.is_alive() and time.monotonic() < deadline:
+                    try:
+                        pending.get(timeout=0.1)
+                    except queue.Empty:
+                        pass
+
+    def run_batch(self, batch):
+        """Runs one padded forward pass over a list of (path, future)
+
+        Yields:
+            (path, list of labels)
+
+        """
+        if not batch:
+            return
+        images = [future.result() for _, future in batch]
+        for (path, _), labels in zip(batch, self.forward(images, [path for path, _ in batch])):
+            yield path, labels
+
+    def forward(self, images, names=None):
+        """Runs one forward pass over up to batch_size decoded images,
+           padding the batch to batch_size.
+
+        Args:
+            images: list of transformed images of the same shape
+
+            names: Names of the images, used in error messages
+
+        Returns:
+            list of label lists, one per image
+
+        """
+        names = list(range(len(images))) if names is None else names
+        data = mx.nd.zeros((self.batch_size,) + images[0].shape, ctx=self.ctx, dtype='float32')
+        for i, image in enumerate(images):
+            if image.shape != images[0].shape:
+                print(f'Image {names[i]} has shape {image.shape}, expected {images[0].shape}. '
+                      f'Use a transform that resizes images')
+                raise CustomException
+            data[i] = image.astype('float32').as_in_context(self.ctx)
+        if self.batch_transform is not None:
+            data = self.batch_transform(data)
+        preds = self.model(data)[:len(images)].reshape((len(images), -1)).asnumpy()
+        return [[self.itol[i] for i in np.flatnonzero(pred > 0)] for pred in preds]
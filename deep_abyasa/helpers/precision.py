@@ -0,0 +1,160 @@
+import mxnet as mx
+from mxnet import autograd as ag
+from deep_abyasa.helpers.custom_exceptions import CustomException
+
+
+class MixedPrecision:
+    """Casting helpers for mixed precision training with
+       TrainingHelpers.train.
+
+       ``float16`` casts the model with net.cast. Gluon keeps BatchNorm
+       in float32, the optimizer keeps float32 master weights
+       (multi_precision) and train scales the loss dynamically, see
+       DynamicLossScaler. MXNet has no float16 GEMM on CPU, so float16
+       is for GPUs.
+
+       ``bfloat16`` converts the model with mxnet.contrib.amp, which
+       inserts casts so that convolutions and dense layers run in
+       bfloat16 while parameters stay float32. bfloat16 has the range of
+       float32, so no loss scaling is needed. It needs MXNet built with
+       oneDNN and runs on CPU.
+
+       Example:
+           ::
+
+               net = TrainingHelpers.get_model('resnet50_v1', ctx, len(ltoi), dtype='float16')
+               trainer = gluon.Trainer(net.collect_params(), 'sgd',
+                                       {'learning_rate': 0.01, 'multi_precision': True})
+               TrainingHelpers.train(train_dl, test_dl, net, trainer, loss, dtype='float16')
+
+    """
+    DTYPES = ('float32', 'float16', 'bfloat16')
+
+    @staticmethod
+    def validate(dtype):
+        if dtype not in MixedPrecision.DTYPES:
+            print(f'dtype must be one of {MixedPrecision.DTYPES}, got {dtype}')
+            raise CustomException
+        return dtype
+
+    @staticmethod
+    def input_dtype(dtype):
+        """dtype model inputs are cast to. bfloat16 models cast inputs
+           themselves and take float32"""
+        return 'float16' if MixedPrecision.validate(dtype) == 'float16' else 'float32'
+
+    @staticmethod
+    def cast(net, dtype, ctx, data_shape=(1, 3, 300, 300)):
+        """Casts a hybridized net to dtype.
+
+        Args:
+            net: Hybridized gluon model with initialized parameters
+
+            dtype: 'float32', 'float16' or 'bfloat16'
+
+            ctx: Context or list of contexts of the parameters
+
+            data_shape: Shape of a dummy batch run through the net, as
+                bfloat16 conversion needs its cached graph
+
+        Returns:
+            net, or for bfloat16 a converted SymbolBlock
+
+        """
+        MixedPrecision.validate(dtype)
+        ctx = ctx if isinstance(ctx, (list, tuple)) else [ctx]
+        if dtype == 'float16':
+            net.cast('float16')
+        elif dtype == 'bfloat16':
+            from mxnet.contrib import amp
+            net(mx.nd.zeros(data_shape, ctx=ctx[0])).wait_to_read()
+            net = amp.convert_hybrid_block(net, target_dtype='bfloat16', ctx=ctx[0])
+            net.collect_params().reset_ctx(ctx)
+        return net
+
+    @staticmethod
+    def master_weights(trainer):
+        """Makes the optimizer keep float32 copies of float16 weights.
+           Must be called before the first trainer.step"""
+        if not trainer.optimizer.multi_precision:
+            print('Setting multi_precision on the optimizer to keep float32 master weights')
+            trainer.optimizer.multi_precision = True
+
+
+class DynamicLossScaler:
+    """Dynamic loss scaling for float16 training. Losses are multiplied
+       by scale before backward so that small gradients don't underflow
+       in float16, and the step divides gradients by it again. Steps with
+       inf or nan gradients are skipped and halve the scale; every window
+       steps without overflow double it.
+
+       Example:
+           ::
+
+               scaler = DynamicLossScaler()
+               with ag.record():
+                   loss = [loss_func(net(X), y) for X, y in zip(data, label)]
+                   scaled = scaler.scale_loss(loss)
+               for l in scaled:
+                   l.backward()
+               scaler.step(trainer, net.collect_params().values(), batch_size)
+
+       Args:
+            init_scale: Initial scale
+
+            factor: Scale is divided by factor on overflow and multiplied
+                by it after window good steps
+
+            window: Number of steps without overflow before the scale
+                grows
+
+            max_scale: Upper bound of the scale
+
+    """
+    def __init__(self, init_scale=2.**15, factor=2., window=2000, max_scale=2.**24):
+        self.scale = init_scale
+        self.factor = factor
+        self.window = window
+        self.max_scale = max_scale
+        self.good_steps = 0
+        self.skipped = 0
+
+    def scale_loss(self, losses):
+        """Returns the losses multiplied by scale"""
+        return [l * self.scale for l in losses]
+
+    @staticmethod
+    def has_overflow(params):
+        """True if any gradient of params, on any context, is inf or nan"""
+        grads = [g for p in params if p.grad_req != 'null' for g in p.list_grad()]
+        with ag.pause():
+            finite = [mx.nd.multi_all_finite(*grads[i:i + 200], num_arrays=len(grads[i:i + 200]))
+                      .as_in_context(mx.cpu()) for i in range(0, len(grads), 200)]
+        return not all(f.asscalar() for f in finite)
+
+    def step(self, trainer, params, batch_size):
+        """trainer.step with gradients unscaled, unless they overflowed.
+
+        Args:
+            trainer: gluon Trainer
+
+            params: Parameters checked for overflow, e.g.
+                net.collect_params().values()
+
+            batch_size: Batch size passed to trainer.step
+
+        Returns:
+            True if the step was taken
+
+        """
+        if self.has_overflow(params):
+            self.scale = self.scale / self.factor
+            self.good_steps = 0
+            self.skipped += 1
+            return False
+        trainer.step(batch_size * self.scale)
+        self.good_steps += 1
+        if self.good_steps == self.window:
+            self.scale = min(self.scale * self.factor, self.max_scale)
+            self.good_steps = 0
+        return True
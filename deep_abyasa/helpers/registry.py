@@ -0,0 +1,102 @@
+import os
+import threading
+from collections import OrderedDict
+import mxnet as mx
+from deep_abyasa.helpers.training import TrainingHelpers
+
+
+class ModelRegistry:
+    """Keeps loaded models so that repeated predictions don't rebuild them.
+       A model is built once per (model_name, model_param, out_len, ctx,
+       pretrained), that is per set of builder arguments, with TrainingHelpers.get_model, warmed up with a dummy batch so the
+       hybridized graph is cached, and reused afterwards. When more than
+       max_models are loaded, the least recently used one is evicted.
+
+       Example:
+           ::
+
+               registry = ModelRegistry(max_models=2)
+               net = registry.get('ResNet18_v2', len(itol), model_param='net.params')
+               TrainingHelpers.predict(net, root, '8288.png', itol)
+
+       Args:
+            max_models: Maximum number of models kept loaded
+
+            warmup_shape: Shape of the dummy batch run through a new
+                model. None skips the warm up
+
+            builder: Function with the signature of
+                TrainingHelpers.get_model used to build models
+
+    """
+    def __init__(self, max_models=4, warmup_shape=(1, 3, 300, 300), builder=None):
+        self.max_models = max_models
+        self.warmup_shape = warmup_shape
+        self.builder = TrainingHelpers.get_model if builder is None else builder
+        self._models = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(model_name, out_len, model_param, ctx, pretrained=True):
+        """Key of a model in the registry. Covers everything passed to the
+           builder"""
+        ctx = ctx if isinstance(ctx, (list, tuple)) else [ctx]
+        param = None if model_param is None else os.path.abspath(model_param)
+        return model_name, param, out_len, tuple(str(c) for c in ctx), bool(pretrained)
+
+    def get(self, model_name, out_len, model_param=None, ctx=None, pretrained=True):
+        """Returns the model for the given settings, building it if it is
+           not loaded yet.
+
+        Args:
+            model_name: gluoncv model zoo name
+
+            out_len: Number of outputs (labels)
+
+            model_param: Parameter file to load. If None, the output
+                layer is freshly initialized
+
+            ctx: Context or list of contexts. Default is mx.cpu()
+
+            pretrained: Passed to the builder
+
+        Returns:
+            hybridized model
+
+        """
+        ctx = mx.cpu() if ctx is None else ctx
+        key = self.make_key(model_name, out_len, model_param, ctx, pretrained)
+        with self._lock:
+            if key in self._models:
+                self._models.move_to_end(key)
+                return self._models[key]
+            net = self.builder(model_name, ctx, out_len, pretrained=pretrained, model_param=model_param)
+            if self.warmup_shape is not None:
+                first_ctx = ctx[0] if isinstance(ctx, (list, tuple)) else ctx
+                net(mx.nd.zeros(self.warmup_shape, ctx=first_ctx)).wait_to_read()
+            self._models[key] = net
+            while len(self._models) > self.max_models:
+                self._models.popitem(last=False)
+            return net
+
+    def evict(self, model_name, out_len, model_param=None, ctx=None, pretrained=True):
+        """Removes a model from the registry. Arguments as for get.
+
+        Returns:
+            True if the model was loaded
+
+        """
+        key = self.make_key(model_name, out_len, model_param, mx.cpu() if ctx is None else ctx, pretrained)
+        with self._lock:
+            return self._models.pop(key, None) is not None
+
+    def clear(self):
+        """Removes all models"""
+        with self._lock:
+            self._models.clear()
+
+    def __contains__(self, key):
+        return key in self._models
+
+    def __len__(self):
+        return len(self._models)
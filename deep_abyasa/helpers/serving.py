@@ -0,0 +1,266 @@
+import sys
+import json
+import time
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import mxnet as mx
+from mxnet.gluon.data.vision import transforms
+from deep_abyasa.helpers.inference import BatchPredictor
+from deep_abyasa.helpers.training import TrainingHelpers
+
+
+class Histogram:
+    """Cumulative histogram with fixed buckets, e.g. of latencies in
+       milliseconds.
+
+       Args:
+            bounds: Upper bounds of the buckets. A last, open ended bucket
+                catches everything above
+
+    """
+    def __init__(self, bounds=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)):
+        self.bounds = list(bounds)
+        self.counts = np.zeros(len(self.bounds) + 1, dtype=np.int64)
+        self.total = 0.0
+
+    def observe(self, value):
+        """Records one value"""
+        self.counts[np.searchsorted(self.bounds, value)] += 1
+        self.total += value
+
+    def snapshot(self):
+        """Returns the histogram as a json serializable dict"""
+        count = int(self.counts.sum())
+        return {'bounds': self.bounds + ['inf'],
+                'counts': self.counts.tolist(),
+                'count': count,
+                'mean': self.total / count if count else None}
+
+
+class MicroBatchServer:
+    """Local HTTP inference server that coalesces concurrent requests into
+       micro-batches. A request waits at most max_latency seconds for other
+       requests to join its batch; a batch runs as soon as it is full.
+       Batches run on a worker thread through BatchPredictor.forward, so
+       the event loop keeps accepting requests meanwhile.
+
+       Endpoints:
+           ``POST /predict`` with the encoded image as body returns
+           ``{"labels": [...]}``. ``GET /metrics`` returns request latency
+           and batch size histograms. ``GET /health`` returns
+           ``{"status": "ok"}``.
+
+       Args:
+            model: Trained gluon model
+
+            itol: dict of int to label
+
+            transform: mxnet Transformations to be applied on images
+
+            max_batch_size: Maximum number of requests in a batch
+
+            max_latency: Seconds the first request of a batch waits for
+                more requests
+
+            ctx: Context to run the model on. Default is mx.cpu()
+
+    """
+    def __init__(self, model, itol, transform=None, max_batch_size=16, max_latency=0.01, ctx=None):
+        self.predictor = BatchPredictor(model, itol, transform=transform, batch_size=max_batch_size, ctx=ctx)
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.request_latency = Histogram()
+        self.batch_latency = Histogram()
+        self.batch_sizes = Histogram(bounds=range(1, max_batch_size + 1))
+        self._executor = ThreadPoolExecutor(1)
+        self._queue = None
+        self._batcher = None
+
+    def decode(self, image_bytes):
+        """Decodes and transforms one request body. Raises ValueError
+           if the result is not a single image"""
+        image = mx.image.imdecode(image_bytes)
+        if self.predictor.transform is not None:
+            image = self.predictor.transform(image)
+        if not isinstance(image, mx.nd.NDArray) or image.ndim != 3:
+            raise ValueError(f'expected an image of 3 dimensions, got {getattr(image, "shape", type(image))}')
+        return image
+
+    async def predict(self, image):
+        """Queues a decoded image for the next batch and waits for its labels"""
+        result = asyncio.get_running_loop().create_future()
+        await self._queue.put((image, result))
+        return await result
+
+    async def batch_loop(self):
+        """Collects queued requests into batches and runs them. Requests
+           are grouped by image shape, so an image of an odd shape only
+           fails its own group, and any error fails the requests of the
+           batch instead of stopping the loop.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_latency
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                groups = {}
+                for image, result in batch:
+                    groups.setdefault(image.shape, []).append((image, result))
+                for group in groups.values():
+                    await self.run_batch(group)
+            except Exception as e:
+                self.fail(batch, e)
+
+    async def run_batch(self, batch):
+        """Runs one forward pass over a batch of same shaped images and
+           resolves their futures"""
+        started = time.monotonic()
+        try:
+            labels = await asyncio.get_running_loop().run_in_executor(
+                self._executor, self.predictor.forward, [image for image, _ in batch])
+        except Exception as e:
+            self.fail(batch, e)
+            return
+        self.batch_latency.observe((time.monotonic() - started) * 1000)
+        self.batch_sizes.observe(len(batch))
+        for (_, result), l in zip(batch, labels):
+            if not result.done():
+                result.set_result(l)
+
+    @staticmethod
+    def fail(batch, error):
+        """Sets error on the futures of batch that are not resolved yet"""
+        for _, result in batch:
+            if not result.done():
+                result.set_exception(error)
+
+    def metrics(self):
+        """Latency histograms in milliseconds and the batch size histogram"""
+        return {'request_latency_ms': self.request_latency.snapshot(),
+                'batch_latency_ms': self.batch_latency.snapshot(),
+                'batch_size': self.batch_sizes.snapshot()}
+
+    async def handle(self, reader, writer):
+        """Serves HTTP/1.1 requests of one connection"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, path, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+                status, payload = await self.route(method, path, body)
+                data = json.dumps(payload).encode('utf-8')
+                writer.write(f'HTTP/1.1 {status}\r\nContent-Type: application/json\r\n'
+                             f'Content-Length: {len(data)}\r\n\r\n'.encode('latin-1') + data)
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (asyncio.IncompleteReadError, ConnectionResetError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def route(self, method, path, body):
+        """Dispatches a request. Returns status line and json payload"""
+        if method == 'POST' and path == '/predict':
+            started = time.monotonic()
+            try:
+                image = await asyncio.get_running_loop().run_in_executor(None, self.decode, body)
+            except Exception as e:
+                return '400 Bad Request', {'error': f'Could not decode image: {e}'}
+            try:
+                labels = await self.predict(image)
+            except Exception as e:
+                return '500 Internal Server Error', {'error': str(e)}
+            self.request_latency.observe((time.monotonic() - started) * 1000)
+            return '200 OK', {'labels': labels}
+        if method == 'GET' and path == '/metrics':
+            return '200 OK', self.metrics()
+        if method == 'GET' and path == '/health':
+            return '200 OK', {'status': 'ok'}
+        return '404 Not Found', {'error': f'{method} {path} not found'}
+
+    async def start(self, host='127.0.0.1', port=8080):
+        """Starts serving in the running event loop.
+
+        Returns:
+            asyncio Server. Its sockets give the bound port when port is 0
+
+        """
+        self._queue = asyncio.Queue()
+        self._batcher = asyncio.ensure_future(self.batch_loop())
+        return await asyncio.start_server(self.handle, host, port)
+
+    async def stop(self, server):
+        """Stops a server returned by start"""
+        server.close()
+        await server.wait_closed()
+        self._batcher.cancel()
+
+    async def serve(self, host='127.0.0.1', port=8080):
+        """Serves until cancelled"""
+        server = await self.start(host, port)
+        print(f'Serving on http://{host}:{server.sockets[0].getsockname()[1]}')
+        try:
+            await server.serve_forever()
+        finally:
+            await self.stop(server)
+
+
+def main(argv=None):
+    """Command line entry point::
+
+        python -m deep_abyasa.helpers.serving --model ResNet18_v2 \\
+            --params net.params --labels labels.json
+
+    labels.json holds the labels in itol order, as a list or as a dict of
+    int to label. Nothing is downloaded; the model is built without
+    pretrained weights and loaded from --params.
+    """
+    parser = argparse.ArgumentParser(description='Micro-batching inference server')
+    parser.add_argument('--model', required=True, help='gluoncv model zoo name')
+    parser.add_argument('--params', required=True, help='parameter file saved by TrainingHelpers.save_model')
+    parser.add_argument('--labels', required=True, help='json list of labels, or dict of int to label')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--max-batch-size', type=int, default=16)
+    parser.add_argument('--max-latency-ms', type=float, default=10)
+    parser.add_argument('--resize', type=int, default=300, help='images are resized to this size')
+    parser.add_argument('--num-gpus', type=int, default=-1)
+    args = parser.parse_args(argv)
+
+    with open(args.labels) as f:
+        labels = json.load(f)
+    itol = dict(enumerate(labels)) if isinstance(labels, list) else {int(k): v for k, v in labels.items()}
+    ctx = TrainingHelpers.get_ctx(args.num_gpus)[0]
+    model = TrainingHelpers.get_model(args.model, ctx, len(itol), pretrained=False, model_param=args.params)
+    transform = transforms.Compose([transforms.Resize(args.resize), transforms.ToTensor(),
+                                    transforms.Normalize(0, 1)])
+    server = MicroBatchServer(model, itol, transform=transform, max_batch_size=args.max_batch_size,
+                              max_latency=args.max_latency_ms / 1000, ctx=ctx)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    sys.exit(main())
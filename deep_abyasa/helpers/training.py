@@ -1,6 +1,7 @@
 import time
 import os
 import json
+import weakref
 from tqdm import tqdm
 import numpy as np
 import mxnet as mx
@@ -8,84 +9,191 @@ from mxnet import autograd as ag
 from mxnet.gluon import nn
 from mxnet import gluon, init
 from gluoncv.model_zoo import get_model
-from deep_abyasa import AccuracyMultiLabel
+from deep_abyasa.metrics.accuracy import AccuracyMultiLabel
+from deep_abyasa.helpers.feeder import PrefetchFeeder
+from deep_abyasa.helpers.inference import BatchPredictor
+from deep_abyasa.helpers.precision import MixedPrecision, DynamicLossScaler
+from deep_abyasa.helpers.augment import BatchCompose
+from deep_abyasa.helpers.custom_exceptions import CustomException
 
 
 class TrainingHelpers:
+    ctx_cache = {}
+    # trainer -> effective batch size its learning rate is scaled for
+    lr_scaled_for = weakref.WeakKeyDictionary()
+
     @staticmethod
     def train(train_dl, test_dl, model, trainer,
               loss_func, epochs=20, lr_factor=0.75,
               lr_steps=[10, 20, 30, np.inf],
-              metric=AccuracyMultiLabel(), num_gpus=-1):
+              metric=AccuracyMultiLabel(), num_gpus=-1, prefetch=0,
+              deferred_sync=False, log_interval=None, batch_transform=None,
+              test_batch_transform=None, dtype='float32', loss_scaler=None,
+              accumulate=1, base_batch_size=None):
 
         ctx = TrainingHelpers.get_ctx(num_gpus)
+        test_batch_transform = TrainingHelpers.test_transform_for(batch_transform, test_batch_transform)
+        input_dtype = MixedPrecision.input_dtype(dtype)
+        if dtype == 'float16':
+            MixedPrecision.master_weights(trainer)
+            loss_scaler = DynamicLossScaler() if loss_scaler is None else loss_scaler
+        params = list(model.collect_params().values())
+        grad_reqs = {p.name: p.grad_req for p in params}
+        if accumulate > 1:
+            TrainingHelpers.set_grad_req(params, 'add')
+            model.collect_params().zero_grad()
         lr_counter = 0
-        num_batch = len(train_dl)
         metric.pred_status = {}
+        update_metric = metric.update_deferred if deferred_sync else metric.update
+        record_incorrect = metric.get_incorrect_preds_deferred if deferred_sync else metric.get_incorrect_preds
+
+        try:
+            for epoch in range(epochs):
+                if epoch == lr_steps[lr_counter]:
+                    trainer.set_learning_rate(trainer.learning_rate * lr_factor)
+                    lr_counter += 1
+                    print(f'Learning rate is now set to: {trainer.learning_rate}')
+
+                tic = time.time()
+                train_loss = 0
+                num_batch = 0
+                samples = 0
+                metric.reset()
+
+                for i, (data, label, names) in tqdm(enumerate(PrefetchFeeder(train_dl, ctx, depth=prefetch))):
+
+                    # print(f"names: {names}")
+                    if batch_transform is not None:
+                        data = [batch_transform(X) for X in data]
+                    with ag.record():
+                        outputs = [model(X.astype(input_dtype, copy=False)).astype('float32', copy=False)
+                                   for X in data]
+                        loss = [loss_func(yhat, y) for yhat, y in zip(outputs, label)]
+                        scaled = loss if loss_scaler is None else loss_scaler.scale_loss(loss)
+                    for l in scaled:
+                        l.backward()
+                    # Global batch size, summed over the (possibly uneven) shards
+                    samples += sum(X.shape[0] for X in data)
+                    if base_batch_size is not None and epoch == 0 and i == 0:
+                        TrainingHelpers.scale_learning_rate(trainer, samples * accumulate, base_batch_size)
+                    if (i + 1) % accumulate == 0:
+                        TrainingHelpers.step(trainer, samples, model, loss_scaler, accumulate)
+                        samples = 0
+                    batch_loss = sum([l.mean().astype('float64').as_in_context(ctx[0]) for l in loss]) / len(loss)
+                    train_loss += batch_loss if deferred_sync else batch_loss.asscalar()
+                    num_batch += 1
+                    outs = [o.tanh().ceil().abs() for o in outputs]
+                    update_metric(label, outs)
+                    if epoch == (epochs - 1):
+                        record_incorrect(label, outs, names)
+                    if log_interval and (i + 1) % log_interval == 0:
+                        print('[Epoch %d Batch %d] Train-acc: %.3f, loss: %.3f' %
+                              (epoch, i + 1, metric.get()[1], TrainingHelpers.as_scalar(train_loss) / (i + 1)))
+
+                if samples:
+                    # Micro-batches left over at the end of the epoch
+                    TrainingHelpers.step(trainer, samples, model, loss_scaler, accumulate)
+
+                _, train_acc = metric.get()
+                train_loss = TrainingHelpers.as_scalar(train_loss) / max(num_batch, 1)
+                _, val_acc = TrainingHelpers.test(test_dl, model, metric=metric, num_gpus=num_gpus,
+                                                  batch_transform=test_batch_transform, dtype=dtype)
+
+                print('[Epoch %d] Train-acc: %.3f, loss: %.3f | Val-acc: %.3f | time: %.1f' %
+                      (epoch, train_acc, train_loss, val_acc, time.time() - tic))
+        finally:
+            # Leave the parameters as they were, also when training fails
+            TrainingHelpers.set_grad_req(params, grad_reqs)
+            model.collect_params().zero_grad()
+        return metric.pred_status
 
-        for epoch in range(epochs):
-            if epoch == lr_steps[lr_counter]:
-                trainer.set_learning_rate(trainer.learning_rate * lr_factor)
-                lr_counter += 1
-                print(f'Learning rate is now set to: {trainer.learning_rate}')
-
-            tic = time.time()
-            train_loss = 0
-            metric.reset()
-
-            for i, batch in tqdm(enumerate(train_dl)):
-                data = gluon.utils.split_and_load(batch[0], ctx_list=ctx, batch_axis=0, even_split=False)
-                label = gluon.utils.split_and_load(batch[1], ctx_list=ctx, batch_axis=0, even_split=False)
-                names = gluon.utils.split_and_load(batch[2], ctx_list=ctx, batch_axis=0, even_split=False)
-
-                # print(f"names: {names}")
-                with ag.record():
-                    outputs = [model(X.astype('float32')) for X in data]
-                    loss = [loss_func(yhat, y) for yhat, y in zip(outputs, label)]
-                for l in loss:
-                    l.backward()
-                trainer.step(data[0].shape[0])
-                train_loss += sum([l.mean().asscalar() for l in loss]) / len(loss)
-                outs = [o.tanh().ceil().abs() for o in outputs]
-                metric.update(label, outs)
-                if epoch == (epochs - 1):
-                    metric.get_incorrect_preds(label, outs, names)
-
-            _, train_acc = metric.get()
-            train_loss /= num_batch
-            _, val_acc = TrainingHelpers.test(test_dl, model, metric=metric, num_gpus=num_gpus)
-
-            print('[Epoch %d] Train-acc: %.3f, loss: %.3f | Val-acc: %.3f | time: %.1f' %
-                  (epoch, train_acc, train_loss, val_acc, time.time() - tic))
+    @staticmethod
+    def test_transform_for(batch_transform, test_batch_transform):
+        """Batch transform for validation. Defaults to the deterministic
+           part of a BatchCompose batch_transform, so the model isn't
+           validated on differently prepared batches than it was trained
+           on"""
+        if batch_transform is None or test_batch_transform is not None:
+            return test_batch_transform
+        if isinstance(batch_transform, BatchCompose):
+            return batch_transform.deterministic()
+        print('test_batch_transform must be given with a batch_transform that is not a BatchCompose')
+        raise CustomException
 
-        return metric.pred_status
+    @staticmethod
+    def step(trainer, batch_size, model, loss_scaler=None, accumulate=1):
+        """Updates the parameters with gradients summed over batch_size
+           samples, then clears accumulated gradients"""
+        params = model.collect_params()
+        if loss_scaler is None:
+            trainer.step(batch_size)
+        else:
+            loss_scaler.step(trainer, params.values(), batch_size)
+        if accumulate > 1:
+            params.zero_grad()
+
+    @staticmethod
+    def set_grad_req(params, grad_req):
+        """Sets grad_req of trainable params to grad_req, or, if it is a
+           dict, to grad_req[param.name]"""
+        for p in params:
+            if p.grad_req != 'null':
+                p.grad_req = grad_req[p.name] if isinstance(grad_req, dict) else grad_req
+
+    @staticmethod
+    def scale_learning_rate(trainer, batch_size, base_batch_size):
+        """Linear scaling rule: multiplies the learning rate by
+           batch_size / base_batch_size, where the learning rate was tuned
+           for base_batch_size. Applied once per trainer, so training the
+           same trainer again (e.g. on a retrain set) doesn't compound it;
+           a different batch_size rescales from the previous one"""
+        scaled_for = TrainingHelpers.lr_scaled_for.get(trainer, base_batch_size)
+        if scaled_for == batch_size:
+            return
+        TrainingHelpers.lr_scaled_for[trainer] = batch_size
+        trainer.set_learning_rate(trainer.learning_rate * batch_size / scaled_for)
+        print(f'Learning rate scaled for effective batch size {batch_size} to: {trainer.learning_rate}')
+
+    @staticmethod
+    def as_scalar(value):
+        return value.asscalar() if isinstance(value, mx.nd.NDArray) else value
 
     @staticmethod
     def get_ctx(num_gpus):
-        return [mx.gpu(i) for i in range(num_gpus)] if num_gpus > 0 else [mx.cpu()]
+        if num_gpus not in TrainingHelpers.ctx_cache:
+            TrainingHelpers.ctx_cache[num_gpus] = [mx.gpu(i) for i in range(num_gpus)] if num_gpus > 0 else [mx.cpu()]
+        return list(TrainingHelpers.ctx_cache[num_gpus])
 
 
     @staticmethod
-    def test(data_loader, model, metric=AccuracyMultiLabel(), num_gpus=-1):
+    def test(data_loader, model, metric=AccuracyMultiLabel(), num_gpus=-1, batch_transform=None,
+             dtype='float32'):
         ctx = TrainingHelpers.get_ctx(num_gpus)
+        input_dtype = MixedPrecision.input_dtype(dtype)
         metric.reset()
         for i, batch in enumerate(data_loader):
-            data = gluon.utils.split_and_load(batch[0], ctx_list=ctx, batch_axis=0)
-            label = gluon.utils.split_and_load(batch[1], ctx_list=ctx, batch_axis=0)
-            outputs = [model(X) for X in data]
+            data = gluon.utils.split_and_load(batch[0], ctx_list=ctx, batch_axis=0, even_split=False)
+            if batch_transform is not None:
+                data = [batch_transform(X) for X in data]
+            label = gluon.utils.split_and_load(batch[1], ctx_list=ctx, batch_axis=0, even_split=False)
+            outputs = [model(X.astype(input_dtype, copy=False)).astype('float32', copy=False) for X in data]
             outs = [o.tanh().ceil().abs() for o in outputs]
             metric.update(label, outs)
         return metric.get()
 
     @staticmethod
-    def predict(model, root, file, itol, transform=None, num_gpus=-1):
-        ctx = [mx.gpu(i) for i in range(num_gpus)] if num_gpus > 0 else [mx.cpu()]
-        image = mx.image.imread(os.path.join(root, file))
-        if transform is not None:
-            image = transform(image)
-        preds = model(image.expand_dims(axis=0).as_in_context(ctx[0]))
-        a, b = np.maximum(preds.flatten().asnumpy(), 0).nonzero()
-        return [itol[i] for i in b]
+    def predict(model, root, file, itol, transform=None, num_gpus=-1, batch_transform=None):
+        predictor = BatchPredictor(model, itol, transform=transform, batch_size=1, num_workers=1,
+                                   ctx=TrainingHelpers.get_ctx(num_gpus)[0], batch_transform=batch_transform)
+        return list(predictor.predict([os.path.join(root, file)]))[0][1]
+
+    @staticmethod
+    def predict_many(model, paths, itol, transform=None, num_gpus=-1, batch_size=32,
+                     max_wait=0.1, num_workers=4, batch_transform=None):
+        predictor = BatchPredictor(model, itol, transform=transform, batch_size=batch_size,
+                                   max_wait=max_wait, num_workers=num_workers,
+                                   ctx=TrainingHelpers.get_ctx(num_gpus)[0], batch_transform=batch_transform)
+        return predictor.predict(paths)
 
     @staticmethod
     def save_model(model, file_name):
@@ -105,15 +213,16 @@ class TrainingHelpers:
         json.dump(item, open('chem_retrain.json', 'w'))
 
     @staticmethod
-    def get_model(model_name, ctx, out_len, pretrained=True, model_param=None):
+    def get_model(model_name, ctx, out_len, pretrained=True, model_param=None, dtype='float32',
+                  data_shape=(1, 3, 300, 300)):
         net = get_model(model_name, pretrained=pretrained)
         with net.name_scope():
             net.output = nn.Dense(out_len)
         if model_param is None:
-            net.output.initialize(init.Xavier(), ctx=ctx)
+            (net.output if pretrained else net).initialize(init.Xavier(), ctx=ctx)
         else:
             net.load_parameters(model_param)
         net.collect_params().reset_ctx(ctx)
         net.hybridize()
-        return net
+        return MixedPrecision.cast(net, dtype, ctx, data_shape)
 
@@ -1,5 +1,6 @@
 import os
 import re
+import hashlib
 import pandas as pd
 
 
@@ -34,18 +35,23 @@ class Utils:
             return [os.path.join(root, f) for f in filter(lambda a: reg.match(a), os.listdir(root))]
 
     @staticmethod
-    def read_json(path):
+    def read_json(path, lines=False, chunksize=None):
         """Method to read json.
 
         Args:
             path: Path to json file
 
+            lines: True for JSON Lines files
+
+            chunksize: If given (JSON Lines only), an iterator of
+                dataframes of chunksize lines is returned
+
         Returns:
             Pandas dataframe of json file
 
         """
         try:
-            return pd.read_json(path)
+            return pd.read_json(path, lines=lines, chunksize=chunksize)
         except Exception as e:
             print(f'Failed to read Json {e}')
             raise e
@@ -75,4 +81,23 @@ class Utils:
             Reversed dict
 
         """
-        return {v: k for k, v in dict_items.items()}
\ No newline at end of file
+        return {v: k for k, v in dict_items.items()}
+
+    @staticmethod
+    def file_sha256(path, chunk_size=1 << 20):
+        """Computes sha256 of a file, reading it in chunks.
+
+        Args:
+            path: Path to file
+
+            chunk_size: Bytes read at a time
+
+        Returns:
+            hex digest
+
+        """
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
@@ -7,19 +7,91 @@ class AccuracyMultiLabel(EvalMetric):
     """Child class of mxnet EvalMetric to calculate accuracy metric for
        multi-lable datasets
 
+       Args:
+            on_device: If true, update compares rows on the device the
+                arrays are on and copies only the count to the host
+
     """
     def __init__(self, axis=1, name='accuracy_multi',
-                 output_names=None, label_names=None):
+                 output_names=None, label_names=None, on_device=False):
         super(AccuracyMultiLabel, self).__init__(name, axis=axis,
                                              output_names=output_names,
                                              label_names=label_names)
         self.axis = axis
+        self.on_device = on_device
         self.pred_status = {}
 
+    def reset(self):
+        """Resets the metric, including counts and predictions not yet
+           synced from device"""
+        super(AccuracyMultiLabel, self).reset()
+        self.pending = {}
+        self.pending_preds = []
+
     def update(self, labels, preds):
         """Implementation of update method. Updates accuracy: sum_metric
            and num_inst. Item is treated as accurate if all the labels
-           from prediction matches with all the given labels
+           from prediction matches with all the given labels. Rows are
+           compared for the whole batch at once; with on_device only the
+           count of accurate items is copied to the host.
+
+           Args:
+               lables: Acutals
+
+               preds: Predication
+        """
+        labels, preds = check_label_shapes(labels, preds, True)
+        for label, pred_label in zip(labels, preds):
+            if pred_label.shape != label.shape:
+                pred_label = ndarray.argmax(pred_label, axis=self.axis)
+            if self.on_device:
+                self.sum_metric += int(self.count_matches(label, pred_label).asscalar())
+            else:
+                pred_label, label = self.to_host(pred_label, label)
+                self.sum_metric += int(np.all(pred_label == label, axis=1).sum())
+            self.num_inst += pred_label.shape[0]
+
+    @staticmethod
+    def count_matches(label, pred_label):
+        """Number of rows where pred_label matches label, computed on the
+           arrays' device.
+
+        Returns:
+            NDArray with one element
+
+        """
+        matches = pred_label.astype('int32') == label.astype('int32')
+        return matches.reshape((matches.shape[0], -1)).min(axis=1).sum()
+
+    @staticmethod
+    def to_host(*arrays):
+        """Copies NDArrays of the same batch to the host in one transfer.
+
+        Returns:
+            list of int32 numpy arrays of shape (batch, -1)
+
+        """
+        joined, widths = AccuracyMultiLabel.join(*arrays)
+        return np.split(joined.asnumpy(), np.cumsum(widths)[:-1], axis=1)
+
+    @staticmethod
+    def join(*arrays):
+        """Joins NDArrays of the same batch into one int32 NDArray on their
+           device.
+
+        Returns:
+            joined NDArray of shape (batch, -1) and the width of each
+            array in it
+
+        """
+        arrays = [a.astype('int32').reshape((a.shape[0], -1)) for a in arrays]
+        return ndarray.concat(*arrays, dim=1), [a.shape[1] for a in arrays]
+
+    def update_deferred(self, labels, preds):
+        """Same as update, but the count of accurate items is kept as an
+           NDArray on each device instead of being copied to the host.
+           Nothing waits on the device here; the counts are synced into
+           sum_metric by sync, which get calls.
 
            Args:
                lables: Acutals
@@ -30,14 +102,26 @@ class AccuracyMultiLabel(EvalMetric):
         for label, pred_label in zip(labels, preds):
             if pred_label.shape != label.shape:
                 pred_label = ndarray.argmax(pred_label, axis=self.axis)
-            pred_label = pred_label.asnumpy().astype('int32')
-            label = label.asnumpy().astype('int32')
-            zipped = zip(pred_label, label)
-            zumba = [np.all((a == b)) for a, b in zipped]
-            #print(f'pred_label: {len(pred_label)}')
-            self.sum_metric += sum(zumba)
-            #print(f'sum_metric: {self.sum_metric}')
-            self.num_inst += len(pred_label)
+            correct = self.count_matches(label, pred_label)
+            if label.context in self.pending:
+                correct = correct + self.pending[label.context]
+            self.pending[label.context] = correct
+            self.num_inst += pred_label.shape[0]
+
+    def sync(self):
+        """Copies counts accumulated by update_deferred into sum_metric,
+           and predictions kept by get_incorrect_preds_deferred into
+           pred_status"""
+        if self.pending:
+            self.sum_metric += int(sum(p.asscalar() for p in self.pending.values()))
+            self.pending = {}
+        for joined, widths in self.pending_preds:
+            self.add_incorrect(*np.split(joined.asnumpy(), np.cumsum(widths)[:-1], axis=1))
+        self.pending_preds = []
+
+    def get(self):
+        self.sync()
+        return super(AccuracyMultiLabel, self).get()
 
     def get_incorrect_preds(self, labels, preds, names):
         """Method to get incorrect predictions. Incorrect predictions
@@ -45,19 +129,28 @@ class AccuracyMultiLabel(EvalMetric):
 
         """
         labels, preds = check_label_shapes(labels, preds, True)
-        #print(f'labels ahape {len(labels)}, {len(preds)}, {len(names)}')
-
+        if isinstance(names, ndarray.NDArray):
+            names = [names]
         for label, pred_label, name in zip(labels, preds, names):
             if pred_label.shape != label.shape:
                 pred_label = ndarray.argmax(pred_label, axis=self.axis)
-            pred_label = pred_label.asnumpy().astype('int32')
-            label = label.asnumpy().astype('int32')
-            zipped = zip(pred_label, label, name)
-            for p, l, n in zipped:
-                if np.all(p == l) is np.bool_(False):
-                    #print(f'***** p: {p} l: {l} n: {n} ********')
-                    self.pred_status[n.asscalar().astype('int32')] = [p, l]
-
+            self.add_incorrect(*self.to_host(pred_label, label, name))
 
+    def get_incorrect_preds_deferred(self, labels, preds, names):
+        """Same as get_incorrect_preds, but predictions are kept on their
+           device and only copied to pred_status by sync, which get calls
 
+        """
+        labels, preds = check_label_shapes(labels, preds, True)
+        if isinstance(names, ndarray.NDArray):
+            names = [names]
+        for label, pred_label, name in zip(labels, preds, names):
+            if pred_label.shape != label.shape:
+                pred_label = ndarray.argmax(pred_label, axis=self.axis)
+            self.pending_preds.append(self.join(pred_label, label, name))
 
+    def add_incorrect(self, pred_label, label, name):
+        """Adds rows of host arrays where pred_label doesn't match label
+           to pred_status"""
+        for i in np.flatnonzero(~np.all(pred_label == label, axis=1)):
+            self.pred_status[int(name[i, 0])] = [pred_label[i], label[i]]
@@ -0,0 +1,141 @@
+from mxnet.metric import EvalMetric, check_label_shapes
+import numpy as np
+from deep_abyasa.metrics.accuracy import AccuracyMultiLabel
+
+
+class MultiLabelMetrics(EvalMetric):
+    """Child class of mxnet EvalMetric that computes a suite of multi-label
+       metrics in one pass per batch: exact-match accuracy, Hamming loss
+       and micro/macro averaged precision, recall and F1. Per-class true
+       positive, false positive and false negative counts are kept as
+       arrays, so all metrics come from the same counters and counters
+       of several metrics (contexts, processes) can be merged.
+
+       Example:
+           ::
+
+               metric = MultiLabelMetrics()
+               metric.update(labels, preds)
+               names, values = metric.get()
+               metric.get_per_class()['f1']
+
+       Args:
+            threshold: If provided, predictions greater than threshold
+                are positive. Otherwise predictions must already be 0/1
+
+    """
+    NAMES = ['exact_match', 'hamming_loss', 'micro_precision', 'micro_recall', 'micro_f1',
+             'macro_precision', 'macro_recall', 'macro_f1']
+
+    def __init__(self, threshold=None, name='multi_label',
+                 output_names=None, label_names=None):
+        super(MultiLabelMetrics, self).__init__(name, output_names=output_names,
+                                                label_names=label_names)
+        self.threshold = threshold
+
+    def reset(self):
+        """Resets all counters"""
+        super(MultiLabelMetrics, self).reset()
+        self.tp = None
+        self.fp = None
+        self.fn = None
+        self.mismatches = 0
+
+    def update(self, labels, preds):
+        """Updates all counters with a batch. Each batch is copied to the
+           host once and reduced with whole-array operations.
+
+           Args:
+               labels: Actuals, multi hot encoded
+
+               preds: Predictions
+        """
+        labels, preds = check_label_shapes(labels, preds, True)
+        for label, pred_label in zip(labels, preds):
+            if self.threshold is not None:
+                pred_label = pred_label > self.threshold
+            pred_label, label = AccuracyMultiLabel.to_host(pred_label, label)
+            pred_label, label = pred_label.astype(bool), label.astype(bool)
+            self.add_counts(tp=(label & pred_label).sum(axis=0),
+                            fp=(~label & pred_label).sum(axis=0),
+                            fn=(label & ~pred_label).sum(axis=0),
+                            exact=int(np.all(label == pred_label, axis=1).sum()),
+                            mismatches=int((label != pred_label).sum()),
+                            num_inst=label.shape[0])
+
+    def add_counts(self, tp, fp, fn, exact, mismatches, num_inst):
+        """Adds counts to the counters"""
+        if self.tp is None:
+            self.tp = np.zeros(len(tp), dtype=np.int64)
+            self.fp = np.zeros(len(tp), dtype=np.int64)
+            self.fn = np.zeros(len(tp), dtype=np.int64)
+        self.tp += tp
+        self.fp += fp
+        self.fn += fn
+        self.sum_metric += exact
+        self.mismatches += mismatches
+        self.num_inst += num_inst
+
+    def get_state(self):
+        """Returns the counters as a dict of plain values, e.g. to send
+           them to another process. See merge.
+        """
+        return {'tp': self.tp, 'fp': self.fp, 'fn': self.fn, 'exact': self.sum_metric,
+                'mismatches': self.mismatches, 'num_inst': self.num_inst}
+
+    def merge(self, other):
+        """Adds the counters of another MultiLabelMetrics, or a state from
+           get_state, to this one.
+
+        Returns:
+            self
+
+        """
+        state = other.get_state() if isinstance(other, MultiLabelMetrics) else other
+        if state['tp'] is not None:
+            self.add_counts(**state)
+        return self
+
+    @staticmethod
+    def divide(numerator, denominator):
+        """Element wise division where 0 / 0 is 0"""
+        numerator = np.asarray(numerator, dtype=np.float64)
+        denominator = np.asarray(denominator, dtype=np.float64)
+        return np.divide(numerator, denominator, out=np.zeros_like(numerator), where=denominator > 0)
+
+    def get_per_class(self):
+        """Per-class precision, recall, F1 and support.
+
+        Returns:
+            dict of arrays, one value per class
+
+        """
+        precision = self.divide(self.tp, self.tp + self.fp)
+        recall = self.divide(self.tp, self.tp + self.fn)
+        return {'precision': precision,
+                'recall': recall,
+                'f1': self.divide(2 * precision * recall, precision + recall),
+                'support': self.tp + self.fn}
+
+    def get(self):
+        """Gets all metrics.
+
+        Returns:
+            list of metric names and list of their values
+
+        """
+        if self.num_inst == 0:
+            return self.NAMES, [float('nan')] * len(self.NAMES)
+        tp, fp, fn = self.tp.sum(), self.fp.sum(), self.fn.sum()
+        micro_precision = float(self.divide(tp, tp + fp))
+        micro_recall = float(self.divide(tp, tp + fn))
+        per_class = self.get_per_class()
+        values = [self.sum_metric / self.num_inst,
+                  self.mismatches / (self.num_inst * len(self.tp)),
+                  micro_precision,
+                  micro_recall,
+                  float(self.divide(2 * micro_precision * micro_recall, micro_precision + micro_recall)),
+                  float(per_class['precision'].mean()),
+                  float(per_class['recall'].mean()),
+                  float(per_class['f1'].mean())]
+        return self.NAMES, values
@@ -1,12 +1,34 @@
 import os.path
+import json
+import time
+import hashlib
+import threading
 import urllib.request
 import tarfile
+from concurrent.futures import ThreadPoolExecutor
+from deep_abyasa.helpers.custom_exceptions import CustomException
 
 
 class Download:
     """Download dataset and supporting files from URL and unzips them. If the
     dataset already exists at the given path, it will not be downloaded again.
 
+    The tarball is downloaded into ``<file>.part`` and only renamed to its
+    final name once complete (and verified, if a checksum is known), so an
+    interrupted transfer is never mistaken for a finished one. When the
+    server accepts byte ranges, the file is fetched in chunks over
+    num_connections parallel connections and the completed chunks are
+    recorded in ``<file>.part.json``; a later run resumes from there.
+
+    Extraction streams through the archive once, writing members on a
+    thread pool and skipping files whose size and modification time
+    already match. Members that would land outside save_at (absolute
+    paths, ``..``), links and device files are not extracted. With
+    stream=True the archive is extracted while it downloads. A handler
+    can consume members instead of writing them, e.g. to pack images into
+    record shards or a decoded image cache; see
+    RecordShards.member_handler and JsonIndexMultiLabelDataset.cache_member.
+
     Args:
         dataset: Dataset to download. Currently, available datasets are:
 
@@ -17,8 +39,34 @@ class Download:
         save_at: Path to save the downloaded and extracted datasets/files.
             Default values is current directory.
 
+        num_connections: Number of parallel ranged requests
+
+        chunk_size: Bytes per ranged request
+
+        sha256: Expected sha256 hex digest of the tarball
+
+        manifest: URL or path of a manifest in ``sha256sum`` format
+            (``<digest>  <file name>`` per line) listing the expected
+            digest of the tarball. Used when sha256 is not given
+
+        progress: Function called as progress(done_bytes, total_bytes,
+            bytes_per_second) while downloading. total_bytes is None if
+            the server doesn't report the size
+
+        stream: If True, the archive is extracted while it is downloaded
+            over a single connection. The tarball is still saved, so a
+            later run is a cache hit
+
+        num_workers: Number of threads writing extracted files
+
+        handler: Function called as handler(path, data) for every file in
+            the archive, with the path it would be extracted to and its
+            bytes. If it returns True the file is not written
+
     """
-    def __init__(self, dataset, root="https://storage.googleapis.com/chem-dl", save_at="."):
+    def __init__(self, dataset, root="https://storage.googleapis.com/chem-dl", save_at=".",
+                 num_connections=4, chunk_size=8 << 20, sha256=None, manifest=None, progress=None,
+                 stream=False, num_workers=8, handler=None):
         self.root = root
 
         self.dataset = dataset
@@ -26,13 +74,29 @@ class Download:
 
         self.save_at = f'{save_at}'
         self.save_at_file = f'{save_at}/{self.dataset_file}'
+        self.part_file = f'{self.save_at_file}.part'
+        self.state_file = f'{self.part_file}.json'
 
         self.path = f'{root}/{self.dataset_file}'
 
+        self.num_connections = num_connections
+        self.chunk_size = chunk_size
+        self.sha256 = sha256
+        self.manifest = manifest
+        self.progress = progress
+        self.stream = stream
+        self.num_workers = num_workers
+        self.handler = handler
+
         self.has_downloaded = False
+        self.extracted = 0
+        self.skipped = 0
 
-        self.download_dataset()
-        self.extract_dataset()
+        if self.stream and not os.path.isfile(self.save_at_file):
+            self.stream_dataset()
+        else:
+            self.download_dataset()
+            self.extract_dataset()
 
     def download_dataset(self):
         """Download dataset from given URL and save the contents to path specified
@@ -44,28 +108,281 @@ class Download:
             return
         else:
             try:
-                urllib.request.urlcleanup()
-                urllib.request.urlretrieve(self.path, f'{self.save_at}/{self.dataset_file}')
+                expected = self.expected_sha256()
+                size, accepts_ranges, validator = self.probe()
+                if size and accepts_ranges:
+                    self.download_ranges(size, validator)
+                else:
+                    self.download_stream(size)
+                self.verify(expected)
+                os.replace(self.part_file, self.save_at_file)
+                if os.path.isfile(self.state_file):
+                    os.remove(self.state_file)
                 self.has_downloaded = True
             except Exception as e:
                 print(f'Failed to download {self.dataset} from {self.root}: {e}')
                 raise e
 
+    def expected_sha256(self):
+        """Expected digest of the tarball from sha256 or the manifest, or None"""
+        if self.sha256 is not None or self.manifest is None:
+            return self.sha256
+        if '://' in self.manifest:
+            with urllib.request.urlopen(self.manifest) as response:
+                lines = response.read().decode('utf-8').splitlines()
+        else:
+            with open(self.manifest) as f:
+                lines = f.read().splitlines()
+        for line in lines:
+            parts = line.split()
+            if len(parts) == 2 and parts[1].lstrip('*') == self.dataset_file:
+                return parts[0].lower()
+        print(f'{self.dataset_file} is not listed in manifest {self.manifest}')
+        raise CustomException
+
+    def probe(self):
+        """HEAD request for the size, range support and validator (ETag or
+           Last-Modified) of the tarball"""
+        request = urllib.request.Request(self.path, method='HEAD')
+        with urllib.request.urlopen(request) as response:
+            size = response.headers.get('Content-Length')
+            accepts_ranges = response.headers.get('Accept-Ranges', '').lower() == 'bytes'
+            validator = response.headers.get('ETag') or response.headers.get('Last-Modified')
+        return None if size is None else int(size), accepts_ranges, validator
+
+    def load_state(self, size, validator):
+        """Indices of completed chunks recorded by an earlier run. An empty
+           set if there is none, or it was for another version of the file"""
+        if not (os.path.isfile(self.part_file) and os.path.isfile(self.state_file)):
+            return set()
+        with open(self.state_file) as f:
+            state = json.load(f)
+        if (state.get('size'), state.get('chunk_size'), state.get('validator')) != \
+                (size, self.chunk_size, validator) or os.path.getsize(self.part_file) != size:
+            return set()
+        return set(state['done'])
+
+    def save_state(self, size, validator, done):
+        """Records completed chunks so that the download can be resumed"""
+        with open(f'{self.state_file}.tmp', 'w') as f:
+            json.dump({'size': size, 'chunk_size': self.chunk_size, 'validator': validator,
+                       'done': sorted(done)}, f)
+        os.replace(f'{self.state_file}.tmp', self.state_file)
+
+    def download_ranges(self, size, validator):
+        """Downloads missing chunks of the .part file with parallel ranged
+           requests"""
+        done = self.load_state(size, validator)
+        if not done:
+            with open(self.part_file, 'wb') as f:
+                f.truncate(size)
+            self.save_state(size, validator, done)
+        num_chunks = max(1, -(-size // self.chunk_size))
+        pending = [i for i in range(num_chunks) if i not in done]
+        lock = threading.Lock()
+        meter = self.meter(size, sum(min(self.chunk_size, size - i * self.chunk_size) for i in done))
+
+        def fetch(i):
+            start = i * self.chunk_size
+            end = min(start + self.chunk_size, size) - 1
+            request = urllib.request.Request(self.path, headers={'Range': f'bytes={start}-{end}'})
+            with urllib.request.urlopen(request) as response, open(self.part_file, 'r+b') as f:
+                if response.status != 206:
+                    print(f'{self.path} ignored range request {start}-{end}')
+                    raise CustomException
+                f.seek(start)
+                while True:
+                    block = response.read(1 << 16)
+                    if not block:
+                        break
+                    f.write(block)
+                    meter(len(block))
+                if f.tell() != end + 1:
+                    print(f'Chunk {start}-{end} of {self.path} ended at {f.tell()}')
+                    raise CustomException
+            with lock:
+                done.add(i)
+                self.save_state(size, validator, done)
+
+        with ThreadPoolExecutor(max(1, self.num_connections)) as executor:
+            for future in [executor.submit(fetch, i) for i in pending]:
+                future.result()
+
+    def download_stream(self, size):
+        """Downloads the tarball over one connection. Used when the server
+           doesn't accept ranges, so any earlier .part file is discarded"""
+        meter = self.meter(size, 0)
+        with urllib.request.urlopen(self.path) as response, open(self.part_file, 'wb') as f:
+            while True:
+                block = response.read(1 << 16)
+                if not block:
+                    break
+                f.write(block)
+                meter(len(block))
+
+    def meter(self, size, done):
+        """Returns a thread safe function that counts downloaded bytes and
+           reports them to self.progress"""
+        lock = threading.Lock()
+        started = time.monotonic()
+        state = {'done': done, 'new': 0}
+
+        def update(num_bytes):
+            with lock:
+                state['done'] += num_bytes
+                state['new'] += num_bytes
+                if self.progress is not None:
+                    elapsed = time.monotonic() - started
+                    self.progress(state['done'], size, state['new'] / elapsed if elapsed > 0 else 0.0)
+        return update
+
+    def verify(self, expected, digest=None):
+        """Checks the sha256 of the .part file, or digest if it was computed
+           while downloading. On mismatch the partial download is deleted
+           so that the next run starts afresh"""
+        if expected is None:
+            return
+        if digest is None:
+            digest = hashlib.sha256()
+            with open(self.part_file, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(block)
+        if digest.hexdigest() != expected.lower():
+            for path in (self.part_file, self.state_file):
+                if os.path.isfile(path):
+                    os.remove(path)
+            print(f'sha256 of {self.dataset_file} is {digest.hexdigest()}, expected {expected}')
+            raise CustomException
+
+    def stream_dataset(self):
+        """Downloads the tarball over one connection and extracts it on the
+           fly. The bytes are also written to the .part file, which becomes
+           the tarball once the download completes and is verified
+        """
+        try:
+            expected = self.expected_sha256()
+            with urllib.request.urlopen(self.path) as response, open(self.part_file, 'wb') as f:
+                size = response.headers.get('Content-Length')
+                reader = TeeReader(response, f, self.meter(None if size is None else int(size), 0))
+                self.extract(reader)
+                reader.drain()
+            self.verify(expected, reader.digest)
+            os.replace(self.part_file, self.save_at_file)
+            self.has_downloaded = True
+        except Exception as e:
+            print(f'Failed to download and extract {self.dataset} from {self.root}: {e}')
+            raise e
+
     def extract_dataset(self):
         """Extracts contents of tarred file to self.save_at. If the extracted
-           directory already exists, no untarring will occur
+           directory already exists and no handler is set, no untarring will
+           occur
         """
-        if os.path.isdir(f'{self.save_at}/{self.dataset}') and self.has_downloaded is False:
+        if os.path.isdir(f'{self.save_at}/{self.dataset}') and self.has_downloaded is False \
+                and self.handler is None:
             print(f'{self.save_at}/{self.dataset} exists. Nothing will be unzipped')
             return
         else:
             try:
-                tar = tarfile.open(self.save_at_file, "r:gz")
-                tar.extractall(self.save_at)
+                with open(self.save_at_file, 'rb') as f:
+                    self.extract(f)
             except Exception as e:
                 print(f'Failed to extract {self.save_at}/{self.dataset}')
                 raise e
-            finally:
-                tar.close()
 
+    def extract(self, fileobj):
+        """Extracts a tar stream to self.save_at in one sequential pass.
+           Members are read in order and written by a thread pool; at most
+           a few members per thread are held in memory.
+        """
+        root = os.path.realpath(self.save_at)
+        with tarfile.open(fileobj=fileobj, mode='r|*') as tar, ThreadPoolExecutor(self.num_workers) as executor:
+            pending = []
+            for member in tar:
+                path = self.member_path(root, member)
+                if path is None:
+                    continue
+                if member.isdir():
+                    os.makedirs(path, exist_ok=True)
+                    continue
+                if self.handler is None and self.is_current(path, member):
+                    self.skipped += 1
+                    continue
+                data = tar.extractfile(member).read()
+                if self.handler is not None:
+                    if self.handler(path, data):
+                        continue
+                    if self.is_current(path, member):
+                        self.skipped += 1
+                        continue
+                pending.append(executor.submit(self.write_member, path, data, member.mtime))
+                self.extracted += 1
+                if len(pending) > 2 * self.num_workers:
+                    pending.pop(0).result()
+            for future in pending:
+                future.result()
+
+    @staticmethod
+    def member_path(root, member):
+        """Path a member is extracted to, or None if it must not be
+           extracted: links, devices and anything resolving outside root
+        """
+        if not (member.isfile() or member.isdir()):
+            print(f'Skipping {member.name}: not a regular file or directory')
+            return None
+        path = os.path.realpath(os.path.join(root, member.name))
+        if os.path.isabs(member.name) or (path != root and not path.startswith(root + os.sep)):
+            print(f'Skipping {member.name}: outside of {root}')
+            return None
+        return path
+
+    @staticmethod
+    def is_current(path, member):
+        """True if path exists with the size and mtime of member"""
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return False
+        return stat.st_size == member.size and int(stat.st_mtime) == int(member.mtime)
+
+    @staticmethod
+    def write_member(path, data, mtime):
+        """Writes an extracted file through a temporary file, so that an
+           interrupted extraction leaves no truncated files behind"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f'{path}.{threading.get_ident()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.utime(tmp, (mtime, mtime))
+        os.replace(tmp, path)
+
+
+class TeeReader:
+    """File like reader that copies everything read from source to sink,
+       hashes it and reports the byte counts to meter
+
+       Args:
+            source: Readable binary stream, e.g. an HTTP response
+
+            sink: Writable binary file
+
+            meter: Function called with the number of bytes read
+
+    """
+    def __init__(self, source, sink, meter):
+        self.source = source
+        self.sink = sink
+        self.meter = meter
+        self.digest = hashlib.sha256()
+
+    def read(self, size=-1):
+        data = self.source.read(size)
+        self.sink.write(data)
+        self.digest.update(data)
+        self.meter(len(data))
+        return data
 
+    def drain(self):
+        """Reads the rest of source, e.g. the padding after the last member"""
+        while self.read(1 << 16):
+            pass
@@ -1,8 +1,15 @@
 import pandas as pd
 import numpy as np
+import os
+import json
 import pickle
-from deep_abyasa import Utils
-from deep_abyasa import CustomException
+import hashlib
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import islice
+from deep_abyasa.helpers.utils import Utils
+from deep_abyasa.helpers.custom_exceptions import CustomException
 
 
 class Encode_Labels:
@@ -30,14 +37,24 @@ class Encode_Labels:
                 oxygen: 2
             }
 
+    Labels can be kept in a vocabulary file, a small json file with the
+    label order, label counts, the sha256 of the index the labels were
+    extracted from and the settings they were extracted with. See
+    write_vocabulary and read_vocabulary.
 
     """
+    VOCABULARY_VERSION = 1
+
     @staticmethod
     def encode_from_index_files(root, label_col,
                                 files=None, file_type='json',
                                 pattern=".*json", multi_label=False,
-                                multi_label_delimiter=None):
-        """Creates ltoi and itol from dataset index.
+                                multi_label_delimiter=None, num_workers=1,
+                                lines=False, chunksize=None, vocabulary_file=None):
+        """Creates ltoi and itol from dataset index. Labels are counted
+        file by file (and chunk by chunk for JSON Lines) into Counters
+        that are merged, so the index files are never concatenated in
+        memory.
 
         Args:
             root: root folder where dataset index files are located
@@ -60,17 +77,89 @@ class Encode_Labels:
                 are not represented as an array type, then this parameter
                 stores the delimiter.
 
+            num_workers: Number of processes reading index files. With
+                1, files are read in this process
+
+            lines: True if the index files are JSON Lines
+
+            chunksize: Number of lines read at a time from JSON Lines
+                files. If None, each file is read at once
+
+            vocabulary_file: If given and it was written for the same
+                index files and the same label_col, multi_label and
+                multi_label_delimiter, labels are read from it and the
+                index files are not scanned. Otherwise it is written,
+                with label counts, after the scan
+
         Returns:
             Returns a pair of dict: One going from label to int and
                 another going from int ot label.
 
         """
         file_lists = Utils.create_list_of_file_paths(root, files, pattern)
+        settings = {'label_col': label_col, 'multi_label': multi_label,
+                    'multi_label_delimiter': multi_label_delimiter}
+        if vocabulary_file is not None:
+            vocabulary = Encode_Labels.read_vocabulary(vocabulary_file, source=file_lists, settings=settings)
+            if vocabulary is not None:
+                return vocabulary
         file_read_method = Encode_Labels.determine_read_file_method(file_type)
-        label_extract_method = Encode_Labels.determine_label_extract_method(multi_label, multi_label_delimiter)
-        dataframes = pd.concat([file_read_method(f) for f in file_lists])
-        labels = label_extract_method(dataframes[label_col], multi_label_delimiter)
-        return Encode_Labels.generate_itol_ltoi(labels)
+        if chunksize is not None and not lines:
+            print("chunksize is only supported for JSON Lines index files. Set lines=True")
+            raise CustomException
+        extract = partial(Encode_Labels.extract_labels_from_file, label_col=label_col,
+                          file_read_method=file_read_method, multi_label=multi_label,
+                          multi_label_delimiter=multi_label_delimiter, lines=lines, chunksize=chunksize)
+        labels = Counter()
+        if num_workers > 1 and len(file_lists) > 1:
+            with ProcessPoolExecutor(min(num_workers, len(file_lists))) as executor:
+                for file_labels in executor.map(extract, file_lists):
+                    labels.update(file_labels)
+        else:
+            for f in file_lists:
+                labels.update(extract(f))
+        itol, ltoi = Encode_Labels.generate_itol_ltoi(list(labels))
+        if vocabulary_file is not None:
+            counts = [labels[itol[i]] for i in range(len(itol))]
+            Encode_Labels.write_vocabulary(vocabulary_file, ltoi, counts, source=file_lists, settings=settings)
+        return itol, ltoi
+
+    @staticmethod
+    def extract_labels_from_file(path, label_col, file_read_method, multi_label=False,
+                                 multi_label_delimiter=None, lines=False, chunksize=None):
+        """Counts the labels of one index file. Runs in a worker process
+           when encode_from_index_files is given num_workers.
+
+        Returns:
+            Counter of label to number of occurrences
+
+        """
+        data = file_read_method(path, lines=lines, chunksize=chunksize)
+        chunks = [data] if chunksize is None else data
+        labels = Counter()
+        for chunk in chunks:
+            labels.update(Encode_Labels.count_labels(chunk[label_col], multi_label, multi_label_delimiter))
+        return labels
+
+    @staticmethod
+    def count_labels(labels, multi_label=False, multi_label_delimiter=None):
+        """Counts labels of a label column, splitting rows as the
+           extraction method picked by determine_label_extract_method does.
+
+        Returns:
+            Counter of label to number of occurrences
+
+        """
+        if multi_label is False:
+            return Counter(labels)
+        counts = Counter()
+        if multi_label_delimiter is None:
+            for l in labels:
+                counts.update([l] if isinstance(l, str) else l)
+        else:
+            for l in labels:
+                counts.update(map(str.strip, l.split(multi_label_delimiter)))
+        return counts
 
     @staticmethod
     def encode_from_pickle(file_path, key=True):
@@ -86,13 +175,92 @@ class Encode_Labels:
         """
 
         try:
-            elements = pickle.load(open(file_path, 'rb'))
-            if key:
-                return Encode_Labels.generate_itol_ltoi(list(elements.keys()))
-            else:
-                return Encode_Labels.generate_itol_ltoi(list(set(elements.values())))
+            with open(file_path, 'rb') as f:
+                elements = pickle.load(f)
         except Exception as e:
-            pass
+            print(f'Failed to read labels from pickle {file_path}: {e}')
+            raise e
+        if key:
+            return Encode_Labels.generate_itol_ltoi(list(elements.keys()))
+        else:
+            return Encode_Labels.generate_itol_ltoi(list(set(elements.values())))
+
+    @staticmethod
+    def source_sha256(source):
+        """sha256 identifying an index file, or a list of index files"""
+        if isinstance(source, str):
+            return Utils.file_sha256(source)
+        digests = [Utils.file_sha256(f) for f in sorted(source)]
+        return hashlib.sha256(' '.join(digests).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def write_vocabulary(path, ltoi, counts=None, source=None, settings=None):
+        """Writes a vocabulary file::
+
+            {"format_version": 1,
+             "labels": ["carbon", "hydrogen", ...],
+             "counts": [1200, 1180, ...],
+             "source_sha256": "...",
+             "settings": {"label_col": "elements", ...}}
+
+        Args:
+            path: Path of the vocabulary file
+
+            ltoi: dict of label to int. Labels are stored in int order
+
+            counts: Number of occurrences of each label in int order,
+                or None
+
+            source: Index file, or list of index files, the labels were
+                extracted from. Its sha256 is stored
+
+            settings: json serializable dict of the settings the labels
+                were extracted with, e.g. the label column
+
+        """
+        itol = Utils.reserve_dict(ltoi)
+        vocabulary = {'format_version': Encode_Labels.VOCABULARY_VERSION,
+                      'labels': [itol[i] for i in range(len(itol))],
+                      'counts': None if counts is None else [int(c) for c in counts],
+                      'source_sha256': None if source is None else Encode_Labels.source_sha256(source),
+                      'settings': settings}
+        with open(f'{path}.tmp', 'w') as f:
+            json.dump(vocabulary, f)
+        os.replace(f'{path}.tmp', path)
+
+    @staticmethod
+    def read_vocabulary(path, source=None, with_counts=False, settings=None):
+        """Reads a vocabulary file written by write_vocabulary.
+
+        Args:
+            path: Path of the vocabulary file
+
+            source: If given, the vocabulary is only returned if it was
+                written for this index file (or list of files), compared
+                by sha256, and with these settings
+
+            with_counts: If true, label counts are returned as well
+
+        Returns:
+            itol, ltoi (and counts), or None if the file doesn't exist or
+            was written for another source or other settings
+
+        """
+        if not os.path.isfile(path):
+            return None
+        with open(path) as f:
+            vocabulary = json.load(f)
+        if vocabulary.get('format_version') != Encode_Labels.VOCABULARY_VERSION:
+            print(f'Unsupported vocabulary format {vocabulary.get("format_version")} at {path}')
+            raise CustomException
+        if source is not None and (vocabulary.get('settings') != settings or
+                                   vocabulary['source_sha256'] != Encode_Labels.source_sha256(source)):
+            return None
+        itol = dict(enumerate(vocabulary['labels']))
+        ltoi = Utils.reserve_dict(itol)
+        if with_counts:
+            return itol, ltoi, vocabulary['counts']
+        return itol, ltoi
 
     @staticmethod
     def determine_read_file_method(file_type):
@@ -106,7 +274,7 @@ class Encode_Labels:
             A function that reads index datasets
 
         """
-        if file_type is 'json':
+        if file_type == 'json':
             return Utils.read_json
         else:
             print("Currently, only json index_file is implemented")
@@ -156,7 +324,8 @@ class Encode_Labels:
         """Extract labels from multi label when the label column is array like
 
             Args:
-                labels: List of List of lables
+                labels: List of List of lables. A single label in place
+                    of a list is treated as a list of one label
 
                 multi_label_delimiter: Not really used in this method,
                     but kept for compatibility with sister methods
@@ -164,7 +333,13 @@ class Encode_Labels:
             Returns: List of unique labels
 
         """
-        return list(set(np.hstack(labels)))
+        unique = set()
+        for l in labels:
+            if isinstance(l, str):
+                unique.add(l)
+            else:
+                unique.update(l)
+        return list(unique)
 
     @staticmethod
     def extract_multi_labels_from_delimited_cols(labels, multi_label_delimiter=None):
@@ -179,8 +354,51 @@ class Encode_Labels:
             Returns: List of unique labels
 
         """
-        lab = [list(map(lambda a: a.strip(), l.split(multi_label_delimiter))) for l in labels]
-        return Encode_Labels.extract_multi_labels_from_arraylike_cols(lab)
+        unique = set()
+        for l in labels:
+            unique.update(map(str.strip, l.split(multi_label_delimiter)))
+        return list(unique)
+
+    @staticmethod
+    def label_statistics(labels, ltoi=None, multi_label_delimiter=None, chunk_size=65536):
+        """Label frequencies and co-occurrence counts of a label column.
+           Rows are one hot encoded chunk_size at a time and reduced with
+           X.sum(0) and X.T @ X, so memory is bounded by the chunk.
+
+        Args:
+            labels: List of list of labels (a single label in place of a
+                list counts as one label), or of delimited strings when
+                multi_label_delimiter is given
+
+            ltoi: dict of label to int. If None, it is built from labels
+                with generate_itol_ltoi
+
+            multi_label_delimiter: Delimiter of delimited label strings
+
+            chunk_size: Number of rows encoded at a time
+
+        Returns:
+            dict with ltoi, counts (int64 array, one per label) and
+            cooccurrence (int64 matrix; entry i, j counts rows with both
+            labels, the diagonal equals counts)
+
+        """
+        if multi_label_delimiter is not None:
+            labels = ([l.strip() for l in row.split(multi_label_delimiter)] for row in labels)
+        labels = list(labels) if ltoi is None else labels
+        if ltoi is None:
+            _, ltoi = Encode_Labels.generate_itol_ltoi(Encode_Labels.extract_multi_labels_from_arraylike_cols(labels))
+        counts = np.zeros(len(ltoi), dtype=np.int64)
+        cooccurrence = np.zeros((len(ltoi), len(ltoi)), dtype=np.int64)
+        rows = iter(labels)
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            x = Encode_Labels.one_hot_encode(chunk, ltoi).astype(np.float32)
+            counts += x.sum(axis=0).astype(np.int64)
+            cooccurrence += (x.T @ x).astype(np.int64)
+        return {'ltoi': ltoi, 'counts': counts, 'cooccurrence': cooccurrence}
 
     @staticmethod
     def generate_itol_ltoi(labels):
@@ -195,4 +413,60 @@ class Encode_Labels:
         """
         itol = Utils.convert_list_to_dict(labels)
         ltoi = Utils.reserve_dict(itol)
-        return itol, ltoi
\ No newline at end of file
+        return itol, ltoi
+
+    @staticmethod
+    def one_hot_encode(labels, ltoi, packed=False):
+        """Vectorized one hot encoding of a column of labels.
+
+        Args:
+            labels: List of list of labels. A single label in place of
+                a list is treated as a list of one label
+
+            ltoi: dict of label to int
+
+            packed: If true, the matrix is bit packed along the label
+                axis with np.packbits
+
+        Returns:
+            uint8 matrix of shape (len(labels), len(ltoi)) or its
+            bit packed form
+
+        """
+        rows = [[l] if isinstance(l, str) else l for l in labels]
+        offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum([len(r) for r in rows], out=offsets[1:])
+        try:
+            codes = np.fromiter((ltoi[l] for r in rows for l in r), dtype=np.int64, count=offsets[-1])
+        except KeyError as e:
+            print(f'Label {e} is not in ltoi')
+            raise CustomException
+        return Encode_Labels.one_hot_from_csr(offsets, codes, len(ltoi), packed)
+
+    @staticmethod
+    def one_hot_from_csr(offsets, codes, num_classes, packed=False):
+        """One hot encodes labels held in CSR form, in a single scatter.
+
+        Args:
+            offsets: Row offsets into codes. Labels of row i are
+                codes[offsets[i]:offsets[i + 1]]
+
+            codes: int label codes as given by ltoi
+
+            num_classes: Number of labels
+
+            packed: If true, the matrix is bit packed along the label
+                axis with np.packbits
+
+        Returns:
+            uint8 matrix of shape (len(offsets) - 1, num_classes) or
+            its bit packed form
+
+        """
+        num_rows = len(offsets) - 1
+        matrix = np.zeros((num_rows, num_classes), dtype=np.uint8)
+        rows = np.repeat(np.arange(num_rows), np.diff(offsets))
+        matrix[rows, codes] = 1
+        if packed:
+            return np.packbits(matrix, axis=1)
+        return matrix
@@ -0,0 +1,198 @@
+import os
+import json
+import numpy as np
+import mxnet as mx
+from deep_abyasa.helpers.utils import Utils
+from deep_abyasa.helpers.custom_exceptions import CustomException
+from deep_abyasa.preprocess.encode_labels import Encode_Labels
+from deep_abyasa.datasets.index import ColumnarIndex
+
+
+class RecordShards:
+    """Packs a json index and its image directory into sharded, indexed
+    mxnet RecordIO files, so that the images can be read with a few large
+    sequential reads instead of one open() per image.
+
+    For an out_prefix of ``data/chem_train`` the layout is::
+
+        data/chem_train.meta.json
+        data/chem_train-00000.rec, data/chem_train-00000.idx
+        data/chem_train-00001.rec, data/chem_train-00001.idx
+        ...
+
+    Each record holds the encoded image bytes as they are on disk. Its
+    header label is the one hot vector, its header id the bits of the
+    float64 image id (so ids above 2**24 and NaN ids survive the float32
+    label) and its key is the row number in the index.
+    RecordShardMultiLabelDataset reads them back.
+
+    """
+    FORMAT_VERSION = 2
+
+    @staticmethod
+    def pack(root, file, image_path, x_col, y_col, out_prefix, labels,
+             records_per_shard=10000):
+        """Packs an index and its images into record shards.
+
+        Args:
+            root: Root path for index and images
+
+            file: File name of index json file
+
+            image_path: Additional path from root to get to images
+
+            x_col: Column name that contains image details
+
+            y_col: Column name for labels
+
+            out_prefix: Path prefix of the shard and meta files
+
+            labels: dict of label to int used for one hot encoding
+
+            records_per_shard: Number of records in each shard
+
+        Returns:
+            Path of the meta file
+
+        """
+        index, one_hot = RecordShards.load_index(root, file, x_col, y_col, labels)
+        writer = RecordShards.writer(out_prefix, labels, records_per_shard)
+        for i in range(len(index)):
+            with open(os.path.join(root, image_path, index.file(i)), 'rb') as f:
+                writer.write(index.image_ids[i], one_hot[i], f.read())
+        return writer.close()
+
+    @staticmethod
+    def load_index(root, file, x_col, y_col, labels):
+        """Reads an index json and one hot encodes its labels.
+
+        Returns:
+            ColumnarIndex and one hot matrix with a row per item
+
+        """
+        index = ColumnarIndex.from_dataframe(Utils.read_json(os.path.join(root, file)), x_col, y_col)
+        codes = index.class_codes(labels)
+        if (codes < 0).any():
+            print(f'Labels {set(index.label_vocab[index.label_values[codes < 0]].tolist())} are not in labels')
+            raise CustomException
+        return index, Encode_Labels.one_hot_from_csr(index.label_offsets, codes, len(labels))
+
+    @staticmethod
+    def member_handler(writer, root, file, image_path, x_col, y_col, labels):
+        """Returns a handler for Download that packs the images of an index
+           into writer as they are extracted, instead of writing them to
+           disk. The index json must already be extracted, e.g. by a first
+           Download pass whose handler keeps only images out. Records are
+           in archive order rather than index order.
+
+        Args:
+            writer: ShardWriter to pack into. Close it after the download
+
+            root, file, image_path, x_col, y_col, labels: See pack
+
+        Returns:
+            handler(path, data) returning True for images of the index
+
+        """
+        index, one_hot = RecordShards.load_index(root, file, x_col, y_col, labels)
+        rows = {os.path.realpath(os.path.join(root, image_path, index.file(i))): i for i in range(len(index))}
+
+        def handler(path, data):
+            i = rows.get(os.path.realpath(path))
+            if i is None:
+                return False
+            writer.write(index.image_ids[i], one_hot[i], data)
+            return True
+        return handler
+
+    @staticmethod
+    def writer(out_prefix, labels, records_per_shard=10000):
+        """Returns a ShardWriter for out_prefix. Use it to pack records
+           from sources other than an image directory.
+        """
+        return ShardWriter(out_prefix, labels, records_per_shard)
+
+    @staticmethod
+    def shard_paths(out_prefix, shard):
+        """Returns idx and rec paths of a shard"""
+        return f'{out_prefix}-{shard:05d}.idx', f'{out_prefix}-{shard:05d}.rec'
+
+    @staticmethod
+    def encode_id(image_id):
+        """Returns the float64 bits of image_id as the uint64 header id"""
+        return int(np.float64(image_id).view(np.uint64))
+
+    @staticmethod
+    def decode_id(header_id):
+        """Inverse of encode_id"""
+        return float(np.uint64(header_id).view(np.float64))
+
+    @staticmethod
+    def read_meta(out_prefix):
+        """Reads and validates the meta file of a packed dataset"""
+        with open(f'{out_prefix}.meta.json') as f:
+            meta = json.load(f)
+        if meta.get('format_version') != RecordShards.FORMAT_VERSION:
+            print(f'Unsupported record shard format {meta.get("format_version")} at {out_prefix}')
+            raise CustomException
+        return meta
+
+
+class ShardWriter:
+    """Appends records to a set of shards, rolling over to a new shard every
+       records_per_shard records. close() writes the meta file.
+
+       Args:
+            out_prefix: Path prefix of the shard and meta files
+
+            labels: dict of label to int
+
+            records_per_shard: Number of records in each shard
+
+    """
+    def __init__(self, out_prefix, labels, records_per_shard=10000):
+        self.out_prefix = out_prefix
+        self.labels = labels
+        self.records_per_shard = records_per_shard
+        self.num_records = 0
+        self._record = None
+
+    def write(self, image_id, one_hot, image_bytes):
+        """Writes one record.
+
+        Args:
+            image_id: float id of the image, NaN if it has none
+
+            one_hot: one hot encoded labels of the image
+
+            image_bytes: encoded image
+        """
+        if self.num_records % self.records_per_shard == 0:
+            if self._record is not None:
+                self._record.close()
+            idx_path, rec_path = RecordShards.shard_paths(self.out_prefix,
+                                                          self.num_records // self.records_per_shard)
+            self._record = mx.recordio.MXIndexedRecordIO(idx_path, rec_path, 'w')
+        header = mx.recordio.IRHeader(0, np.asarray(one_hot, dtype=np.float32),
+                                      RecordShards.encode_id(image_id), 0)
+        self._record.write_idx(self.num_records, mx.recordio.pack(header, image_bytes))
+        self.num_records += 1
+
+    def close(self):
+        """Closes the current shard and writes the meta file.
+
+        Returns:
+            Path of the meta file
+
+        """
+        if self._record is not None:
+            self._record.close()
+            self._record = None
+        meta = {'format_version': RecordShards.FORMAT_VERSION,
+                'num_records': self.num_records,
+                'records_per_shard': self.records_per_shard,
+                'labels': self.labels}
+        meta_path = f'{self.out_prefix}.meta.json'
+        with open(meta_path, 'w') as f:
+            json.dump(meta, f)
+        return meta_path
@@ -0,0 +1,37 @@
+from mxnet.gluon.data.vision import transforms
+from deep_abyasa import JsonIndexMultiLabelDataset
+from deep_abyasa import BulkDataset
+
+
+def make_dataset():
+    return JsonIndexMultiLabelDataset("./deep_abyasa/tests/data",
+                                      "chem_test_temp.json",
+                                      "images", "file", "elements",
+                                      transform=transforms.ToTensor(),
+                                      one_hot_encode_labels=True,
+                                      determine_labels_from_y_col=True)
+
+
+def test_getitems():
+    ds = make_dataset()
+    x, y, n = ds.__getitems__([2, 0])
+    assert(x.shape == (2, 3, 300, 300))
+    assert(y.asnumpy().tolist() == [[1, 1, 1, 1], [1, 1, 0, 1]])
+    assert(n.asnumpy().tolist() == [10100, 10091])
+    assert((x[1] == ds[0][0]).asnumpy().all())
+
+
+def test_bulk_loader():
+    ds = make_dataset()
+    batches = list(BulkDataset(ds).loader(batch_size=2))
+    assert(len(batches) == 2)
+    assert(batches[0][0].shape == (2, 3, 300, 300))
+    assert(batches[1][0].shape == (1, 3, 300, 300))
+    assert(batches[1][2].asnumpy().tolist() == [10100])
+
+
+def test_bulk_loader_workers():
+    ds = make_dataset()
+    batches = list(BulkDataset(ds).loader(batch_size=3, shuffle=True, num_workers=2))
+    assert(len(batches) == 1)
+    assert(sorted(batches[0][2].asnumpy().tolist()) == [10091, 10099, 10100])
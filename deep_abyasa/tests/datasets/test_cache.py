@@ -0,0 +1,161 @@
+import gc
+import os
+import shutil
+import tarfile
+import multiprocessing
+from multiprocessing import shared_memory
+import pytest
+import numpy as np
+import mxnet as mx
+from deep_abyasa import Download
+from deep_abyasa import DecodedImageCache
+from deep_abyasa import SharedLRUImageCache
+from deep_abyasa import JsonIndexMultiLabelDataset
+
+
+def make_dataset(cache_dir, cache_shape=None):
+    return JsonIndexMultiLabelDataset("./deep_abyasa/tests/data",
+                                      "chem_test_temp.json",
+                                      "images", "file", "elements",
+                                      one_hot_encode_labels=True,
+                                      determine_labels_from_y_col=True,
+                                      cache_dir=str(cache_dir), cache_shape=cache_shape)
+
+
+def test_decoded_image_cache(tmp_path):
+    cache = DecodedImageCache(str(tmp_path), 'k', 2, (2, 2, 3))
+    assert(cache.get(0) is None)
+    cache.put(1, np.full((2, 2, 3), 7, dtype=np.uint8))
+    other = DecodedImageCache(str(tmp_path), 'k', 2, (2, 2, 3))
+    assert(other.get(1).tolist() == np.full((2, 2, 3), 7).tolist())
+    assert(len(other) == 1)
+
+
+def test_dataset_reads_from_cache(tmp_path, monkeypatch):
+    ds = make_dataset(tmp_path)
+    x, y, n = ds[1]
+    assert(x.shape == (3, 300, 300))
+    assert(len(ds.cache) == 1)
+
+    def fail(*args, **kwargs):
+        raise AssertionError('image should come from the cache')
+    monkeypatch.setattr(mx.image, 'imread', fail)
+    cached_x, _, _ = ds[1]
+    assert((cached_x == x).asnumpy().all())
+
+
+def test_dataset_cache_reads_are_zero_copy(tmp_path):
+    ds = make_dataset(tmp_path)
+    ds[0]
+    image = ds.decode_image(0)
+    ds.cache._images[0, 0, 0] = 1 + ds.cache._images[0, 0, 0] % 255
+    assert(image[0, 0].asnumpy().tolist() == ds.cache._images[0, 0, 0].tolist())
+
+
+def test_cache_key_changes_with_shape(tmp_path):
+    ds = make_dataset(tmp_path)
+    resized = make_dataset(tmp_path, cache_shape=(64, 32))
+    assert(ds.cache.key != resized.cache.key)
+    x, y, n = resized[0]
+    assert(resized.cache.shape == (64, 32, 3))
+    assert(x.shape == (3, 64, 32))
+
+
+def test_shared_lru_cache_eviction():
+    cache = SharedLRUImageCache(capacity_bytes=24, num_items=4, max_item_bytes=12)
+    image = np.arange(12, dtype=np.uint8).reshape(2, 2, 3)
+    assert(cache.get(0) is None)
+    assert(cache.put(0, image))
+    assert(cache.put(1, image + 1))
+    assert(cache.get(0).tolist() == image.tolist())
+    assert(cache.put(2, image + 2))
+    assert(cache.get(1) is None)
+    assert(cache.get(0) is not None)
+    assert(not cache.put(3, np.zeros((4, 4, 3), dtype=np.uint8)))
+    stats = cache.stats()
+    assert(stats['hits'] == 2)
+    assert(stats['misses'] == 2)
+    assert(stats['evictions'] == 1)
+    assert(stats['entries'] == 2)
+    assert(stats['bytes_used'] == 24)
+    cache.unlink()
+
+
+def put_in_child(cache):
+    cache.put(1, np.full((2, 2, 3), 5, dtype=np.uint8))
+
+
+def test_shared_lru_cache_across_processes():
+    cache = SharedLRUImageCache(capacity_bytes=120, num_items=2, max_item_bytes=12)
+    child = multiprocessing.get_context('fork').Process(target=put_in_child, args=(cache,))
+    child.start()
+    child.join()
+    assert(cache.get(1).tolist() == np.full((2, 2, 3), 5).tolist())
+    cache.unlink()
+
+
+def unlink_in_child(cache):
+    cache.unlink()
+
+
+def test_shared_lru_cache_is_freed_by_its_creator():
+    cache = SharedLRUImageCache(capacity_bytes=120, num_items=2, max_item_bytes=12)
+    cache.put(0, np.full((2, 2, 3), 5, dtype=np.uint8))
+    child = multiprocessing.get_context('fork').Process(target=unlink_in_child, args=(cache,))
+    child.start()
+    child.join()
+    name = cache._shm.name
+    shared_memory.SharedMemory(name=name).close()
+    assert(cache.get(0).tolist() == np.full((2, 2, 3), 5).tolist())
+    del cache
+    gc.collect()
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=name)
+
+
+def test_dataset_memory_cache(tmp_path):
+    cache = SharedLRUImageCache(capacity_bytes=300 * 300 * 3 * 2, num_items=3, max_item_bytes=300 * 300 * 3)
+    ds = JsonIndexMultiLabelDataset("./deep_abyasa/tests/data",
+                                    "chem_test_temp.json",
+                                    "images", "file", "elements",
+                                    memory_cache=cache)
+    x, _, _ = ds[0]
+    cached_x, _, _ = ds[0]
+    assert((cached_x == x).asnumpy().all())
+    assert(cache.stats()['hits'] == 1)
+    cache.unlink()
+
+
+def test_cache_member_fills_cache_from_archive(tmp_path, monkeypatch):
+    data = "./deep_abyasa/tests/data"
+    with tarfile.open(tmp_path / 'chem.tar.gz', 'w:gz') as tar:
+        tar.add(os.path.join(data, 'images'), arcname='chem/images')
+    os.makedirs(tmp_path / 'chem')
+    shutil.copy(os.path.join(data, 'chem_test_temp.json'), tmp_path / 'chem')
+    ds = JsonIndexMultiLabelDataset(str(tmp_path / 'chem'), "chem_test_temp.json", "images", "file", "elements",
+                                    cache_dir=str(tmp_path / 'cache'), cache_shape=(300, 300))
+    Download('chem', save_at=str(tmp_path), handler=ds.cache_member)
+    assert(not list((tmp_path / 'chem').rglob('*.png')))
+    assert(len(ds.cache) == len(ds))
+    expected = [make_dataset(tmp_path / 'expected', cache_shape=(300, 300))[i][0] for i in range(len(ds))]
+
+    def fail(*args, **kwargs):
+        raise AssertionError('image should come from the cache')
+    monkeypatch.setattr(mx.image, 'imread', fail)
+    for i in range(len(ds)):
+        assert((ds[i][0] == expected[i]).asnumpy().all())
+
+
+
+def test_cache_member_under_symlinked_root(tmp_path):
+    data = "./deep_abyasa/tests/data"
+    os.makedirs(tmp_path / 'real' / 'chem')
+    os.symlink(tmp_path / 'real', tmp_path / 'link')
+    with tarfile.open(tmp_path / 'real' / 'chem.tar.gz', 'w:gz') as tar:
+        tar.add(os.path.join(data, 'images'), arcname='chem/images')
+    shutil.copy(os.path.join(data, 'chem_test_temp.json'), tmp_path / 'real' / 'chem')
+    ds = JsonIndexMultiLabelDataset(str(tmp_path / 'link' / 'chem'), "chem_test_temp.json", "images", "file",
+                                    "elements", cache_dir=str(tmp_path / 'cache'), cache_shape=(300, 300))
+    Download('chem', save_at=str(tmp_path / 'link'), handler=ds.cache_member)
+    assert(not list((tmp_path / 'real' / 'chem').rglob('*.png')))
+    assert(len(ds.cache) == len(ds))
\ No newline at end of file
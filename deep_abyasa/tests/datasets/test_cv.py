@@ -1,4 +1,11 @@
+import numpy as np
+import pytest
+from mxnet import gluon
+from mxnet.gluon.data.vision import transforms
+from deep_abyasa import Encode_Labels
+from deep_abyasa import TrainingHelpers
 from deep_abyasa import JsonIndexMultiLabelDataset
+from deep_abyasa.helpers.custom_exceptions import CustomException
 
 
 def test_JsonIndexMultiLabelDataset_infer():
@@ -40,3 +47,67 @@ def test_JsonIndexMultiLabelDataset_given():
     assert(n == 10091)
     assert(ds.__len__() == 3)
 
+
+
+def test_JsonIndexMultiLabelDataset_dense_labels():
+    ds = JsonIndexMultiLabelDataset("./deep_abyasa/tests/data",
+                                    "chem_test_temp.json",
+                                    "images", "file", "elements",
+                                    one_hot_encode_labels=True,
+                                    determine_labels_from_y_col=True,
+                                    one_hot_storage='dense')
+    x, y, n = ds.__getitem__(0)
+    assert(y.asnumpy().tolist() == [1, 1, 0, 1])
+    assert(y.dtype == np.float32)
+    assert(ds.label_matrix.dtype == np.uint8)
+    assert(ds.encode_batch([2, 1]).tolist() == [[1, 1, 1, 1], [1, 1, 0, 0]])
+
+
+def test_JsonIndexMultiLabelDataset_packed_labels():
+    ds = JsonIndexMultiLabelDataset("./deep_abyasa/tests/data",
+                                    "chem_test_temp.json",
+                                    "images", "file", "elements",
+                                    one_hot_encode_labels=True,
+                                    labels={'carbon': 0, 'hydrogen': 1, 'oxygen': 2, 'nitrogen': 3, 'gibrish': 4},
+                                    one_hot_storage='packed')
+    assert(ds.label_matrix.shape == (3, 1))
+    x, y, n = ds.__getitem__(0)
+    assert(y.asnumpy().tolist() == [1, 1, 1, 0, 0])
+    assert(y.dtype == np.float32)
+    assert(ds.encode_batch([0, 2]).tolist() == [[1, 1, 1, 0, 0], [1, 1, 1, 1, 0]])
+
+
+@pytest.mark.parametrize('storage', ['ndarray', 'dense', 'packed'])
+def test_JsonIndexMultiLabelDataset_trains_with_label_storage(storage, capsys):
+    ds = JsonIndexMultiLabelDataset("./deep_abyasa/tests/data",
+                                    "chem_test_temp.json",
+                                    "images", "file", "elements",
+                                    transform=transforms.ToTensor(),
+                                    one_hot_encode_labels=True,
+                                    determine_labels_from_y_col=True,
+                                    one_hot_storage=storage)
+    dl = gluon.data.DataLoader(ds, batch_size=2)
+    net = gluon.nn.Dense(len(ds.labels))
+    net.initialize()
+    trainer = gluon.Trainer(net.collect_params(), 'sgd', {'learning_rate': 0.1})
+    TrainingHelpers.train(dl, dl, net, trainer, gluon.loss.SigmoidBinaryCrossEntropyLoss(), epochs=1)
+    assert('[Epoch 0]' in capsys.readouterr().out)
+
+
+def test_JsonIndexMultiLabelDataset_vocabulary_file(tmp_path):
+    path = str(tmp_path / 'vocabulary.json')
+    args = ("./deep_abyasa/tests/data", "chem_test_temp.json", "images", "file", "elements")
+    ds = JsonIndexMultiLabelDataset(*args, one_hot_encode_labels=True, determine_labels_from_y_col=True)
+    ltoi = {label: i for i, label in enumerate(reversed(sorted(ds.labels)))}
+    Encode_Labels.write_vocabulary(path, ltoi)
+    fixed = JsonIndexMultiLabelDataset(*args, one_hot_encode_labels=True, vocabulary_file=path)
+    assert(fixed.labels == ltoi)
+    both = JsonIndexMultiLabelDataset(*args, one_hot_encode_labels=True, determine_labels_from_y_col=True,
+                                      vocabulary_file=path)
+    assert(both.labels == ltoi)
+
+
+def test_JsonIndexMultiLabelDataset_missing_vocabulary_file(tmp_path):
+    with pytest.raises(CustomException):
+        JsonIndexMultiLabelDataset("./deep_abyasa/tests/data", "chem_test_temp.json", "images", "file", "elements",
+                                   one_hot_encode_labels=True, vocabulary_file=str(tmp_path / 'missing.json'))
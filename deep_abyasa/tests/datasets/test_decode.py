@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+from mxnet.gluon.data.vision import transforms
+from deep_abyasa import ImageDecoder
+from deep_abyasa import CustomException
+from deep_abyasa import JsonIndexMultiLabelDataset
+
+IMAGE = "./deep_abyasa/tests/data/images/10091.png"
+
+
+@pytest.mark.parametrize('backend', ImageDecoder.BACKENDS)
+def test_backends_agree(backend):
+    expected = ImageDecoder().read(IMAGE).asnumpy()
+    image = ImageDecoder(backend).read(IMAGE)
+    assert(image.dtype == np.uint8)
+    assert((image.asnumpy() == expected).all())
+
+
+@pytest.mark.parametrize('backend', ImageDecoder.BACKENDS)
+def test_resize_grayscale_and_threshold(backend):
+    image = ImageDecoder(backend, size=(150, 100)).read(IMAGE)
+    assert(image.shape == (150, 100, 3))
+    gray = ImageDecoder(backend, size=(150, 100), channels=1).read(IMAGE)
+    assert(gray.shape == (150, 100, 1))
+    binary = ImageDecoder(backend, channels=1, threshold=127).read(IMAGE).asnumpy()
+    assert(set(np.unique(binary)) <= {0, 255})
+
+
+def test_invalid_settings():
+    with pytest.raises(CustomException):
+        ImageDecoder('gibrish')
+    with pytest.raises(CustomException):
+        ImageDecoder(channels=3, threshold=127)
+
+
+def test_dataset_with_grayscale_decoder():
+    ds = JsonIndexMultiLabelDataset("./deep_abyasa/tests/data", "chem_test_temp.json",
+                                    "images", "file", "elements",
+                                    transform=transforms.ToTensor(),
+                                    decoder=ImageDecoder('opencv', size=(128, 128), channels=1))
+    x, y, n = ds[0]
+    assert(x.shape == (1, 128, 128))
+
+
+def test_dataset_cache_shape_must_match_decoder():
+    args = ("./deep_abyasa/tests/data", "chem_test_temp.json", "images", "file", "elements")
+    ds = JsonIndexMultiLabelDataset(*args, cache_shape=[128, 128], decoder=ImageDecoder(size=(128, 128)))
+    assert(ds.cache_shape == (128, 128))
+    with pytest.raises(CustomException):
+        JsonIndexMultiLabelDataset(*args, cache_shape=(64, 64), decoder=ImageDecoder(size=(128, 128)))
+    with pytest.raises(CustomException):
+        JsonIndexMultiLabelDataset(*args, cache_shape=(64, 64), decoder=ImageDecoder())
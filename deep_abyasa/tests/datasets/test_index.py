@@ -0,0 +1,28 @@
+import numpy as np
+import pandas as pd
+from deep_abyasa import ColumnarIndex
+
+
+def make_index():
+    df = pd.DataFrame({'file': ['10091.png', '10099.png', 'abc.png', '7.png'],
+                       'elements': [['carbon', 'oxygen'], ['carbon'], 'hydrogen', []]})
+    return ColumnarIndex.from_dataframe(df, 'file', 'elements')
+
+
+def test_columnar_index_lookup():
+    index = make_index()
+    assert(len(index) == 4)
+    assert(index.file(0) == '10091.png')
+    assert(index.image_id(1) == 10099)
+    assert(np.isnan(index.image_id(2)))
+    assert(index.labels(0) == ['carbon', 'oxygen'])
+    assert(index.labels(1) == ['carbon'])
+    assert(index.labels(2) == ['hydrogen'])
+    assert(index.labels(3) == [])
+
+
+def test_columnar_index_csr():
+    index = make_index()
+    assert(index.label_offsets.tolist() == [0, 2, 3, 4, 4])
+    assert(sorted(index.label_vocab.tolist()) == ['carbon', 'hydrogen', 'oxygen'])
+    assert(index.nbytes > 0)
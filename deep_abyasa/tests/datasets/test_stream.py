@@ -0,0 +1,90 @@
+import os
+import json
+import signal
+import numpy as np
+import pytest
+from deep_abyasa import StreamingMultiLabelDataset
+from deep_abyasa import CustomException
+
+LABELS = {'carbon': 0, 'hydrogen': 1, 'nitrogen': 2, 'oxygen': 3}
+IMAGES = os.path.abspath("./deep_abyasa/tests/data/images")
+
+
+def write_index(tmp_path, rows=20):
+    with open("./deep_abyasa/tests/data/chem_test_temp.json") as f:
+        records = json.load(f)
+    records = [records[i % len(records)] for i in range(rows)]
+    with open(tmp_path / 'index-0.jsonl', 'w') as f:
+        f.write('\n'.join(json.dumps(r) for r in records[:rows // 2]) + '\n\n')
+    with open(tmp_path / 'index-1.json', 'w') as f:
+        json.dump(records[rows // 2:], f)
+    return records
+
+
+def make_dataset(tmp_path, **kwargs):
+    return StreamingMultiLabelDataset(str(tmp_path), IMAGES, 'file', 'elements', labels=LABELS, **kwargs)
+
+
+def test_streams_all_records_in_order(tmp_path):
+    records = write_index(tmp_path)
+    samples = list(make_dataset(tmp_path))
+    assert(len(samples) == len(records))
+    image, label, name = samples[1]
+    assert(image.shape == (3, 300, 300))
+    assert(label.asnumpy().tolist() == [1, 1, 0, 0])
+    assert(name == 10099.0)
+
+
+def test_shards_are_disjoint_and_complete(tmp_path):
+    records = write_index(tmp_path, rows=21)
+    for rank in range(3):
+        shard = make_dataset(tmp_path, rank=rank, world_size=3, shuffle_buffer=4, seed=1)
+        assert(len(list(shard.records())) == 7)
+    ordered = [list(make_dataset(tmp_path, rank=r, world_size=3).records()) for r in range(3)]
+    merged = [ordered[k % 3][k // 3] for k in range(21)]
+    assert([f for f, _ in merged] == [r['file'] for r in records])
+    with pytest.raises(CustomException):
+        make_dataset(tmp_path, rank=3, world_size=3)
+
+
+def test_shuffle_buffer(tmp_path):
+    write_index(tmp_path, rows=40)
+    ds = make_dataset(tmp_path, shuffle_buffer=8, seed=3)
+    ds.records = lambda: iter(range(40))
+    first = list(ds.shuffled(ds.records()))
+    ds.set_epoch(1)
+    second = list(ds.shuffled(ds.records()))
+    assert(sorted(first) == list(range(40)))
+    assert(first != list(range(40)))
+    assert(first != second)
+
+
+def test_loader_with_workers(tmp_path):
+    write_index(tmp_path, rows=20)
+    ds = make_dataset(tmp_path, shuffle_buffer=4)
+    names = []
+    for images, labels, batch_names in ds.loader(batch_size=4, num_workers=2):
+        assert(images.shape[1:] == (3, 300, 300))
+        assert(labels.shape[1] == 4)
+        names.extend(batch_names.asnumpy().tolist())
+    expected = [n for _, _, n in make_dataset(tmp_path)]
+    assert(sorted(names) == sorted(expected))
+    batches = list(ds.loader(batch_size=3, last_batch='discard'))
+    assert(len(batches) == 6)
+
+
+def test_labels_required(tmp_path):
+    write_index(tmp_path)
+    with pytest.raises(CustomException):
+        StreamingMultiLabelDataset(str(tmp_path), IMAGES, 'file', 'elements')
+
+
+def test_loader_raises_when_worker_is_killed(tmp_path, monkeypatch):
+    write_index(tmp_path, rows=20)
+    ds = make_dataset(tmp_path)
+
+    def killed(batch):
+        os.kill(os.getpid(), signal.SIGKILL)
+    monkeypatch.setattr(ds, 'make_batch', killed)
+    with pytest.raises(CustomException):
+        list(ds.loader(batch_size=4, num_workers=2, timeout=0.2))
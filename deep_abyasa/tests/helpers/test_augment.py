@@ -0,0 +1,103 @@
+import random
+import numpy as np
+import pytest
+import mxnet as mx
+from mxnet import gluon
+from mxnet.gluon.data.vision import transforms
+from deep_abyasa import BatchCompose, BatchToTensor, BatchNormalize
+from deep_abyasa import BatchRandomBrightness, BatchRandomContrast, BatchRandomSaturation
+from deep_abyasa import BatchRandomHue, BatchRandomColorJitter
+from deep_abyasa.helpers.augment import BatchRandomTransform
+from deep_abyasa.helpers.custom_exceptions import CustomException
+from deep_abyasa import JsonIndexMultiLabelDataset
+from deep_abyasa import TrainingHelpers
+
+
+def make_batch(n=4, h=5, w=6):
+    mx.random.seed(0)
+    return mx.nd.random.uniform(0, 1, shape=(n, 3, h, w))
+
+
+def test_to_tensor_matches_per_image_transform():
+    ds = JsonIndexMultiLabelDataset("./deep_abyasa/tests/data", "chem_test_temp.json",
+                                    "images", "file", "elements")
+    expected = JsonIndexMultiLabelDataset("./deep_abyasa/tests/data", "chem_test_temp.json",
+                                          "images", "file", "elements",
+                                          transform=transforms.Compose([transforms.ToTensor(),
+                                                                        transforms.Normalize(0.5, 2)]))
+    batch = mx.nd.stack(*[ds[i][0] for i in range(len(ds))])
+    out = BatchCompose([BatchToTensor(), BatchNormalize(0.5, 2)])(batch)
+    assert(np.allclose(out.asnumpy(), np.stack([expected[i][0].asnumpy() for i in range(len(ds))]), atol=1e-6))
+
+
+def fixed_factors(monkeypatch, alphas):
+    monkeypatch.setattr(BatchRandomTransform, 'factors',
+                        lambda self, batch: mx.nd.array(alphas).reshape((-1, 1, 1, 1)))
+
+
+def test_per_sample_color_transforms(monkeypatch):
+    batch = make_batch()
+    x = batch.asnumpy()
+    alphas = [0.9, 1.0, 1.05, 1.1]
+    a = np.array(alphas).reshape(-1, 1, 1, 1)
+    fixed_factors(monkeypatch, alphas)
+    gray = (x * np.array([0.299, 0.587, 0.114]).reshape(1, 3, 1, 1)).sum(axis=1, keepdims=True)
+    assert(np.allclose(BatchRandomBrightness(.1)(batch).asnumpy(), x * a, atol=1e-5))
+    assert(np.allclose(BatchRandomSaturation(.1)(batch).asnumpy(), a * x + (1 - a) * gray, atol=1e-5))
+    mean = gray.mean(axis=(2, 3), keepdims=True)
+    assert(np.allclose(BatchRandomContrast(.1)(batch).asnumpy(), a * x + (1 - a) * mean, atol=1e-5))
+
+
+def test_hue_matches_mxnet_augmenter(monkeypatch):
+    batch = make_batch(n=1)
+    monkeypatch.setattr(np.random, 'uniform', lambda low, high, n: np.full(n, 0.07))
+    monkeypatch.setattr(random, 'uniform', lambda low, high: 0.07)
+    expected = mx.image.HueJitterAug(0.1)(batch[0].transpose((1, 2, 0))).transpose((2, 0, 1))
+    assert(np.allclose(BatchRandomHue(0.1)(batch)[0].asnumpy(), expected.asnumpy(), atol=1e-5))
+
+
+def test_random_parameters_are_per_sample():
+    batch = mx.nd.ones((8, 3, 2, 2))
+    out = BatchRandomColorJitter(brightness=.5, saturation=.5)(batch).asnumpy()
+    assert(len(np.unique(out[:, 0, 0, 0].round(6))) == 8)
+
+
+def test_deterministic_drops_random_transforms():
+    augment = BatchCompose([BatchToTensor('NCHW'), BatchRandomHue(.1), BatchRandomColorJitter(.1),
+                            BatchNormalize(0, 1)])
+    assert([type(t) for t in augment.deterministic().transforms] == [BatchToTensor, BatchNormalize])
+
+
+def test_train_with_batch_transform(capsys):
+    mx.random.seed(0)
+    x = np.random.randint(0, 255, (8, 3, 4, 4)).astype('uint8')
+    y = (np.random.rand(8, 3) > 0.5).astype('float32')
+    ds = gluon.data.ArrayDataset(x, y, np.arange(8).astype('float32'))
+    dl = gluon.data.DataLoader(ds, batch_size=4)
+    net = gluon.nn.Dense(3)
+    net.initialize()
+    trainer = gluon.Trainer(net.collect_params(), 'sgd', {'learning_rate': 0.1})
+    augment = BatchCompose([BatchToTensor('NCHW'), BatchRandomColorJitter(.1, .1, .1, .1), BatchNormalize(0.5, 0.25)])
+    TrainingHelpers.train(dl, dl, net, trainer, gluon.loss.SigmoidBinaryCrossEntropyLoss(), epochs=1,
+                          batch_transform=augment, test_batch_transform=augment.deterministic())
+    assert('[Epoch 0]' in capsys.readouterr().out)
+
+
+def test_train_defaults_test_batch_transform(monkeypatch, capsys):
+    x = np.random.randint(0, 255, (8, 3, 4, 4)).astype('uint8')
+    y = (np.random.rand(8, 3) > 0.5).astype('float32')
+    dl = gluon.data.DataLoader(gluon.data.ArrayDataset(x, y, np.arange(8).astype('float32')), batch_size=4)
+    net = gluon.nn.Dense(3)
+    net.initialize()
+    trainer = gluon.Trainer(net.collect_params(), 'sgd', {'learning_rate': 0.1})
+    used = []
+    test = TrainingHelpers.test
+    monkeypatch.setattr(TrainingHelpers, 'test',
+                        lambda *args, **kwargs: used.append(kwargs['batch_transform']) or test(*args, **kwargs))
+    augment = BatchCompose([BatchToTensor('NCHW'), BatchRandomHue(.1), BatchNormalize(0.5, 0.25)])
+    TrainingHelpers.train(dl, dl, net, trainer, gluon.loss.SigmoidBinaryCrossEntropyLoss(), epochs=1,
+                          batch_transform=augment)
+    assert([type(t) for t in used[0].transforms] == [BatchToTensor, BatchNormalize])
+    with pytest.raises(CustomException):
+        TrainingHelpers.train(dl, dl, net, trainer, gluon.loss.SigmoidBinaryCrossEntropyLoss(), epochs=1,
+                              batch_transform=BatchToTensor('NCHW'))
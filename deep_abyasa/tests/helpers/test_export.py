@@ -0,0 +1,61 @@
+import os
+import numpy as np
+import mxnet as mx
+from mxnet import gluon
+from mxnet.gluon.data.vision import transforms
+from deep_abyasa import ModelExport
+from deep_abyasa import JsonIndexMultiLabelDataset
+
+
+def make_net():
+    mx.random.seed(0)
+    net = gluon.nn.HybridSequential()
+    net.add(gluon.nn.Conv2D(8, 3), gluon.nn.Activation('relu'),
+            gluon.nn.GlobalAvgPool2D(), gluon.nn.Dense(4))
+    net.initialize()
+    net.hybridize()
+    return net
+
+
+def make_loader():
+    ds = JsonIndexMultiLabelDataset("./deep_abyasa/tests/data",
+                                    "chem_test_temp.json",
+                                    "images", "file", "elements",
+                                    transform=transforms.ToTensor(),
+                                    one_hot_encode_labels=True,
+                                    determine_labels_from_y_col=True)
+    return gluon.data.DataLoader(ds, batch_size=3)
+
+
+def test_export_and_load(tmp_path):
+    net = make_net()
+    prefix = str(tmp_path / 'chem')
+    symbol_file, params_file = ModelExport.export(net, prefix, data_shape=(1, 3, 32, 32))
+    assert(os.path.isfile(symbol_file))
+    assert(os.path.isfile(params_file))
+    loaded = ModelExport.load(prefix)
+    x = mx.nd.random.uniform(shape=(2, 3, 32, 32))
+    assert(np.allclose(loaded(x).asnumpy(), net(x).asnumpy(), atol=1e-5))
+
+
+def test_export_quantized(tmp_path):
+    net = make_net()
+    net.collect_params().reset_ctx(mx.cpu(1))
+    prefix = str(tmp_path / 'chem-int8')
+    report = ModelExport.export_quantized(net, prefix, make_loader(), make_loader(), num_calib_batches=1)
+    assert(0 <= report['fp32_accuracy'] <= 1)
+    assert(0 <= report['int8_accuracy'] <= 1)
+    assert(all(p.list_ctx() == [mx.cpu(1)] for p in net.collect_params().values()))
+    loaded = ModelExport.load(prefix)
+    assert(loaded(mx.nd.zeros((1, 3, 32, 32))).shape == (1, 4))
+
+
+def test_quantize_keeps_net_context_and_predictions():
+    net = make_net()
+    net.collect_params().reset_ctx(mx.cpu(1))
+    images = next(iter(make_loader()))[0]
+    expected = net(images.as_in_context(mx.cpu(1))).asnumpy()
+    quantized = ModelExport.quantize(net, make_loader(), num_calib_batches=1)
+    assert(all(p.list_ctx() == [mx.cpu(1)] for p in net.collect_params().values()))
+    assert(np.allclose(net(images.as_in_context(mx.cpu(1))).asnumpy(), expected))
+    assert(np.allclose(quantized(images).asnumpy(), expected, atol=0.05 * np.abs(expected).max()))
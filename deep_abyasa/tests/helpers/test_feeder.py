@@ -0,0 +1,37 @@
+import pytest
+import mxnet as mx
+from deep_abyasa import PrefetchFeeder
+
+
+def batches():
+    for i in range(5):
+        yield mx.nd.full((4, 2), i), mx.nd.arange(4) + i, [['carbon']] * 4
+
+
+def test_prefetch_feeder_matches_sync():
+    ctx = [mx.cpu(0), mx.cpu(1)]
+    sync = list(PrefetchFeeder(list(batches()), ctx, depth=0))
+    prefetched = list(PrefetchFeeder(list(batches()), ctx, depth=2))
+    assert(len(prefetched) == 5)
+    for s, p in zip(sync, prefetched):
+        assert(len(p[0]) == 2)
+        assert(p[0][1].context == mx.cpu(1))
+        assert(p[0][0].asnumpy().tolist() == s[0][0].asnumpy().tolist())
+        assert(p[1][1].asnumpy().tolist() == s[1][1].asnumpy().tolist())
+        assert(p[2] == [['carbon']] * 4)
+
+
+def failing():
+    yield mx.nd.zeros((2, 2)),
+    raise ValueError('broken batch')
+
+
+def test_prefetch_feeder_raises_loader_errors():
+    with pytest.raises(ValueError):
+        list(PrefetchFeeder(failing(), [mx.cpu()], depth=2))
+
+
+def test_prefetch_feeder_stops_early():
+    feeder = iter(PrefetchFeeder(list(batches()), [mx.cpu()], depth=1))
+    next(feeder)
+    feeder.close()
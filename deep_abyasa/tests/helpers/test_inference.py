@@ -0,0 +1,90 @@
+import os
+import time
+import queue
+import numpy as np
+import mxnet as mx
+from mxnet import gluon
+from mxnet.gluon.data.vision import transforms
+from deep_abyasa import BatchPredictor
+from deep_abyasa import TrainingHelpers
+from deep_abyasa import BatchCompose, BatchToTensor, BatchRandomHue
+
+IMAGES = "./deep_abyasa/tests/data/images"
+ITOL = {0: 'carbon', 1: 'hydrogen', 2: 'nitrogen'}
+
+
+class FixedModel(gluon.Block):
+    """Predicts carbon for every image and nitrogen for bright ones"""
+    def __init__(self):
+        super(FixedModel, self).__init__()
+        self.batch_shapes = []
+
+    def forward(self, x):
+        self.batch_shapes.append(x.shape)
+        brightness = x.reshape((x.shape[0], -1)).mean(axis=1)
+        return mx.nd.stack(mx.nd.ones_like(brightness), -mx.nd.ones_like(brightness),
+                           brightness - 0.5, axis=1)
+
+
+def paths():
+    return [os.path.join(IMAGES, f) for f in sorted(os.listdir(IMAGES))]
+
+
+def test_batch_predictor_batches_and_order():
+    model = FixedModel()
+    predictor = BatchPredictor(model, ITOL, transform=transforms.ToTensor(), batch_size=2, num_workers=2)
+    results = list(predictor.predict(paths()))
+    assert([r[0] for r in results] == paths())
+    assert(all(r[1][0] == 'carbon' and 'hydrogen' not in r[1] for r in results))
+    assert(model.batch_shapes == [(2, 3, 300, 300), (2, 3, 300, 300)])
+
+
+def slow_paths():
+    yield paths()[0]
+    time.sleep(0.5)
+    yield paths()[1]
+
+
+def test_batch_predictor_max_wait():
+    predictor = BatchPredictor(FixedModel(), ITOL, transform=transforms.ToTensor(), batch_size=4, max_wait=0.05)
+    started = time.monotonic()
+    results = predictor.predict(slow_paths())
+    assert(next(results)[0] == paths()[0])
+    assert(time.monotonic() - started < 0.4)
+    assert(next(results)[0] == paths()[1])
+
+
+def test_training_helpers_predict():
+    labels = TrainingHelpers.predict(FixedModel(), IMAGES, "10091.png", ITOL, transform=transforms.ToTensor())
+    assert(labels[0] == 'carbon')
+
+
+def test_batch_predictor_close_with_blocking_paths():
+    source = queue.Queue()
+    for path in paths()[:2]:
+        source.put(path)
+    predictor = BatchPredictor(FixedModel(), ITOL, transform=transforms.ToTensor(), batch_size=4,
+                               max_wait=0.05, close_timeout=0.2)
+    results = predictor.predict(iter(source.get, None))
+    assert(next(results)[0] == paths()[0])
+    started = time.monotonic()
+    results.close()
+    assert(time.monotonic() - started < 2)
+    source.put(None)
+
+
+class RecordingModel(FixedModel):
+    def forward(self, x):
+        self.inputs = x.copy()
+        return super(RecordingModel, self).forward(x)
+
+
+def test_batch_predictor_batch_transform():
+    expected = RecordingModel()
+    list(BatchPredictor(expected, ITOL, transform=transforms.ToTensor(), batch_size=4).predict(paths()))
+    model = RecordingModel()
+    augment = BatchCompose([BatchToTensor(), BatchRandomHue(.5)])
+    labels = TrainingHelpers.predict_many(model, paths(), ITOL, batch_size=4,
+                                          batch_transform=augment.deterministic())
+    assert([l[0] for l in labels] == paths())
+    assert(np.allclose(model.inputs.asnumpy(), expected.inputs.asnumpy()))
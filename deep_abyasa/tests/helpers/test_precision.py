@@ -0,0 +1,63 @@
+import numpy as np
+import mxnet as mx
+import pytest
+from mxnet import gluon, autograd as ag
+from deep_abyasa import TrainingHelpers, MixedPrecision, DynamicLossScaler
+from deep_abyasa.helpers.custom_exceptions import CustomException
+from deep_abyasa.tests.helpers.test_training import make_setup
+
+
+def test_loss_scaling_matches_unscaled_training(capsys):
+    weights = []
+    for scaler in (None, DynamicLossScaler(init_scale=2.**10)):
+        train_dl, test_dl, net, trainer = make_setup()
+        TrainingHelpers.train(train_dl, test_dl, net, trainer,
+                              gluon.loss.SigmoidBinaryCrossEntropyLoss(), epochs=2, loss_scaler=scaler)
+        weights.append(net.weight.data().asnumpy())
+    assert(np.allclose(weights[0], weights[1], atol=1e-6))
+
+
+def test_overflow_skips_step_and_adjusts_scale():
+    net = gluon.nn.Dense(2, in_units=2)
+    net.initialize()
+    trainer = gluon.Trainer(net.collect_params(), 'sgd', {'learning_rate': 0.1})
+    scaler = DynamicLossScaler(init_scale=8., window=2)
+    before = net.weight.data().asnumpy()
+    with ag.record():
+        scaled = scaler.scale_loss([net(mx.nd.array([[np.inf, 1]])).sum()])
+    for l in scaled:
+        l.backward()
+    assert(not scaler.step(trainer, net.collect_params().values(), 1))
+    assert(scaler.scale == 4. and scaler.skipped == 1)
+    assert(np.array_equal(before, net.weight.data().asnumpy()))
+    for _ in range(2):
+        with ag.record():
+            scaled = scaler.scale_loss([net(mx.nd.ones((1, 2))).sum()])
+        for l in scaled:
+            l.backward()
+        assert(scaler.step(trainer, net.collect_params().values(), 1))
+    assert(scaler.scale == 8.)
+
+
+def test_master_weights_sets_multi_precision(capsys):
+    net = gluon.nn.Dense(2, in_units=2)
+    net.initialize()
+    trainer = gluon.Trainer(net.collect_params(), 'sgd', {'learning_rate': 0.1})
+    MixedPrecision.master_weights(trainer)
+    assert(trainer.optimizer.multi_precision)
+
+
+def test_invalid_dtype():
+    with pytest.raises(CustomException):
+        MixedPrecision.input_dtype('int8')
+
+
+def test_bfloat16_model_trains(capsys):
+    train_dl, test_dl, _, _ = make_setup()
+    net = TrainingHelpers.get_model('resnet18_v1', mx.cpu(), 3, pretrained=False, dtype='bfloat16',
+                                    data_shape=(1, 3, 4, 4))
+    assert(all(p.dtype == np.float32 for p in net.collect_params().values()))
+    trainer = gluon.Trainer(net.collect_params(), 'sgd', {'learning_rate': 0.1})
+    TrainingHelpers.train(train_dl, test_dl, net, trainer, gluon.loss.SigmoidBinaryCrossEntropyLoss(),
+                          epochs=1, dtype='bfloat16')
+    assert('[Epoch 0]' in capsys.readouterr().out)
@@ -0,0 +1,62 @@
+import mxnet as mx
+from mxnet import gluon
+from deep_abyasa import ModelRegistry
+from deep_abyasa import TrainingHelpers
+
+
+class CountingBuilder:
+    def __init__(self):
+        self.built = []
+
+    def __call__(self, model_name, ctx, out_len, pretrained=True, model_param=None):
+        self.built.append((model_name, out_len, model_param, pretrained))
+        net = gluon.nn.Dense(out_len)
+        net.initialize(ctx=ctx)
+        net.hybridize()
+        return net
+
+
+def test_registry_reuses_models():
+    builder = CountingBuilder()
+    registry = ModelRegistry(builder=builder, warmup_shape=(1, 3, 8, 8))
+    net = registry.get('resnet', 4)
+    assert(registry.get('resnet', 4) is net)
+    assert(registry.get('resnet', 4, ctx=[mx.cpu()]) is net)
+    assert(registry.get('resnet', 5) is not net)
+    assert(len(builder.built) == 2)
+    assert(ModelRegistry.make_key('resnet', 4, None, mx.cpu()) in registry)
+
+
+def test_registry_keys_on_pretrained():
+    builder = CountingBuilder()
+    registry = ModelRegistry(builder=builder, warmup_shape=None)
+    pretrained = registry.get('resnet', 4)
+    scratch = registry.get('resnet', 4, pretrained=False)
+    assert(scratch is not pretrained)
+    assert(registry.get('resnet', 4, pretrained=False) is scratch)
+    assert([b[3] for b in builder.built] == [True, False])
+    assert(registry.evict('resnet', 4, pretrained=False))
+    assert(registry.get('resnet', 4) is pretrained)
+
+
+def test_registry_evicts_least_recently_used():
+    builder = CountingBuilder()
+    registry = ModelRegistry(max_models=2, builder=builder, warmup_shape=None)
+    first = registry.get('a', 2)
+    registry.get('b', 2)
+    registry.get('a', 2)
+    registry.get('c', 2)
+    assert(len(registry) == 2)
+    assert(registry.get('a', 2) is first)
+    assert(len(builder.built) == 3)
+    assert(registry.evict('a', 2))
+    assert(not registry.evict('a', 2))
+    registry.clear()
+    assert(len(registry) == 0)
+
+
+def test_get_ctx_is_cached():
+    ctx = TrainingHelpers.get_ctx(-1)
+    assert(ctx == [mx.cpu()])
+    ctx.append(mx.cpu(1))
+    assert(TrainingHelpers.get_ctx(-1) == [mx.cpu()])
@@ -0,0 +1,96 @@
+import io
+import json
+import asyncio
+import pytest
+import mxnet as mx
+from mxnet import gluon
+from mxnet.gluon.data.vision import transforms
+from deep_abyasa import MicroBatchServer
+
+ITOL = {0: 'carbon', 1: 'hydrogen'}
+
+
+class CarbonModel(gluon.Block):
+    def __init__(self):
+        super(CarbonModel, self).__init__()
+        self.batch_shapes = []
+
+    def forward(self, x):
+        self.batch_shapes.append(x.shape)
+        return mx.nd.stack(mx.nd.ones(x.shape[0]), -mx.nd.ones(x.shape[0]), axis=1)
+
+
+async def request(port, method, path, body=b''):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(f'{method} {path} HTTP/1.1\r\nContent-Length: {len(body)}\r\n'
+                 f'Connection: close\r\n\r\n'.encode('latin-1') + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, payload = response.partition(b'\r\n\r\n')
+    return head.split(b' ')[1].decode(), json.loads(payload)
+
+
+class SizedCarbonModel(CarbonModel):
+    def forward(self, x):
+        if x.shape[2] != 300:
+            raise ValueError('model expects 300x300 images')
+        return super(SizedCarbonModel, self).forward(x)
+
+
+def run_server(coroutine, model_class=CarbonModel):
+    async def main():
+        model = model_class()
+        server = MicroBatchServer(model, ITOL, transform=transforms.ToTensor(),
+                                  max_batch_size=4, max_latency=0.2)
+        http = await server.start(port=0)
+        try:
+            return model, await coroutine(server, http.sockets[0].getsockname()[1])
+        finally:
+            await server.stop(http)
+    return asyncio.run(main())
+
+
+def test_server_batches_concurrent_requests():
+    with open('./deep_abyasa/tests/data/images/10091.png', 'rb') as f:
+        image = f.read()
+
+    async def load(server, port):
+        responses = await asyncio.gather(*[request(port, 'POST', '/predict', image) for _ in range(4)])
+        return responses, await request(port, 'GET', '/metrics')
+
+    model, (responses, metrics) = run_server(load)
+    assert(all(r == ('200', {'labels': ['carbon']}) for r in responses))
+    assert(model.batch_shapes == [(4, 3, 300, 300)])
+    assert(metrics[1]['request_latency_ms']['count'] == 4)
+    assert(metrics[1]['batch_size']['counts'][3] == 1)
+
+
+def test_server_errors():
+    async def load(server, port):
+        return (await request(port, 'POST', '/predict', b'not an image'),
+                await request(port, 'GET', '/nothing'),
+                await request(port, 'GET', '/health'))
+
+    _, (bad, missing, health) = run_server(load)
+    assert(bad[0] == '400')
+    assert(missing[0] == '404')
+    assert(health == ('200', {'status': 'ok'}))
+
+
+def test_server_fails_only_the_bad_request():
+    Image = pytest.importorskip('PIL.Image')
+    with open('./deep_abyasa/tests/data/images/10091.png', 'rb') as f:
+        image = f.read()
+    small = io.BytesIO()
+    Image.new('RGB', (50, 50)).save(small, format='PNG')
+
+    async def load(server, port):
+        return await asyncio.gather(request(port, 'POST', '/predict', image),
+                                    request(port, 'POST', '/predict', small.getvalue()),
+                                    request(port, 'POST', '/predict', image))
+
+    model, (good, bad, other) = run_server(load, SizedCarbonModel)
+    assert(good == other == ('200', {'labels': ['carbon']}))
+    assert(bad[0] == '500')
+    assert(model.batch_shapes == [(4, 3, 300, 300)])
@@ -0,0 +1,142 @@
+import numpy as np
+import pytest
+import mxnet as mx
+from mxnet import gluon
+from deep_abyasa import TrainingHelpers
+from deep_abyasa import AccuracyMultiLabel
+
+
+def make_setup():
+    mx.random.seed(0)
+    np.random.seed(0)
+    x = np.random.rand(16, 3, 4, 4).astype('float32')
+    y = (np.random.rand(16, 3) > 0.5).astype('float32')
+    names = np.arange(16).astype('float32')
+    ds = gluon.data.ArrayDataset(x, y, names)
+    train_dl = gluon.data.DataLoader(ds, batch_size=4)
+    test_dl = gluon.data.DataLoader(ds, batch_size=4)
+    net = gluon.nn.Dense(3)
+    net.initialize(mx.init.Xavier())
+    trainer = gluon.Trainer(net.collect_params(), 'sgd', {'learning_rate': 0.1})
+    return train_dl, test_dl, net, trainer
+
+
+def test_train_runs(capsys):
+    train_dl, test_dl, net, trainer = make_setup()
+    status = TrainingHelpers.train(train_dl, test_dl, net, trainer,
+                                   gluon.loss.SigmoidBinaryCrossEntropyLoss(), epochs=2)
+    assert(isinstance(status, dict))
+    assert('[Epoch 1]' in capsys.readouterr().out)
+
+
+def test_train_prefetch_matches(capsys):
+    outputs = []
+    for prefetch in (0, 2):
+        train_dl, test_dl, net, trainer = make_setup()
+        TrainingHelpers.train(train_dl, test_dl, net, trainer,
+                              gluon.loss.SigmoidBinaryCrossEntropyLoss(), epochs=2, prefetch=prefetch)
+        outputs.append(net.weight.data().asnumpy())
+    assert(np.allclose(outputs[0], outputs[1]))
+
+
+def test_train_deferred_sync_prints_same_numbers(capsys):
+    printed = []
+    for deferred_sync in (False, True):
+        train_dl, test_dl, net, trainer = make_setup()
+        TrainingHelpers.train(train_dl, test_dl, net, trainer,
+                              gluon.loss.SigmoidBinaryCrossEntropyLoss(), epochs=2,
+                              deferred_sync=deferred_sync, log_interval=2)
+        out = capsys.readouterr().out
+        printed.append([l.split('| time')[0] for l in out.splitlines() if l.startswith('[Epoch')])
+    assert(len(printed[0]) == 6)
+    assert(printed[0] == printed[1])
+
+
+def test_train_deferred_sync_collects_incorrect_preds(capsys, monkeypatch):
+    statuses = []
+    for deferred_sync in (False, True):
+        train_dl, test_dl, net, trainer = make_setup()
+        if deferred_sync:
+            monkeypatch.setattr(AccuracyMultiLabel, 'get_incorrect_preds',
+                                lambda *args: pytest.fail('syncs every batch'))
+        status = TrainingHelpers.train(train_dl, test_dl, net, trainer,
+                                       gluon.loss.SigmoidBinaryCrossEntropyLoss(), epochs=2,
+                                       metric=AccuracyMultiLabel(), deferred_sync=deferred_sync)
+        statuses.append({k: [a.tolist() for a in v] for k, v in status.items()})
+    assert(statuses[0] and statuses[0] == statuses[1])
+
+
+def test_train_accepts_loader_without_len(capsys):
+    train_dl, test_dl, net, trainer = make_setup()
+
+    class Unsized:
+        def __iter__(self):
+            return iter(train_dl)
+    TrainingHelpers.train(Unsized(), test_dl, net, trainer,
+                          gluon.loss.SigmoidBinaryCrossEntropyLoss(), epochs=1)
+    assert('[Epoch 0]' in capsys.readouterr().out)
+
+
+def train_weights(batch_size, ctx=(mx.cpu(),), **kwargs):
+    train_dl, test_dl, _, _ = make_setup()
+    mx.random.seed(0)
+    net = gluon.nn.Dense(3, in_units=48)
+    net.initialize(mx.init.Xavier(), ctx=list(ctx))
+    trainer = gluon.Trainer(net.collect_params(), 'sgd', {'learning_rate': 0.1})
+    train_dl = gluon.data.DataLoader(train_dl._dataset, batch_size=batch_size)
+    TrainingHelpers.train(train_dl, test_dl, net, trainer,
+                          gluon.loss.SigmoidBinaryCrossEntropyLoss(), epochs=2, **kwargs)
+    return net, trainer
+
+
+def test_train_accumulate_matches_large_batch(capsys):
+    large, _ = train_weights(8)
+    accumulated, _ = train_weights(4, accumulate=2)
+    assert(np.allclose(large.weight.data().asnumpy(), accumulated.weight.data().asnumpy(), atol=1e-6))
+    assert(accumulated.weight.grad_req == 'write')
+
+
+def test_train_accumulate_flushes_partial_window(capsys):
+    large, _ = train_weights(16)
+    accumulated, _ = train_weights(6, accumulate=4)
+    assert(np.allclose(large.weight.data().asnumpy(), accumulated.weight.data().asnumpy(), atol=1e-6))
+
+
+def test_train_normalizes_by_global_batch_on_uneven_split(capsys, monkeypatch):
+    single, _ = train_weights(4)
+    ctx = [mx.cpu(0), mx.cpu(1), mx.cpu(2)]
+    monkeypatch.setattr(TrainingHelpers, 'get_ctx', lambda num_gpus: list(ctx))
+    split, _ = train_weights(4, ctx=ctx)
+    assert(np.allclose(single.weight.data().asnumpy(), split.weight.data(mx.cpu(0)).asnumpy(), atol=1e-6))
+
+
+def test_train_linear_lr_scaling_combines_with_lr_steps(capsys):
+    _, trainer = train_weights(4, accumulate=2, base_batch_size=4, lr_steps=[1, np.inf], lr_factor=0.5)
+    assert(np.isclose(trainer.learning_rate, 0.1 * 2 * 0.5))
+    assert('effective batch size 8' in capsys.readouterr().out)
+
+
+def test_train_linear_lr_scaling_applies_once_per_trainer(capsys):
+    train_dl, test_dl, net, trainer = make_setup()
+    for _ in range(2):
+        TrainingHelpers.train(train_dl, test_dl, net, trainer, gluon.loss.SigmoidBinaryCrossEntropyLoss(),
+                              epochs=1, accumulate=2, base_batch_size=4)
+    assert(np.isclose(trainer.learning_rate, 0.1 * 2))
+    TrainingHelpers.train(train_dl, test_dl, net, trainer, gluon.loss.SigmoidBinaryCrossEntropyLoss(),
+                          epochs=1, accumulate=4, base_batch_size=4)
+    assert(np.isclose(trainer.learning_rate, 0.1 * 4))
+
+
+def test_train_accumulate_restores_grad_req_on_error(capsys):
+    train_dl, test_dl, net, trainer = make_setup()
+
+    def failing_loss(yhat, y):
+        if failing_loss.calls == 2:
+            raise RuntimeError('loss failed')
+        failing_loss.calls += 1
+        return gluon.loss.SigmoidBinaryCrossEntropyLoss()(yhat, y)
+    failing_loss.calls = 0
+    with pytest.raises(RuntimeError):
+        TrainingHelpers.train(train_dl, test_dl, net, trainer, failing_loss, epochs=1, accumulate=4)
+    assert(net.weight.grad_req == 'write')
+    assert((net.weight.grad() == 0).asnumpy().all())
@@ -28,3 +28,51 @@ def test_accuracy_multi_get_incorrect_pred():
     assert(metric.pred_status[1][0].tolist() == [0, 1, 0])
     assert (metric.pred_status[1][1].tolist() == [0, 1, 1])
 
+
+
+def test_accuracy_multi_update_deferred():
+    metric = AccuracyMultiLabel()
+    labels = mx.nd.array([[0, 1, 1], [0, 1, 0]])
+    preds = mx.nd.array([[0, 1, 0], [0, 1, 0]])
+    metric.update_deferred([labels], [preds])
+    metric.update_deferred([labels], [preds])
+    assert(metric.num_inst == 4)
+    assert(metric.sum_metric == 0)
+    assert(metric.get() == ('accuracy_multi', 0.5))
+    assert(metric.sum_metric == 2)
+    metric.update_deferred([labels], [preds])
+    metric.reset()
+    assert(metric.num_inst == 0)
+    assert(metric.pending == {})
+
+
+def test_accuracy_multi_update_on_device():
+    metric = AccuracyMultiLabel(on_device=True)
+    labels = mx.nd.array([[0, 1, 1], [0, 1, 0], [1, 1, 1]])
+    preds = mx.nd.array([[0, 1, 0], [0, 1, 0], [1, 1, 1]])
+    metric.update([labels], [preds])
+    assert(metric.num_inst == 3)
+    assert(metric.sum_metric == 2)
+
+
+def test_accuracy_multi_get_incorrect_pred_flat_names():
+    metric = AccuracyMultiLabel()
+    labels = mx.nd.array([[0, 1, 1], [0, 1, 0], [1, 0, 0]])
+    preds = mx.nd.array([[0, 1, 0], [0, 1, 0], [1, 1, 0]])
+    names = mx.nd.array([10091, 10099, 10100])
+    metric.get_incorrect_preds([labels], [preds], [names])
+    assert(sorted(metric.pred_status.keys()) == [10091, 10100])
+    assert(metric.pred_status[10100][0].tolist() == [1, 1, 0])
+
+
+def test_accuracy_multi_get_incorrect_pred_deferred():
+    metric = AccuracyMultiLabel()
+    labels = mx.nd.array([[0, 1, 1], [0, 1, 0], [1, 0, 0]])
+    preds = mx.nd.array([[0, 1, 0], [0, 1, 0], [1, 1, 0]])
+    names = mx.nd.array([10091, 10099, 10100])
+    metric.get_incorrect_preds_deferred([labels], [preds], [names])
+    assert(metric.pred_status == {})
+    metric.get()
+    assert(sorted(metric.pred_status.keys()) == [10091, 10100])
+    assert(metric.pred_status[10100][0].tolist() == [1, 1, 0])
+    assert(metric.pending_preds == [])
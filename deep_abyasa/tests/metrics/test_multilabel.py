@@ -0,0 +1,45 @@
+import numpy as np
+import mxnet as mx
+from deep_abyasa import MultiLabelMetrics
+
+LABELS = mx.nd.array([[1, 0, 1], [0, 1, 0], [1, 1, 0], [0, 0, 1]])
+PREDS = mx.nd.array([[1, 0, 1], [0, 1, 1], [1, 0, 0], [0, 0, 1]])
+
+
+def test_multilabel_metrics():
+    metric = MultiLabelMetrics()
+    metric.update([LABELS], [PREDS])
+    names, values = metric.get()
+    result = dict(zip(names, values))
+    assert(result['exact_match'] == 0.5)
+    assert(result['hamming_loss'] == 2 / 12)
+    assert(result['micro_precision'] == 5 / 6)
+    assert(result['micro_recall'] == 5 / 6)
+    assert(np.isclose(result['micro_f1'], 5 / 6))
+    per_class = metric.get_per_class()
+    assert(per_class['precision'].tolist() == [1, 1, 2 / 3])
+    assert(per_class['recall'].tolist() == [1, 0.5, 1])
+    assert(per_class['support'].tolist() == [2, 2, 2])
+    assert(np.isclose(result['macro_precision'], (1 + 1 + 2 / 3) / 3))
+
+
+def test_multilabel_metrics_threshold():
+    metric = MultiLabelMetrics(threshold=0)
+    metric.update([LABELS], [PREDS * 4 - 2])
+    assert(dict(zip(*metric.get()))['exact_match'] == 0.5)
+
+
+def test_multilabel_metrics_merge():
+    whole = MultiLabelMetrics()
+    whole.update([LABELS], [PREDS])
+    first, second = MultiLabelMetrics(), MultiLabelMetrics()
+    first.update([LABELS[:2]], [PREDS[:2]])
+    second.update([LABELS[2:]], [PREDS[2:]])
+    merged = MultiLabelMetrics().merge(first).merge(second.get_state())
+    assert(merged.get() == whole.get())
+
+
+def test_multilabel_metrics_empty():
+    names, values = MultiLabelMetrics().get()
+    assert(len(names) == len(values))
+    assert(np.isnan(values[0]))
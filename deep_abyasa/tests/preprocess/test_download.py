@@ -1,10 +1,201 @@
 from deep_abyasa import Download
 import os.path
 import shutil
+import io
+import json
+import hashlib
+import tarfile
+import threading
+import pytest
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from deep_abyasa import CustomException
 
 def test_download_unzip():
     Download('temp_2')
     assert(os.path.isfile('temp_2.tar.gz'))
     assert(os.path.isdir('temp_2'))
     os.remove('temp_2.tar.gz')
-    shutil.rmtree('temp_2')
\ No newline at end of file
+    shutil.rmtree('temp_2')
+
+def make_tarball(dataset):
+    """tar.gz bytes of a directory named dataset holding one file of random
+       (incompressible) bytes"""
+    data = os.urandom(300_000)
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w:gz') as tar:
+        info = tarfile.TarInfo(f'{dataset}/data.bin')
+        info.size = len(data)
+        tar.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def server():
+    """Local HTTP server serving files from a dict, with Range support
+       unless ranges is False. Records the Range header of every GET"""
+    files, requests, settings = {}, [], {'ranges': True}
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def send_file(self, body):
+            content = files.get(self.path.lstrip('/'))
+            if content is None:
+                self.send_error(404)
+                return
+            status, start, end = 200, 0, len(content) - 1
+            header = self.headers.get('Range')
+            if body:
+                requests.append(header)
+            if header and settings['ranges']:
+                start, end = (int(v) for v in header.split('=')[1].split('-'))
+                status = 206
+            self.send_response(status)
+            self.send_header('Content-Length', str(end - start + 1))
+            self.send_header('ETag', hashlib.md5(content).hexdigest())
+            if settings['ranges']:
+                self.send_header('Accept-Ranges', 'bytes')
+            if status == 206:
+                self.send_header('Content-Range', f'bytes {start}-{end}/{len(content)}')
+            self.end_headers()
+            if body:
+                self.wfile.write(content[start:end + 1])
+
+        def do_HEAD(self):
+            self.send_file(False)
+
+        def do_GET(self):
+            self.send_file(True)
+
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{httpd.server_address[1]}', files, requests, settings
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_parallel_ranged_download(server, tmp_path):
+    root, files, requests, _ = server
+    files['ds.tar.gz'] = make_tarball('ds')
+    files['SHA256SUMS'] = f"{hashlib.sha256(files['ds.tar.gz']).hexdigest()}  ds.tar.gz\n".encode()
+    reports = []
+    d = Download('ds', root=root, save_at=str(tmp_path), num_connections=3, chunk_size=64 << 10,
+                 manifest=f'{root}/SHA256SUMS', progress=lambda *r: reports.append(r))
+    assert(d.has_downloaded)
+    assert((tmp_path / 'ds.tar.gz').read_bytes() == files['ds.tar.gz'])
+    assert((tmp_path / 'ds' / 'data.bin').is_file())
+    assert(not (tmp_path / 'ds.tar.gz.part').exists())
+    assert(not (tmp_path / 'ds.tar.gz.part.json').exists())
+    size = len(files['ds.tar.gz'])
+    assert(len([r for r in requests if r is not None]) == -(-size // (64 << 10)))
+    assert(reports[-1][:2] == (size, size))
+
+
+def test_resume_fetches_only_missing_chunks(server, tmp_path):
+    root, files, requests, _ = server
+    content = files['ds.tar.gz'] = make_tarball('ds')
+    chunk = 64 << 10
+    part = bytearray(len(content))
+    part[:2 * chunk] = content[:2 * chunk]
+    (tmp_path / 'ds.tar.gz.part').write_bytes(bytes(part))
+    (tmp_path / 'ds.tar.gz.part.json').write_text(json.dumps(
+        {'size': len(content), 'chunk_size': chunk,
+         'validator': hashlib.md5(content).hexdigest(), 'done': [0, 1]}))
+    Download('ds', root=root, save_at=str(tmp_path), chunk_size=chunk,
+             sha256=hashlib.sha256(content).hexdigest())
+    assert((tmp_path / 'ds.tar.gz').read_bytes() == content)
+    assert(all(not r.startswith(('bytes=0-', f'bytes={chunk}-')) for r in requests))
+    assert(len(requests) == -(-len(content) // chunk) - 2)
+
+
+def test_checksum_mismatch(server, tmp_path):
+    root, files, _, _ = server
+    files['ds.tar.gz'] = make_tarball('ds')
+    with pytest.raises(CustomException):
+        Download('ds', root=root, save_at=str(tmp_path), sha256='0' * 64)
+    assert(not (tmp_path / 'ds.tar.gz').exists())
+    assert(not (tmp_path / 'ds.tar.gz.part').exists())
+
+
+def test_without_ranges_and_cache_hit(server, tmp_path):
+    root, files, requests, settings = server
+    settings['ranges'] = False
+    files['ds.tar.gz'] = make_tarball('ds')
+    Download('ds', root=root, save_at=str(tmp_path), chunk_size=64 << 10)
+    assert((tmp_path / 'ds.tar.gz').read_bytes() == files['ds.tar.gz'])
+    assert(requests == [None])
+    d = Download('ds', root=root, save_at=str(tmp_path))
+    assert(not d.has_downloaded)
+    assert(requests == [None])
+
+
+def add_file(tar, name, data, mtime=1_600_000_000):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mtime = mtime
+    tar.addfile(info, io.BytesIO(data))
+
+
+def test_stream_extracts_while_downloading(server, tmp_path):
+    root, files, requests, _ = server
+    content = files['ds.tar.gz'] = make_tarball('ds')
+    d = Download('ds', root=root, save_at=str(tmp_path), stream=True,
+                 sha256=hashlib.sha256(content).hexdigest())
+    assert(d.has_downloaded)
+    assert(requests == [None])
+    assert((tmp_path / 'ds' / 'data.bin').is_file())
+    assert((tmp_path / 'ds.tar.gz').read_bytes() == content)
+    assert(not (tmp_path / 'ds.tar.gz.part').exists())
+
+
+def test_extract_skips_unsafe_members(tmp_path):
+    save_at = tmp_path / 'save'
+    save_at.mkdir()
+    with tarfile.open(save_at / 'ds.tar.gz', 'w:gz') as tar:
+        add_file(tar, 'ds/ok.txt', b'ok')
+        add_file(tar, '../evil.txt', b'evil')
+        add_file(tar, '/tmp/abs_evil.txt', b'evil')
+        add_file(tar, 'ds/../../evil2.txt', b'evil')
+        link = tarfile.TarInfo('ds/link')
+        link.type = tarfile.SYMTYPE
+        link.linkname = '/etc/passwd'
+        tar.addfile(link)
+    d = Download('ds', save_at=str(save_at))
+    assert((save_at / 'ds' / 'ok.txt').read_bytes() == b'ok')
+    assert(d.extracted == 1)
+    assert(not (tmp_path / 'evil.txt').exists())
+    assert(not (tmp_path / 'evil2.txt').exists())
+    assert(not os.path.exists('/tmp/abs_evil.txt'))
+    assert(not os.path.lexists(save_at / 'ds' / 'link'))
+
+
+def test_extract_skips_current_files(tmp_path):
+    with tarfile.open(tmp_path / 'ds.tar.gz', 'w:gz') as tar:
+        for i in range(5):
+            add_file(tar, f'ds/{i}.txt', str(i).encode())
+    d = Download('ds', save_at=str(tmp_path))
+    assert(d.extracted == 5)
+    (tmp_path / 'ds' / '3.txt').write_bytes(b'changed')
+    with open(tmp_path / 'ds.tar.gz', 'rb') as f:
+        d.extract(f)
+    assert(d.skipped == 4)
+    assert(d.extracted == 6)
+    assert((tmp_path / 'ds' / '3.txt').read_bytes() == b'3')
+    assert(os.stat(tmp_path / 'ds' / '0.txt').st_mtime == 1_600_000_000)
+
+
+def test_extract_handler(tmp_path):
+    with tarfile.open(tmp_path / 'ds.tar.gz', 'w:gz') as tar:
+        add_file(tar, 'ds/a.png', b'a')
+        add_file(tar, 'ds/b.json', b'{}')
+    seen = {}
+
+    def handler(path, data):
+        seen[os.path.relpath(path, tmp_path)] = data
+        return path.endswith('.png')
+    Download('ds', save_at=str(tmp_path), handler=handler)
+    assert(seen == {'ds/a.png': b'a', 'ds/b.json': b'{}'})
+    assert(not (tmp_path / 'ds' / 'a.png').exists())
+    assert((tmp_path / 'ds' / 'b.json').is_file())
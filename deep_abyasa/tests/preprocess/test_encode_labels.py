@@ -1,3 +1,4 @@
+import json
 import pytest
 from deep_abyasa import Utils
 from deep_abyasa import Encode_Labels
@@ -101,3 +102,103 @@ def test_encode_from_pickle_values():
     assert (itol[0] == 'actinium')
     assert (ltoi['actinium'] == 0)
 
+
+
+def test_one_hot_encode():
+    ltoi = {'f1': 0, 'f2': 1, 'f3': 2}
+    matrix = Encode_Labels.one_hot_encode([['f1', 'f3'], 'f2', []], ltoi)
+    assert(matrix.tolist() == [[1, 0, 1], [0, 1, 0], [0, 0, 0]])
+    packed = Encode_Labels.one_hot_encode([['f1', 'f3'], 'f2', []], ltoi, packed=True)
+    assert(packed.shape == (3, 1))
+    assert(packed[0, 0] == 0b10100000)
+
+
+def test_one_hot_encode_unknown_label():
+    with pytest.raises(CustomException):
+        Encode_Labels.one_hot_encode([['f1', 'gibrish']], {'f1': 0})
+
+
+def test_encode_from_index_files_in_process_pool():
+    args = ('./deep_abyasa/tests/data', "label")
+    kwargs = dict(pattern="multi[0-9].json", multi_label=True)
+    assert(Encode_Labels.encode_from_index_files(*args, num_workers=2, **kwargs) ==
+           Encode_Labels.encode_from_index_files(*args, **kwargs))
+
+
+def test_encode_from_json_lines_chunks(tmp_path):
+    rows = [{"file": f"file{i}", "label": f"f{i % 7};g{i % 3}"} for i in range(50)]
+    for part in range(2):
+        with open(tmp_path / f'index{part}.jsonl', 'w') as f:
+            f.write('\n'.join(json.dumps(r) for r in rows[part::2]))
+    itol, ltoi = Encode_Labels.encode_from_index_files(str(tmp_path), "label", pattern=r".*\.jsonl",
+                                                       multi_label=True, multi_label_delimiter=";",
+                                                       num_workers=2, lines=True, chunksize=4)
+    assert(list(itol.values()) == sorted([f'f{i}' for i in range(7)] + [f'g{i}' for i in range(3)]))
+    with pytest.raises(CustomException):
+        Encode_Labels.encode_from_index_files(str(tmp_path), "label", pattern=r".*\.jsonl", chunksize=4)
+
+
+def test_extract_multi_labels_with_scalar_rows():
+    labels = Utils.read_json("./deep_abyasa/tests/data/multi1.json")['label']
+    assert(sorted(Encode_Labels.extract_multi_labels_from_arraylike_cols(labels)) == ['f1', 'f2', 'f2e', 'f3', 'f4e'])
+
+
+def test_label_statistics():
+    stats = Encode_Labels.label_statistics([['f1', 'f2'], 'f2', ['f1', 'f2', 'f3'], []], chunk_size=3)
+    assert(stats['ltoi'] == {'f1': 0, 'f2': 1, 'f3': 2})
+    assert(stats['counts'].tolist() == [2, 3, 1])
+    assert(stats['cooccurrence'].tolist() == [[2, 2, 1], [2, 3, 1], [1, 1, 1]])
+    delimited = Encode_Labels.label_statistics(['f1; f2', 'f2', 'f1;f2;f3', 'f3'], ltoi=stats['ltoi'],
+                                               multi_label_delimiter=';')
+    assert(delimited['counts'].tolist() == [2, 3, 2])
+
+
+def test_encode_from_pickle_missing_file():
+    with pytest.raises(FileNotFoundError):
+        Encode_Labels.encode_from_pickle("./deep_abyasa/tests/data/gibrish.pkl")
+
+
+def test_vocabulary_round_trip(tmp_path):
+    source = "./deep_abyasa/tests/data/sample.json"
+    path = str(tmp_path / 'vocabulary.json')
+    Encode_Labels.write_vocabulary(path, {'f2': 1, 'f1': 0}, counts=[3, 4], source=source)
+    itol, ltoi, counts = Encode_Labels.read_vocabulary(path, source=source, with_counts=True)
+    assert(itol == {0: 'f1', 1: 'f2'})
+    assert(ltoi == {'f1': 0, 'f2': 1})
+    assert(counts == [3, 4])
+    assert(Encode_Labels.read_vocabulary(path, source="./deep_abyasa/tests/data/sample2.json") is None)
+    assert(Encode_Labels.read_vocabulary(str(tmp_path / 'missing.json')) is None)
+    with open(path, 'w') as f:
+        json.dump({'format_version': 99}, f)
+    with pytest.raises(CustomException):
+        Encode_Labels.read_vocabulary(path)
+
+
+def test_encode_from_index_files_vocabulary_skips_scan(tmp_path, monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError('index files should not be scanned')
+
+    path = str(tmp_path / 'vocabulary.json')
+    kwargs = dict(pattern="multi[0-9].json", multi_label=True, vocabulary_file=path)
+    expected = Encode_Labels.encode_from_index_files('./deep_abyasa/tests/data', "label", **kwargs)
+    _, _, counts = Encode_Labels.read_vocabulary(path, with_counts=True)
+    assert(len(counts) == len(expected[0]) and all(c > 0 for c in counts))
+    monkeypatch.setattr(Encode_Labels, 'extract_labels_from_file', fail)
+    assert(Encode_Labels.encode_from_index_files('./deep_abyasa/tests/data', "label", **kwargs) == expected)
+
+
+def test_encode_from_index_files_vocabulary_other_settings(tmp_path):
+    path = str(tmp_path / 'vocabulary.json')
+    split = Encode_Labels.encode_from_index_files('./deep_abyasa/tests/data', "label", files=["sample3.json"],
+                                                  vocabulary_file=path, multi_label=True,
+                                                  multi_label_delimiter=';')
+    rescanned = Encode_Labels.encode_from_index_files('./deep_abyasa/tests/data', "label", files=["sample3.json"],
+                                                      vocabulary_file=path, multi_label=False)
+    assert(rescanned != split)
+
+
+def test_encode_from_index_files_counts():
+    counts = Encode_Labels.count_labels([['f1', 'f2'], 'f2', []], multi_label=True)
+    assert(counts == {'f1': 1, 'f2': 2})
+    assert(Encode_Labels.count_labels(['f1; f2', 'f2'], True, ';') == {'f1': 1, 'f2': 2})
+    assert(Encode_Labels.count_labels(['f1', 'f1']) == {'f1': 2})
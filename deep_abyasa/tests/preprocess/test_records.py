@@ -0,0 +1,101 @@
+import math
+import os
+import shutil
+import tarfile
+import numpy as np
+from deep_abyasa import Download
+from deep_abyasa import RecordShards
+from deep_abyasa import JsonIndexMultiLabelDataset
+from deep_abyasa import RecordShardMultiLabelDataset
+
+LABELS = {'carbon': 0, 'hydrogen': 1, 'nitrogen': 2, 'oxygen': 3}
+
+
+def pack(tmp_path):
+    out_prefix = str(tmp_path / 'chem')
+    RecordShards.pack("./deep_abyasa/tests/data", "chem_test_temp.json", "images",
+                      "file", "elements", out_prefix, LABELS, records_per_shard=2)
+    return out_prefix
+
+
+def test_pack_writes_shards(tmp_path):
+    out_prefix = pack(tmp_path)
+    meta = RecordShards.read_meta(out_prefix)
+    assert(meta['num_records'] == 3)
+    assert(meta['labels'] == LABELS)
+    assert(os.path.isfile(out_prefix + '-00000.rec'))
+    assert(os.path.isfile(out_prefix + '-00001.idx'))
+
+
+def test_record_dataset_matches_json_dataset(tmp_path):
+    ds = RecordShardMultiLabelDataset(pack(tmp_path))
+    json_ds = JsonIndexMultiLabelDataset("./deep_abyasa/tests/data", "chem_test_temp.json",
+                                         "images", "file", "elements",
+                                         one_hot_encode_labels=True, labels=LABELS)
+    assert(len(ds) == 3)
+    for i in range(3):
+        x, y, n = ds[i]
+        jx, jy, jn = json_ds[i]
+        assert((x == jx).asnumpy().all())
+        assert(y.asnumpy().tolist() == jy.asnumpy().tolist())
+        assert(n == jn)
+
+
+def test_record_dataset_getitems(tmp_path):
+    ds = RecordShardMultiLabelDataset(pack(tmp_path))
+    x, y, n = ds.__getitems__([2, 0])
+    assert(x.shape == (2, 3, 300, 300))
+    assert(y.asnumpy().tolist() == [[1, 1, 1, 1], [1, 1, 0, 1]])
+    assert(n.asnumpy().tolist() == [10100, 10091])
+
+
+def test_member_handler_packs_extracted_images(tmp_path):
+    data = "./deep_abyasa/tests/data"
+    with tarfile.open(tmp_path / 'chem.tar.gz', 'w:gz') as tar:
+        tar.add(os.path.join(data, 'images'), arcname='chem/images')
+    os.makedirs(tmp_path / 'chem')
+    shutil.copy(os.path.join(data, 'chem_test_temp.json'), tmp_path / 'chem')
+    writer = RecordShards.writer(str(tmp_path / 'packed'), LABELS)
+    handler = RecordShards.member_handler(writer, str(tmp_path / 'chem'), 'chem_test_temp.json', 'images',
+                                          'file', 'elements', LABELS)
+    Download('chem', save_at=str(tmp_path), handler=handler)
+    writer.close()
+    assert(not list((tmp_path / 'chem').rglob('*.png')))
+    ds = RecordShardMultiLabelDataset(str(tmp_path / 'packed'))
+    json_ds = JsonIndexMultiLabelDataset(data, "chem_test_temp.json", "images", "file", "elements",
+                                         one_hot_encode_labels=True, labels=LABELS)
+    packed = {ds[i][2]: ds[i][1].asnumpy().tolist() for i in range(len(ds))}
+    assert(packed == {json_ds[i][2]: json_ds[i][1].asnumpy().tolist() for i in range(len(json_ds))})
+
+
+def test_member_handler_under_symlinked_root(tmp_path):
+    data = "./deep_abyasa/tests/data"
+    os.makedirs(tmp_path / 'real' / 'chem')
+    os.symlink(tmp_path / 'real', tmp_path / 'link')
+    with tarfile.open(tmp_path / 'real' / 'chem.tar.gz', 'w:gz') as tar:
+        tar.add(os.path.join(data, 'images'), arcname='chem/images')
+    shutil.copy(os.path.join(data, 'chem_test_temp.json'), tmp_path / 'real' / 'chem')
+    writer = RecordShards.writer(str(tmp_path / 'packed'), LABELS)
+    handler = RecordShards.member_handler(writer, str(tmp_path / 'link' / 'chem'), 'chem_test_temp.json',
+                                          'images', 'file', 'elements', LABELS)
+    Download('chem', save_at=str(tmp_path / 'link'), handler=handler)
+    writer.close()
+    assert(not list((tmp_path / 'real' / 'chem').rglob('*.png')))
+    assert(len(RecordShardMultiLabelDataset(str(tmp_path / 'packed'))) == 3)
+
+
+def test_record_ids_round_trip_exactly(tmp_path):
+    with open("./deep_abyasa/tests/data/images/10091.png", 'rb') as f:
+        image_bytes = f.read()
+    writer = RecordShards.writer(str(tmp_path / 'ids'), LABELS)
+    writer.write(2**24 + 1, [1, 0, 0, 1], image_bytes)
+    writer.write(float('nan'), [0, 1, 0, 0], image_bytes)
+    writer.close()
+    ds = RecordShardMultiLabelDataset(str(tmp_path / 'ids'))
+    assert(ds[0][2] == 2**24 + 1)
+    assert(ds[0][1].asnumpy().tolist() == [1, 0, 0, 1])
+    assert(math.isnan(ds[1][2]))
+    x, y, n = ds.__getitems__([0, 1])
+    assert(n.dtype == np.float64)
+    assert(n.asnumpy()[0] == 2**24 + 1)
+    assert(math.isnan(n.asnumpy()[1]))
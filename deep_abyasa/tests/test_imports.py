@@ -0,0 +1,38 @@
+import sys
+import json
+import subprocess
+import pytest
+import deep_abyasa
+
+
+def loaded_modules(code):
+    """Runs code in a fresh interpreter and returns the top level modules
+       it has loaded"""
+    out = subprocess.run([sys.executable, '-c', code + '\nimport sys, json\n'
+                          'print(json.dumps(sorted({m.split(".")[0] for m in sys.modules})))'],
+                         capture_output=True, text=True, check=True)
+    return set(json.loads(out.stdout.splitlines()[-1]))
+
+
+def test_import_is_lazy():
+    modules = loaded_modules('import deep_abyasa')
+    assert(not {'mxnet', 'gluoncv', 'pandas', 'tqdm'} & modules)
+
+
+def test_preprocessing_names_dont_load_mxnet():
+    modules = loaded_modules('from deep_abyasa import Download')
+    assert(not {'mxnet', 'gluoncv', 'pandas'} & modules)
+    modules = loaded_modules('from deep_abyasa import Encode_Labels, Utils')
+    assert('pandas' in modules)
+    assert(not {'mxnet', 'gluoncv'} & modules)
+
+
+@pytest.mark.parametrize('attr', deep_abyasa.__all__)
+def test_public_names_resolve(attr):
+    assert(getattr(deep_abyasa, attr).__name__ == attr)
+    assert(attr in dir(deep_abyasa))
+
+
+def test_unknown_name():
+    with pytest.raises(AttributeError):
+        deep_abyasa.NotAName